@@ -0,0 +1,457 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import core.reports
+import invoice_store
+import report_export
+import search
+import tax_engine
+from core import CustomerService, InvoiceService, ProductService
+from db import Database
+from master_data import ChangeLogMonitor, MasterDataCache
+
+logger = logging.getLogger(__name__)
+
+# Largest request body accepted; an invoice with hundreds of lines is a few KiB
+MAX_BODY_BYTES = 1024 * 1024
+
+# Latencies kept per route for the percentiles in /metrics
+METRICS_WINDOW = 10000
+
+# Report names in URLs -> core.reports report types
+REPORTS = {'gstr1': 'GSTR1', 'gstr2': 'GSTR2', 'gstr3b': 'GSTR3B'}
+
+# (method, path segments, handler); a '{...}' segment matches any one segment
+ROUTES = [
+    ('GET', ('health',), 'health'),
+    ('GET', ('metrics',), 'metrics'),
+    ('POST', ('invoices',), 'create_invoice'),
+    ('GET', ('invoices', '{number}'), 'get_invoice'),
+    ('GET', ('customers',), 'search_customers'),
+    ('GET', ('customers', '{id}'), 'get_customer'),
+    ('GET', ('products',), 'search_products'),
+    ('GET', ('products', '{id}'), 'get_product'),
+    ('POST', ('reports', '{report}'), 'start_report'),
+    ('GET', ('reports', '{id}'), 'get_report'),
+]
+
+
+class HttpError(Exception):
+    """Ends a request with this status and a JSON error message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def match_route(method, segments):
+    """(handler, route label, path parameters) for a request path
+
+    Raises HttpError 404 for an unknown path and 405 for a known path
+    requested with the wrong method.
+    """
+    allowed = []
+    for route_method, pattern, handler in ROUTES:
+        if len(pattern) != len(segments):
+            continue
+        params = []
+        for expected, segment in zip(pattern, segments):
+            if expected.startswith('{'):
+                params.append(segment)
+            elif expected != segment:
+                break
+        else:
+            if route_method == method:
+                return handler, f"{method} /{'/'.join(pattern)}", params
+            allowed.append(route_method)
+    if allowed:
+        raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"Use {' or '.join(allowed)}")
+    raise HttpError(HTTPStatus.NOT_FOUND, "No such resource")
+
+
+class LatencyMetrics:
+    """Request counts, status codes and latency percentiles per route
+
+    Only touched from the event loop, so it needs no lock. Percentiles are
+    over the last ``window`` requests of each route.
+    """
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.started = time.time()
+        self._routes = {}
+
+    def record(self, route, status, seconds):
+        stats = self._routes.get(route)
+        if stats is None:
+            stats = self._routes[route] = {'count': 0, 'statuses': {}, 'latencies': deque(maxlen=self.window)}
+        stats['count'] += 1
+        stats['statuses'][str(int(status))] = stats['statuses'].get(str(int(status)), 0) + 1
+        stats['latencies'].append(seconds * 1000)
+
+    def snapshot(self):
+        routes = {}
+        for route, stats in sorted(self._routes.items()):
+            latencies = sorted(stats['latencies'])
+            routes[route] = {'count': stats['count'], 'statuses': dict(stats['statuses'])}
+            for name, fraction in (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+                routes[route][name] = round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))], 3)
+            routes[route]['max_ms'] = round(latencies[-1], 3)
+        return {'uptime_s': round(time.time() - self.started, 1), 'routes': routes}
+
+
+class ApiServer:
+    """Local HTTP/JSON API for POS terminals and other programs
+
+    Requests are parsed on one asyncio event loop. Anything that touches the
+    database runs on a bounded pool of ``workers`` threads; once
+    ``max_pending`` requests are waiting for it, further ones get 503 rather
+    than queueing without bound. Invoices are priced on the pool and saved
+    through the Database writer thread, the single queue every write goes
+    through, so concurrent terminals share its group commits. Report exports
+    run on their own small pool so a long return never holds up billing.
+    """
+
+    def __init__(self, db, workers=4, max_pending=64, report_workers=1, pdf_dir="invoices",
+                 report_dir="reports"):
+        self.db = db
+        self.max_pending = max_pending
+        self.pending = 0
+        self.report_dir = report_dir
+        self.seller_gstin = db.get_setting('seller_gstin')
+        self.master_data = MasterDataCache(db)
+        self.master_changes = ChangeLogMonitor(db, self.master_data)
+        self.customers = CustomerService(db, self.master_data)
+        self.products = ProductService(db, self.master_data)
+        self.invoices = InvoiceService(db, tax_engine.state_code_from_gstin(self.seller_gstin),
+                                       master_data=self.master_data, pdf_dir=pdf_dir)
+        self.latency = LatencyMetrics()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self.report_executor = ThreadPoolExecutor(max_workers=report_workers, thread_name_prefix="api-report")
+        self.reports = {}
+        self._report_ids = itertools.count(1)
+        self._server = None
+        self._watcher = None
+        self._connections = set()
+        self._loop = None
+        self._thread = None
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Start listening and return the port (useful with port 0)"""
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        self._watcher = asyncio.ensure_future(self.watch_master_data())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, host="127.0.0.1", port=8765):
+        port = await self.start(host, port)
+        logger.info("API listening on http://%s:%s", host, port)
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        """Run the server on its own event loop thread and return its port"""
+        self._loop = asyncio.new_event_loop()
+        started = self._loop.run_until_complete(self.start(host, port))
+        self._thread = threading.Thread(target=self._loop.run_forever, name="api-loop", daemon=True)
+        self._thread.start()
+        return started
+
+    def close(self):
+        """Stop listening and wait for running requests and reports"""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+        self.executor.shutdown()
+        self.report_executor.shutdown()
+
+    async def _stop(self):
+        self._watcher.cancel()
+        self._server.close()
+        # Idle keep-alive connections would otherwise hold wait_closed up
+        for writer in list(self._connections):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def watch_master_data(self):
+        """Drop cached customers and products that another process changed (see ChangeLogMonitor)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.master_changes.interval_ms / 1000)
+            try:
+                await loop.run_in_executor(self.executor, self.master_changes.poll)
+            except Exception:
+                logger.exception("Polling the change log failed")
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it open between them"""
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                started = time.perf_counter()
+                route = "-"
+                keep_alive = False
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                    headers = await self.read_headers(reader)
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                    length = int(headers.get('content-length') or 0)
+                    if length > MAX_BODY_BYTES:
+                        keep_alive = False
+                        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                        f"Request body over {MAX_BODY_BYTES} bytes")
+                    body = await reader.readexactly(length) if length else b""
+                    url = urlsplit(target)
+                    handler, route, params = match_route(method, [unquote(segment) for segment in
+                                                                  url.path.strip('/').split('/') if segment])
+                    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                    status, payload, extra_headers = await getattr(self, handler)(
+                        *params, query=query, body=self.parse_body(body) if body else None)
+                except HttpError as e:
+                    status, payload, extra_headers = e.status, {'error': str(e)}, {}
+                except ValueError as e:
+                    # Bad input from the caller (a malformed request line included)
+                    status, payload, extra_headers = HTTPStatus.BAD_REQUEST, {'error': str(e)}, {}
+                except Exception as e:
+                    logger.exception("Request %s failed", route)
+                    status, payload, extra_headers = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}, {}
+                self.write_response(writer, status, payload, extra_headers, keep_alive)
+                await writer.drain()
+                self.latency.record(route, status, time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def read_headers(self, reader):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return headers
+            name, separator, value = line.decode('latin-1').partition(':')
+            if not separator:
+                raise ValueError("Malformed header line")
+            headers[name.strip().lower()] = value.strip()
+
+    def parse_body(self, body):
+        try:
+            return json.loads(body)
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Body is not valid JSON: {e}") from None
+
+    def write_response(self, writer, status, payload, headers, keep_alive):
+        status = HTTPStatus(status)
+        body = json.dumps(payload).encode('utf-8')
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}", "Content-Type: application/json",
+                 f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+
+    async def run(self, fn, *args):
+        """Run blocking ``fn`` on the worker pool, or 503 if too many are waiting"""
+        if self.pending >= self.max_pending:
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many requests in progress, retry shortly")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def health(self, query, body):
+        return HTTPStatus.OK, {'status': 'ok'}, {}
+
+    async def metrics(self, query, body):
+        snapshot = self.latency.snapshot()
+        snapshot.update({'pending': self.pending, 'max_pending': self.max_pending,
+                         'reports_running': sum(1 for job in self.reports.values() if job['status'] == 'Running')})
+        return HTTPStatus.OK, snapshot, {}
+
+    async def create_invoice(self, query, body):
+        """Price and save an invoice
+
+        Body: {"customer": name or id, "items": [{"product": name or id,
+        "quantity": 2}, ...], "date": "YYYY-MM-DD" (optional), "pdf": true
+        to also render its PDF}.
+        """
+        if not isinstance(body, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+        customer, invoice = await self.run(self.build_invoice, body)
+        # The writer thread batches this with other terminals' invoices
+        await asyncio.wrap_future(self.db.write(invoice_store.insert_invoices, [invoice]))
+        self.invoices.saved(invoice)
+        if body.get('pdf'):
+            invoice['pdf_path'] = await self.run(self.invoices.render_pdf, invoice, customer)
+        result = {key: invoice[key] for key in ('invoice_number', 'invoice_date', 'customer_id', 'place_of_supply',
+                                                'supply_type', 'totals')}
+        result['items'] = [dict(zip(('product_id', 'quantity', 'price', 'gst_rate', 'gst_amount', 'total_amount'),
+                                    item)) for item in invoice['items']]
+        if 'pdf_path' in invoice:
+            result['pdf_path'] = invoice['pdf_path']
+        return HTTPStatus.CREATED, result, {'Location': f"/invoices/{invoice['invoice_number'].replace('/', '%2F')}"}
+
+    def build_invoice(self, body):
+        """(customer, priced invoice) for a create request; runs on the worker pool"""
+        customer = self.customers.find(body.get('customer', ''))
+        if customer is None:
+            raise ValueError(f"Unknown customer {body.get('customer')!r}")
+        items = body.get('items')
+        if not isinstance(items, list):
+            raise ValueError("'items' must be a list")
+        lines = []
+        for item in items:
+            product = self.products.find(item.get('product', '')) if isinstance(item, dict) else None
+            if product is None:
+                raise ValueError(f"Unknown product in {item!r}")
+            quantity = item.get('quantity', 1)
+            if not isinstance(quantity, (int, str)):
+                raise ValueError(f"Quantity of {product['name']} must be a whole number")
+            lines.append(self.invoices.line(product, quantity))
+        invoice_date = body.get('date')
+        if invoice_date is not None and not isinstance(invoice_date, str):
+            raise ValueError("'date' must be a string, YYYY-MM-DD")
+        invoice_date = date.fromisoformat(invoice_date) if invoice_date else None
+        return customer, self.invoices.build(customer, lines, invoice_date)
+
+    async def get_invoice(self, number, query, body):
+        invoice = await self.run(self.invoices.find, number)
+        if invoice is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No invoice {number}")
+        return HTTPStatus.OK, invoice, {}
+
+    async def search_customers(self, query, body):
+        return await self.search('customers', query)
+
+    async def search_products(self, query, body):
+        return await self.search('products', query)
+
+    async def search(self, source, query):
+        """Picker matches for ?q=text (see search.search), at most ?limit= of them"""
+        try:
+            limit = int(query.get('limit', search.TOP_K))
+        except ValueError:
+            raise ValueError("'limit' must be a whole number") from None
+        # A negative LIMIT is no limit at all in SQLite
+        limit = max(1, min(limit, 100))
+
+        def matches():
+            with self.db.reader() as conn:
+                return search.search(conn, source, query.get('q', ''), limit)
+
+        return HTTPStatus.OK, [{'id': row_id, 'name': name} for row_id, name in await self.run(matches)], {}
+
+    async def get_customer(self, customer_id, query, body):
+        return await self.get_row(self.customers, 'customer', customer_id)
+
+    async def get_product(self, product_id, query, body):
+        return await self.get_row(self.products, 'product', product_id)
+
+    async def get_row(self, service, kind, row_id):
+        if not row_id.isdigit():
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No {kind} {row_id}")
+        row = await self.run(service.get, int(row_id))
+        if row is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No {kind} {row_id}")
+        return HTTPStatus.OK, row, {}
+
+    async def start_report(self, report, query, body):
+        """Queue a report export; poll GET /reports/{id} for the result
+
+        Body: {"period": "2024-04" | "FY2024-25" | "from:to", "formats":
+        ["csv", ...]} (GSTR-1/2/3B only; all formats by default).
+        """
+        if report not in REPORTS and report != 'gstr1-portal':
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No report {report}; use {', '.join(REPORTS)} or gstr1-portal")
+        body = body or {}
+        from_date, to_date = core.reports.parse_period(str(body.get('period', '')))
+        formats = body.get('formats') or list(report_export.WRITERS)
+        if not isinstance(formats, list) or not all(isinstance(name, str) for name in formats):
+            raise ValueError(f"'formats' must be a list of format names: {', '.join(report_export.WRITERS)}")
+        unknown = set(formats) - set(report_export.WRITERS)
+        if unknown:
+            raise ValueError(f"Unknown formats {sorted(unknown)}; use {', '.join(report_export.WRITERS)}")
+
+        job = {'id': next(self._report_ids), 'report': report, 'from': str(from_date), 'to': str(to_date),
+               'status': 'Queued'}
+        self.reports[job['id']] = job
+        self.report_executor.submit(self.run_report, job, formats)
+        return HTTPStatus.ACCEPTED, job, {'Location': f"/reports/{job['id']}"}
+
+    def run_report(self, job, formats):
+        """Export a queued report on the report pool and record the outcome in ``job``"""
+        job['status'] = 'Running'
+        from_date, to_date = date.fromisoformat(job['from']), date.fromisoformat(job['to'])
+        started = time.perf_counter()
+        try:
+            if job['report'] == 'gstr1-portal':
+                path, counts = core.reports.export_gstr1_portal(self.db, self.seller_gstin, from_date, to_date,
+                                                                self.report_dir, tag=f"job{job['id']}")
+                job.update({'paths': [path], 'counts': counts})
+            else:
+                paths, rows, timings = core.reports.export_report(
+                    self.db, REPORTS[job['report']], from_date, to_date, self.invoices.seller_state_code, formats,
+                    self.report_dir, tag=f"job{job['id']}")
+                job.update({'paths': paths, 'rows': rows, 'timings': timings})
+        except Exception as e:
+            logger.exception("Report %s failed", job['id'])
+            job.update({'status': 'Failed', 'error': str(e)})
+        else:
+            job['status'] = 'Done'
+        job['seconds'] = round(time.perf_counter() - started, 3)
+
+    async def get_report(self, report_id, query, body):
+        job = self.reports.get(int(report_id)) if report_id.isdigit() else None
+        if job is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No report job {report_id}")
+        return HTTPStatus.OK, dict(job), {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the billing API on this machine")
+    parser.add_argument("--db", default=os.path.join('data', 'gst_billing.db'), help="SQLite database path")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Address to listen on (default: this machine only; there is no authentication)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="Threads for database work")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="Requests allowed to wait for a worker before answering 503")
+    parser.add_argument("--pdf-dir", default="invoices", help="Directory for invoice PDFs")
+    parser.add_argument("--report-dir", default="reports", help="Directory for report files")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    db = Database(args.db)
+    server = ApiServer(db, args.workers, args.max_pending, pdf_dir=args.pdf_dir, report_dir=args.report_dir)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote, urlencode, urlsplit
+
+
+class ApiError(Exception):
+    """An error response from the API"""
+
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class ApiClient:
+    """Client for api.py, as a POS terminal would use it
+
+    Keeps one HTTP/1.1 connection open between requests; a client is not
+    meant to be shared between threads.
+    """
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout=30):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method, path, payload=None):
+        """Decoded JSON body of a successful response; raises ApiError otherwise"""
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body, headers)
+                response = self._conn.getresponse()
+                data = json.loads(response.read() or b"null")
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed the kept-alive connection; reconnect once
+                self.close()
+                if attempt:
+                    raise
+        if response.will_close:
+            self.close()
+        if response.status >= 400:
+            raise ApiError(response.status, data.get('error') if isinstance(data, dict) else data)
+        return data
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def metrics(self):
+        return self.request("GET", "/metrics")
+
+    def create_invoice(self, customer, items, invoice_date=None, pdf=False):
+        """Save an invoice; ``items`` are (product name or id, quantity) pairs"""
+        payload = {'customer': customer, 'items': [{'product': product, 'quantity': quantity}
+                                                   for product, quantity in items], 'pdf': pdf}
+        if invoice_date is not None:
+            payload['date'] = str(invoice_date)
+        return self.request("POST", "/invoices", payload)
+
+    def invoice(self, number):
+        return self.request("GET", "/invoices/" + quote(number, safe=""))
+
+    def customers(self, text="", limit=10):
+        return self.request("GET", "/customers?" + urlencode({'q': text, 'limit': limit}))
+
+    def customer(self, customer_id):
+        return self.request("GET", f"/customers/{customer_id}")
+
+    def products(self, text="", limit=10):
+        return self.request("GET", "/products?" + urlencode({'q': text, 'limit': limit}))
+
+    def product(self, product_id):
+        return self.request("GET", f"/products/{product_id}")
+
+    def start_report(self, report, period, formats=None):
+        """Queue a report export (gstr1, gstr2, gstr3b or gstr1-portal) and return its job"""
+        return self.request("POST", f"/reports/{report}", {'period': period, 'formats': formats})
+
+    def report(self, job_id):
+        return self.request("GET", f"/reports/{job_id}")
+
+    def wait_for_report(self, job_id, timeout=600, poll_interval=0.5):
+        """Poll a report job until it is done or failed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.report(job_id)
+            if job['status'] in ('Done', 'Failed') or time.monotonic() > deadline:
+                return job
+            time.sleep(poll_interval)
+
+
+def percentiles(latencies):
+    ordered = sorted(latencies)
+    return {name: round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+            for name, fraction in (('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99))}
+
+
+def retry_busy(request, *args, attempts=50, **kwargs):
+    """``request(*args, **kwargs)``, retried after a short pause while the server answers 503"""
+    for attempt in range(attempts):
+        try:
+            return request(*args, **kwargs)
+        except ApiError as e:
+            if e.status != 503 or attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+def terminal(url, seed, invoices, lines, think_ms, results):
+    """Ring up ``invoices`` sales like a POS terminal and check each one reads back"""
+    rng = random.Random(seed)
+    client = ApiClient(url)
+    outcome = {'latencies': [], 'rejected': 0, 'errors': []}
+    try:
+        customers = [row['name'] for row in retry_busy(client.customers, limit=100)]
+        products = [row['name'] for row in retry_busy(client.products, limit=100)]
+        for _ in range(invoices):
+            items = [(rng.choice(products), rng.randint(1, 5)) for _ in range(rng.randint(1, lines))]
+            started = time.perf_counter()
+            try:
+                invoice = client.create_invoice(rng.choice(customers), items)
+            except ApiError as e:
+                if e.status == 503:
+                    outcome['rejected'] += 1
+                else:
+                    outcome['errors'].append(str(e))
+                continue
+            outcome['latencies'].append((time.perf_counter() - started) * 1000)
+            try:
+                saved = client.invoice(invoice['invoice_number'])
+            except ApiError as e:
+                if e.status != 503:
+                    raise
+                outcome['rejected'] += 1
+            else:
+                if abs(saved['total_amount'] - invoice['totals']['total']) > 0.005:
+                    outcome['errors'].append(f"{invoice['invoice_number']} reads back a different total")
+            if think_ms:
+                time.sleep(rng.expovariate(1000 / think_ms))
+    except (ApiError, OSError) as e:
+        outcome['errors'].append(str(e))
+    finally:
+        client.close()
+    results.append(outcome)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stand-in POS terminals: create invoices through the API and report latencies")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Base URL of a running API server (python api.py)")
+    target.add_argument("--db", help="Start a server on this database in-process, on a free localhost port")
+    parser.add_argument("--terminals", type=int, default=4, help="Concurrent terminals")
+    parser.add_argument("--invoices", type=int, default=50, help="Invoices per terminal")
+    parser.add_argument("--lines", type=int, default=5, help="Most lines per invoice")
+    parser.add_argument("--think-ms", type=float, default=0, help="Mean pause between a terminal's invoices")
+    parser.add_argument("--workers", type=int, default=4, help="Worker threads of the in-process server")
+    parser.add_argument("--report", choices=["gstr1", "gstr2", "gstr3b", "gstr1-portal"],
+                        help="Also trigger this report while the terminals run")
+    parser.add_argument("--period", default="FY2024-25", help="Period of the report")
+    parser.add_argument("--report-dir", default="reports", help="Report directory of the in-process server")
+    args = parser.parse_args(argv)
+
+    server = db = None
+    url = args.url
+    if args.db:
+        # Imported here so a client of a remote server needs only the standard library
+        from api import ApiServer
+        from db import Database
+
+        db = Database(args.db)
+        server = ApiServer(db, workers=args.workers, report_dir=args.report_dir)
+        url = f"http://127.0.0.1:{server.start_in_thread()}"
+    try:
+        client = ApiClient(url)
+        client.health()
+        job = client.start_report(args.report, args.period) if args.report else None
+
+        results = []
+        threads = [threading.Thread(target=terminal, args=(url, seed, args.invoices, args.lines, args.think_ms,
+                                                            results))
+                   for seed in range(1, args.terminals + 1)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        latencies = [value for outcome in results for value in outcome['latencies']]
+        errors = [error for outcome in results for error in outcome['errors']]
+        print(f"{len(latencies)} invoices from {args.terminals} terminals in {elapsed:.1f} s "
+              f"({len(latencies) / elapsed:.0f}/s), {sum(outcome['rejected'] for outcome in results)} rejected "
+              f"as busy, {len(errors)} errors")
+        if latencies:
+            print("Create latency: " + ", ".join(f"{name} {value}" for name, value in percentiles(latencies).items()))
+        for error in errors[:5]:
+            print(f"  {error}")
+        if job is not None:
+            job = client.wait_for_report(job['id'])
+            print(f"Report {job['report']} {job['from']} to {job['to']}: {job['status']} in {job.get('seconds')} s "
+                  + (job.get('error') or ", ".join(job.get('paths', []))))
+            if job['status'] != 'Done':
+                errors.append(job.get('error'))
+
+        print("Server latency by route:")
+        for route, stats in client.metrics()['routes'].items():
+            print(f"  {route:<24} {stats['count']:>6}  p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  "
+                  f"p99 {stats['p99_ms']:>8} ms  {stats['statuses']}")
+        client.close()
+    finally:
+        if server is not None:
+            server.close()
+            db.close()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import migrations
+
+BACKUP_DIR = "backups"
+SUFFIX = ".db.gz"
+
+# Pages copied per backup step and the pause after each one. A step holds
+# SQLite's read lock only while it copies; the pause gives the CPU (and, out
+# of WAL mode, the lock) back to billing. The same amount of data is
+# compressed between pauses.
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.01
+
+# Snapshots of each database kept after a backup; older ones are deleted
+KEEP = 14
+
+# Tables whose row counts a verification reports
+COUNTED_TABLES = ('customers', 'products', 'invoices', 'invoice_items', 'purchases', 'stock_movements')
+
+
+def snapshot_prefix(db_path):
+    return os.path.splitext(os.path.basename(db_path))[0] + "-"
+
+
+def snapshots(db_path, backup_dir=BACKUP_DIR):
+    """Snapshot paths of ``db_path`` in ``backup_dir``, oldest first"""
+    if not os.path.isdir(backup_dir):
+        return []
+    prefix = snapshot_prefix(db_path)
+    # The timestamp in the name sorts in date order
+    return [os.path.join(backup_dir, name) for name in sorted(os.listdir(backup_dir))
+            if name.startswith(prefix) and name.endswith(SUFFIX)]
+
+
+def rotate(db_path, backup_dir=BACKUP_DIR, keep=KEEP):
+    """Delete all but the ``keep`` newest snapshots; returns the deleted paths"""
+    old = snapshots(db_path, backup_dir)[:-keep] if keep > 0 else []
+    for path in old:
+        os.remove(path)
+    return old
+
+
+def copy_database(source, target, pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+    """Copy the open database ``source`` to the file ``target`` a few pages at a time
+
+    In WAL mode the copy runs in one read transaction, so it is a
+    consistent snapshot and never restarts, while writers carry on
+    committing. Otherwise each step takes the read lock afresh, and a commit
+    from another connection between steps restarts the copy. Returns the
+    pages copied, the number of steps and the longest step in ms.
+    """
+    wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == 'wal'
+    stats = {'pages': 0, 'steps': 0, 'longest_step_ms': 0.0}
+    step_started = time.perf_counter()
+
+    def progress(status, remaining, total):
+        nonlocal step_started
+        stats['steps'] += 1
+        stats['pages'] = total
+        stats['longest_step_ms'] = max(stats['longest_step_ms'], (time.perf_counter() - step_started) * 1000)
+        if remaining:
+            time.sleep(pause)
+        step_started = time.perf_counter()
+
+    destination = sqlite3.connect(target)
+    try:
+        if wal:
+            source.execute("BEGIN")
+            # A deferred transaction starts reading at its first statement
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        try:
+            source.backup(destination, pages=pages, progress=progress)
+        finally:
+            if wal:
+                source.execute("COMMIT")
+        # The copy keeps the WAL flag of its source; a snapshot in rollback
+        # mode can be checked read-only without -wal and -shm files appearing
+        destination.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        destination.close()
+    stats['longest_step_ms'] = round(stats['longest_step_ms'], 3)
+    return stats
+
+
+def compress(path, target, chunk_size, pause=STEP_PAUSE, compresslevel=6):
+    """Gzip ``path`` to ``target``, pausing after each ``chunk_size`` bytes"""
+    with open(path, 'rb') as f, gzip.open(target, 'wb', compresslevel=compresslevel) as out:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            out.write(chunk)
+            time.sleep(pause)
+
+
+def create_snapshot(db_path, backup_dir=BACKUP_DIR, pages=PAGES_PER_STEP, pause=STEP_PAUSE, keep=KEEP,
+                    compresslevel=6):
+    """Back up the live database at ``db_path`` to a gzipped snapshot and rotate old ones
+
+    Safe while the app, the API or bulk runs are writing. Returns the
+    snapshot path with sizes and timings.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    started = time.perf_counter()
+    # Microseconds keep snapshots taken in the same second apart
+    name = snapshot_prefix(db_path) + datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    path = os.path.join(backup_dir, name + SUFFIX)
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    copy = os.path.join(backup_dir, name + ".db.partial")
+    compressed = path + ".partial"
+    try:
+        source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+        try:
+            page_size = source.execute("PRAGMA page_size").fetchone()[0]
+            stats = copy_database(source, copy, pages, pause)
+        finally:
+            source.close()
+        stats['copy_seconds'] = round(time.perf_counter() - started, 3)
+
+        # pages = -1 copies everything in one step; compress in 4 MiB chunks then
+        compress(copy, compressed, (pages if pages > 0 else 1024) * page_size, pause, compresslevel)
+        stats['bytes'] = os.path.getsize(copy)
+        # Only a complete snapshot gets the name rotation and restores look for
+        os.replace(compressed, path)
+    finally:
+        for partial in (copy, compressed):
+            if os.path.exists(partial):
+                os.remove(partial)
+    stats.update(path=path, compressed_bytes=os.path.getsize(path), seconds=round(time.perf_counter() - started, 3),
+                 removed=rotate(db_path, backup_dir, keep))
+    return stats
+
+
+def decompress(snapshot, target):
+    with gzip.open(snapshot, 'rb') as f, open(target, 'wb') as out:
+        shutil.copyfileobj(f, out, 1 << 20)
+
+
+def unreadable(error):
+    return {'ok': False, 'problems': [str(error)], 'schema_version': None, 'counts': {}, 'last_invoice_date': None}
+
+
+def check_database(path):
+    """Integrity, foreign key and schema checks of a database file, with row counts"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        integrity = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        foreign_keys = conn.execute("PRAGMA foreign_key_check").fetchall()
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        version = (conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+                   if 'schema_version' in tables else 0)
+        counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                  for table in COUNTED_TABLES if table in tables}
+        last_invoice = (conn.execute("SELECT MAX(invoice_date) FROM invoices").fetchone()[0]
+                        if 'invoices' in tables else None)
+    except sqlite3.DatabaseError as e:
+        return unreadable(e)
+    finally:
+        conn.close()
+    latest = migrations.MIGRATIONS[-1][0]
+    problems = []
+    if integrity != ['ok']:
+        problems.append("integrity check: " + "; ".join(integrity[:5]))
+    if foreign_keys:
+        problems.append(f"{len(foreign_keys)} rows with a missing foreign key")
+    if not 0 < version <= latest:
+        problems.append(f"schema version {version}, this version of the app reads 1 to {latest}")
+    return {'ok': not problems, 'problems': problems, 'schema_version': version, 'counts': counts,
+            'last_invoice_date': last_invoice}
+
+
+def verify(snapshot):
+    """Restore ``snapshot`` to a scratch file and check it (see check_database)"""
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "restore.db")
+        try:
+            decompress(snapshot, path)
+        except (OSError, EOFError) as e:
+            # Not a gzip file, or a truncated one
+            report = unreadable(e)
+        else:
+            report = check_database(path)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def restore(snapshot, target, overwrite=False):
+    """Restore ``snapshot`` to ``target`` after checking it
+
+    ``target`` must not be open in the app. An existing file is replaced
+    only with ``overwrite``, and never by a snapshot that fails its check.
+    """
+    if os.path.exists(target) and not overwrite:
+        raise FileExistsError(f"{target} already exists")
+    partial = target + ".partial"
+    try:
+        decompress(snapshot, partial)
+        report = check_database(partial)
+        if not report['ok']:
+            raise ValueError(f"{snapshot} failed its check: " + "; ".join(report['problems']))
+        for suffix in ("-wal", "-shm"):
+            # A log left by the database being replaced must not be replayed
+            # into the restored one
+            if os.path.exists(target + suffix):
+                os.remove(target + suffix)
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return report
+
+
+def print_check(report):
+    if report['schema_version'] is None:
+        print("FAILED: not a readable database")
+    else:
+        print(f"{'OK' if report['ok'] else 'FAILED'}: schema version {report['schema_version']}, "
+              f"last invoice {report['last_invoice_date']}, "
+              + ", ".join(f"{count} {table}" for table, count in report['counts'].items()))
+    for problem in report['problems']:
+        print(f"  {problem}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Online backups of the database, and restores from them")
+    parser.add_argument("--db", default=os.path.join('data', 'gst_billing.db'), help="SQLite database path")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="Directory of the snapshots")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create", help="Take a snapshot while the app keeps running")
+    create.add_argument("--pages", type=int, default=PAGES_PER_STEP, help="Pages copied per step")
+    create.add_argument("--pause-ms", type=float, default=STEP_PAUSE * 1000, help="Pause after each step")
+    create.add_argument("--keep", type=int, default=KEEP, help="Snapshots to keep (0 keeps all)")
+    create.add_argument("--level", type=int, default=6, choices=range(1, 10), help="gzip compression level")
+    commands.add_parser("list", help="List the snapshots of --db")
+    check = commands.add_parser("verify", help="Restore a snapshot to a scratch file and check it")
+    check.add_argument("snapshot", nargs="?", help="Snapshot file (default: the newest)")
+    restore_parser = commands.add_parser("restore", help="Restore a snapshot after checking it")
+    restore_parser.add_argument("snapshot", help="Snapshot file")
+    restore_parser.add_argument("--to", required=True, help="Database file to write; close the app first")
+    restore_parser.add_argument("--overwrite", action="store_true", help="Replace an existing file")
+    args = parser.parse_args(argv)
+
+    if args.command == 'create':
+        stats = create_snapshot(args.db, args.dir, args.pages, args.pause_ms / 1000, args.keep, args.level)
+        print(f"Snapshot {stats['path']}: {stats['pages']} pages in {stats['steps']} steps, "
+              f"{stats['bytes'] / 1048576:.1f} MiB to {stats['compressed_bytes'] / 1048576:.1f} MiB")
+        print(f"Took {stats['seconds']:.1f} s ({stats['copy_seconds']:.1f} s copying), "
+              f"longest step {stats['longest_step_ms']:.1f} ms")
+        for path in stats['removed']:
+            print(f"Removed {path}")
+        return 0
+    if args.command == 'list':
+        for path in snapshots(args.db, args.dir):
+            print(f"{path}  {os.path.getsize(path) / 1048576:.1f} MiB")
+        return 0
+    if args.command == 'verify':
+        snapshot = args.snapshot or (snapshots(args.db, args.dir) or [None])[-1]
+        if snapshot is None:
+            print(f"No snapshots of {args.db} in {args.dir}")
+            return 1
+        report = verify(snapshot)
+        print(f"{snapshot} restored and checked in {report['seconds']:.1f} s")
+        print_check(report)
+        return 0 if report['ok'] else 1
+    try:
+        report = restore(args.snapshot, args.to, args.overwrite)
+    except (ValueError, OSError, EOFError, sqlite3.Error) as e:
+        print(f"backup: {e}", file=sys.stderr)
+        return 1
+    print(f"Restored {args.snapshot} to {args.to}")
+    print_check(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
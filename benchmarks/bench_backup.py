@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+from benchmarks import synthetic
+from benchmarks.load_test import billing_client, summarize
+from db import Database
+
+
+def backup_job(db_path, backup_dir, pages, pause, duration, start):
+    """Take snapshots back to back for ``duration`` seconds"""
+    snapshots = []
+    start.wait()
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        snapshots.append(backup.create_snapshot(db_path, backup_dir, pages, pause, keep=1))
+    return snapshots
+
+
+def run_phase(db, clients, duration, think_ms, backup_args=None):
+    """Counter commit latencies over ``duration`` seconds, with snapshots taken meanwhile if ``backup_args``"""
+    start = threading.Barrier(clients + 1 + (backup_args is not None))
+    collected = queue.Queue()
+    workers = [threading.Thread(target=lambda seed: collected.put(billing_client(db, seed, duration, think_ms, start)),
+                                args=(seed,)) for seed in range(1, clients + 1)]
+    snapshots = []
+    if backup_args is not None:
+        workers.append(threading.Thread(
+            target=lambda: snapshots.extend(backup_job(db.path, *backup_args, duration, start))))
+    for worker in workers:
+        worker.start()
+    start.wait()
+    for worker in workers:
+        worker.join()
+    outcomes = [collected.get() for _ in range(clients)]
+    results = {'commits': summarize(outcomes, max(outcome['seconds'] for outcome in outcomes))}
+    if snapshots:
+        results['backups'] = {
+            'count': len(snapshots),
+            'seconds': round(max(snapshot['seconds'] for snapshot in snapshots), 3),
+            'copy_seconds': round(max(snapshot['copy_seconds'] for snapshot in snapshots), 3),
+            'steps': snapshots[-1]['steps'],
+            'longest_step_ms': max(snapshot['longest_step_ms'] for snapshot in snapshots),
+            'mib': round(snapshots[-1]['bytes'] / 1048576, 1),
+            'compressed_mib': round(snapshots[-1]['compressed_bytes'] / 1048576, 1),
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot duration and its effect on counter commit latency")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--invoices", type=int, default=50000)
+    parser.add_argument("--clients", type=int, default=4, help="Billing counters sharing the database")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per phase")
+    parser.add_argument("--think-ms", type=float, default=20, help="Mean pause between a counter's invoices")
+    parser.add_argument("--pages", type=int, default=backup.PAGES_PER_STEP, help="Pages per throttled step")
+    parser.add_argument("--pause-ms", type=float, default=backup.STEP_PAUSE * 1000,
+                        help="Pause after each throttled step")
+    parser.add_argument("--out", help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "backup.db")
+        started = time.perf_counter()
+        counts = synthetic.generate(path, args.customers, args.products, args.invoices)
+        print(f"Generated {counts} in {time.perf_counter() - started:.1f} s")
+        backup_dir = os.path.join(tmp, "backups")
+        phases = (('no backup', None),
+                  ('throttled', (backup_dir, args.pages, args.pause_ms / 1000)),
+                  # One step copies the whole file without pausing
+                  ('one step', (backup_dir, -1, 0)))
+        db = Database(path)
+        try:
+            results = {name: run_phase(db, args.clients, args.duration, args.think_ms, backup_args)
+                       for name, backup_args in phases}
+        finally:
+            db.close()
+
+    print(f"{args.clients} counters, {args.duration:.0f} s per phase, {args.pages} pages per step, "
+          f"{args.pause_ms:g} ms pause")
+    print(f"{'':>10} {'commits':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  backups")
+    for name, result in results.items():
+        commits = result['commits']
+        line = f"{name:>10} {commits['count']:>8} " + " ".join(
+            f"{commits.get(key, '-'):>8}" for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+        if 'backups' in result:
+            backups = result['backups']
+            line += (f"  {backups['count']}, up to {backups['seconds']} s ({backups['copy_seconds']} s copying, "
+                     f"longest step {backups['longest_step_ms']} ms), "
+                     f"{backups['mib']} MiB to {backups['compressed_mib']} MiB")
+        print(line)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'dataset': counts, 'options': vars(args), 'results': results}, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
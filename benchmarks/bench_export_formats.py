@@ -0,0 +1,53 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import report_export
+from benchmarks.bench_export_memory import COLUMNS, PERIOD, seed
+from core.reports import GSTR1_QUERY
+
+
+def openpyxl_write_only(conn, path):
+    """The previous XLSX writer: an openpyxl write-only workbook"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title="Report")
+    sheet.append(COLUMNS)
+    for page in report_export.iter_pages(conn.execute(GSTR1_QUERY, PERIOD)):
+        for row in page:
+            sheet.append(row)
+    workbook.save(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-format export timings, one after another vs concurrently")
+    parser.add_argument("--rows", type=int, nargs="+", default=[200000, 1000000], help="Invoice line counts")
+    parser.add_argument("--openpyxl", action="store_true", help="Also time the openpyxl write-only workbook")
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>10} {'mode':>12} {'wall s':>8} {'csv s':>8} {'jsonl s':>8} {'xlsx s':>8}")
+    for lines in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = seed(os.path.join(tmp, "bench.db"), lines)
+            for mode, parallel in (("sequential", False), ("concurrent", True)):
+                started = time.perf_counter()
+                _, rows, timings = report_export.export_query(
+                    conn, GSTR1_QUERY, PERIOD, COLUMNS, os.path.join(tmp, mode), parallel=parallel)
+                elapsed = time.perf_counter() - started
+                print(f"{rows:>10} {mode:>12} {elapsed:>8.2f} {timings['csv']:>8.2f} "
+                      f"{timings['jsonl']:>8.2f} {timings['xlsx']:>8.2f}")
+            if args.openpyxl:
+                started = time.perf_counter()
+                openpyxl_write_only(conn, os.path.join(tmp, "openpyxl.xlsx"))
+                elapsed = time.perf_counter() - started
+                print(f"{lines:>10} {'openpyxl':>12} {elapsed:>8.2f} {'':>8} {'':>8} {elapsed:>8.2f}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
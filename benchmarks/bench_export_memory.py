@@ -0,0 +1,101 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+import report_export
+from core.reports import GSTR1_QUERY
+
+COLUMNS = [
+    'Invoice Number', 'Date', 'GSTIN', 'Customer Name',
+    'HSN Code', 'Quantity', 'Price', 'GST Rate',
+    'GST Amount', 'Total Amount'
+]
+PERIOD = ('2024-04-01', '2025-03-31')
+
+
+def seed(path, lines, lines_per_invoice=5):
+    """Create a database with ``lines`` invoice lines spread over a year"""
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    rng = random.Random(42)
+    conn.executemany("INSERT INTO customers (id, name, gstin) VALUES (?, ?, ?)",
+                     [(i, f"Customer {i}", f"29ABCDE{i:04d}F1Z5") for i in range(1, 1001)])
+    conn.executemany("INSERT INTO products (id, name, hsn_code, gst_rate, price) VALUES (?, ?, ?, ?, ?)",
+                     [(i, f"Product {i}", f"{8400 + i % 100}", rng.choice([0, 5, 12, 18, 28]), rng.uniform(10, 5000))
+                      for i in range(1, 2001)])
+    invoices = lines // lines_per_invoice
+    conn.executemany(
+        "INSERT INTO invoices (id, invoice_number, customer_id, invoice_date, status) VALUES (?, ?, ?, ?, 'PAID')",
+        ((i, f"INV-{i:08d}", rng.randint(1, 1000), f"2024-{4 + i % 9:02d}-{1 + i % 28:02d}")
+         for i in range(1, invoices + 1)))
+    conn.executemany(
+        "INSERT INTO invoice_items (invoice_id, product_id, quantity, price, gst_rate, gst_amount, total_amount) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((1 + n // lines_per_invoice, rng.randint(1, 2000), rng.randint(1, 10), 100.0, 18.0, 18.0, 118.0)
+         for n in range(invoices * lines_per_invoice)))
+    conn.commit()
+    return conn
+
+
+def legacy_export(conn, base_path):
+    """The original path: fetchall, build a DataFrame, then write each format"""
+    import pandas as pd
+
+    df = pd.DataFrame(conn.execute(GSTR1_QUERY, PERIOD).fetchall(), columns=COLUMNS)
+    df.to_json(f"{base_path}.json", orient='records', indent=2)
+    df.to_excel(f"{base_path}.xlsx", index=False)
+    df.to_csv(f"{base_path}.csv", index=False)
+    return len(df)
+
+
+def streaming_export(conn, base_path):
+    """Page through the cursor into the streaming writers"""
+    return report_export.export_query(conn, GSTR1_QUERY, PERIOD, COLUMNS, base_path)[1]
+
+
+def measure(fn, conn, base_path):
+    """Wall time of one export and its peak traced Python/NumPy allocations
+
+    tracemalloc slows allocation-heavy code down several times over, so the
+    export is timed on a separate, untraced run.
+    """
+    started = time.perf_counter()
+    fn(conn, base_path)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    rows = fn(conn, base_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, peak / (1024 * 1024), elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak memory of GSTR-1 export: legacy vs streaming")
+    parser.add_argument("--rows", type=int, nargs="+", default=[20000, 80000, 320000])
+    parser.add_argument("--skip-legacy", action="store_true", help="Only measure the streaming path")
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>10} {'method':>10} {'peak MB':>10} {'seconds':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for lines in args.rows:
+            conn = seed(os.path.join(tmp, f"bench_{lines}.db"), lines)
+            methods = [("streaming", streaming_export)]
+            if not args.skip_legacy:
+                methods.insert(0, ("legacy", legacy_export))
+            for name, fn in methods:
+                rows, peak, elapsed = measure(fn, conn, os.path.join(tmp, f"{name}_{lines}"))
+                print(f"{rows:>10} {name:>10} {peak:>10.1f} {elapsed:>10.2f}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gstr1
+import tax_engine
+from benchmarks.bench_export_memory import COLUMNS, PERIOD, seed
+from core.reports import GSTR1_QUERY
+
+SELLER_GSTIN = "29AAAAA0000A1Z5"
+
+
+def prepare(conn, unregistered_share=0.3):
+    """Give the seeded data a realistic mix of buyers and invoice totals
+
+    Some customers lose their GSTIN (B2C) and some are moved out of state, so
+    every GSTR-1 section has rows to aggregate.
+    """
+    every = max(1, round(1 / unregistered_share))
+    conn.execute("UPDATE customers SET gstin = NULL, state_code = printf('%02d', 1 + id % 36) "
+                 "WHERE id % ? = 0", (every,))
+    conn.execute("UPDATE customers SET gstin = '27' || substr(gstin, 3) WHERE gstin IS NOT NULL AND id % 7 = 0")
+    conn.execute("""
+        UPDATE invoices SET total_amount = (
+            SELECT SUM(total_amount) * (CASE WHEN invoices.id % 50 = 0 THEN 500 ELSE 1 END)
+            FROM invoice_items WHERE invoice_id = invoices.id)
+    """)
+    conn.commit()
+
+
+def sql_builder(conn):
+    """GROUP BY in SQLite; only the aggregates come back to Python"""
+    return gstr1.GSTR1Builder(conn, SELLER_GSTIN).build(*PERIOD)
+
+
+def row_dump(conn):
+    """The previous approach: pull every line into pandas and group there"""
+    import pandas as pd
+
+    df = pd.DataFrame(conn.execute(GSTR1_QUERY, PERIOD).fetchall(), columns=COLUMNS)
+    seller_state = tax_engine.state_code_from_gstin(SELLER_GSTIN)
+    df['gstin'] = df['GSTIN'].fillna('')
+    df['pos'] = df['gstin'].str[:2]
+    df['inter'] = (df['pos'] != '') & (df['pos'] != seller_state)
+    df['txval'] = df['Quantity'] * df['Price']
+    df['iamt'] = df['GST Amount'].where(df['inter'], 0)
+    df['camt'] = df['GST Amount'].where(~df['inter'], 0) / 2
+    df['val'] = df.groupby('Invoice Number')['Total Amount'].transform('sum')
+    sums = {'txval': 'sum', 'iamt': 'sum', 'camt': 'sum'}
+
+    b2b = {}
+    rates = df[df['gstin'] != ''].groupby(
+        ['gstin', 'Invoice Number', 'Date', 'val', 'pos', 'inter', 'GST Rate']).agg(sums).round(2).reset_index()
+    for row in rates.itertuples(index=False):
+        invoices = b2b.setdefault(row.gstin, {})
+        invoice = invoices.setdefault(row[1], {
+            'inum': row[1], 'idt': gstr1.portal_date(row.Date), 'val': round(row.val, 2),
+            'pos': row.pos, 'rchrg': 'N', 'inv_typ': 'R', 'itms': []})
+        invoice['itms'].append({'num': len(invoice['itms']) + 1, 'itm_det': gstr1.item_details(
+            row[6], row.txval, row.iamt, row.camt, row.camt, row.inter)})
+
+    b2c = df[df['gstin'] == '']
+    large = b2c['inter'] & (b2c['val'] > gstr1.B2CL_THRESHOLD)
+    b2cl = b2c[large].groupby(['pos', 'Invoice Number', 'Date', 'val', 'GST Rate']).agg(sums).round(2)
+    b2cs = b2c[~large].groupby(['inter', 'pos', 'GST Rate']).agg(sums).round(2)
+    hsn = df.groupby(['HSN Code', 'GST Rate']).agg(
+        {'Quantity': 'sum', 'Total Amount': 'sum', **sums}).round(2)
+    return {
+        'b2b': [{'ctin': ctin, 'inv': list(invoices.values())} for ctin, invoices in b2b.items()],
+        'b2cl': b2cl.reset_index().to_dict(orient='records'),
+        'b2cs': b2cs.reset_index().to_dict(orient='records'),
+        'hsn': {'data': hsn.reset_index().to_dict(orient='records')},
+    }
+
+
+def measure(fn, conn, repeat):
+    """Best wall time of ``repeat`` untraced runs, then peak traced memory of one"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        data = fn(conn)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    fn(conn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    invoices = sum(len(buyer['inv']) for buyer in data['b2b'])
+    return invoices, best, peak / (1024 * 1024)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare SQL-side GSTR-1 aggregation with the row dump")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 500000],
+                        help="Invoice line counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per approach; the best is reported")
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>10} {'approach':>10} {'b2b inv':>8} {'seconds':>9} {'peak MB':>9}")
+    for lines in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = seed(os.path.join(tmp, "bench.db"), lines)
+            prepare(conn)
+            for name, fn in (("sql", sql_builder), ("row dump", row_dump)):
+                invoices, seconds, peak = measure(fn, conn, args.repeat)
+                print(f"{lines:>10} {name:>10} {invoices:>8} {seconds:>9.3f} {peak:>9.1f}")
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
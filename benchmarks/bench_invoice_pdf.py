@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import invoice_pdf
+
+SELLER = ("Bench Traders Pvt Ltd", "29AAAAA0000A1Z5", "1 Residency Road, Bengaluru")
+
+
+def make_invoices(count, max_lines, seed=11):
+    """Invoice dicts in the shape billing and bulk invoicing render"""
+    rng = random.Random(seed)
+    invoices = []
+    for n in range(count):
+        lines = []
+        for i in range(rng.randint(1, max_lines)):
+            quantity, price = rng.randint(1, 20), round(rng.uniform(10, 5000), 2)
+            gst = round(quantity * price * 0.18, 2)
+            lines.append((f"Product {rng.randint(1, 5000)} {'x' * rng.randint(0, 30)}", quantity, price, gst,
+                          round(quantity * price + gst, 2)))
+        taxable = sum(line[1] * line[2] for line in lines)
+        tax = sum(line[3] for line in lines)
+        invoices.append({
+            'invoice_number': f"INV-{n:08d}", 'invoice_date': "2024-04-01",
+            'customer_name': f"Customer {n}", 'gstin': "27ABCDE1234F1Z5", 'address': "42 Market Street, Pune",
+            'lines': lines,
+            'totals': {'taxable': taxable, 'cgst': 0.0, 'sgst': 0.0, 'igst': tax, 'total': taxable + tax},
+        })
+    return invoices
+
+
+def legacy_render(pdf_path, invoice):
+    """The previous renderer: every invoice hand-drawn at fixed coordinates, no pagination"""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(pdf_path, pagesize=letter)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(50, 750, "INVOICE")
+    c.setFont("Helvetica", 12)
+    c.drawString(50, 720, f"Invoice Number: {invoice['invoice_number']}")
+    c.drawString(50, 700, f"Date: {invoice['invoice_date']}")
+    c.drawString(50, 670, f"Customer: {invoice['customer_name']}")
+    c.drawString(50, 650, f"GSTIN: {invoice['gstin']}")
+    c.drawString(50, 630, f"Address: {invoice['address']}")
+    y = 580
+    for x, heading in ((50, "Product"), (200, "Qty"), (250, "Price"), (300, "GST"), (350, "Total")):
+        c.drawString(x, y, heading)
+    y -= 20
+    for product_name, quantity, price, gst_amount, total in invoice['lines']:
+        c.drawString(50, y, product_name)
+        c.drawString(200, y, str(quantity))
+        c.drawString(250, y, f"{price:.2f}")
+        c.drawString(300, y, f"{gst_amount:.2f}")
+        c.drawString(350, y, f"{total:.2f}")
+        y -= 20
+    for label, key in (("Subtotal:", 'taxable'), ("CGST:", 'cgst'), ("SGST:", 'sgst'),
+                       ("IGST:", 'igst'), ("Total:", 'total')):
+        y -= 20
+        c.drawString(250, y, label)
+        c.drawString(350, y, f"{invoice['totals'][key]:.2f}")
+    c.save()
+    return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Invoice PDF throughput in pages/sec")
+    parser.add_argument("--invoices", type=int, default=500, help="Invoices to render")
+    parser.add_argument("--max-lines", type=int, default=60, help="Most lines on one invoice (uniform from 1)")
+    args = parser.parse_args(argv)
+
+    invoices = make_invoices(args.invoices, args.max_lines)
+    template = invoice_pdf.InvoiceTemplate(SELLER)
+    print(f"{args.invoices} invoices, 1-{args.max_lines} lines each\n")
+    print(f"{'renderer':>22} {'pages':>7} {'seconds':>8} {'pages/s':>8} {'invoices/s':>10} {'MB':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [
+            ("legacy, file each", lambda: sum(
+                legacy_render(os.path.join(tmp, f"legacy_{n}.pdf"), invoice) for n, invoice in enumerate(invoices))),
+            ("template, file each", lambda: sum(
+                template.render(os.path.join(tmp, f"single_{n}.pdf"), invoice) for n, invoice in enumerate(invoices))),
+            ("template, one PDF", lambda: template.render_many(os.path.join(tmp, "batch.pdf"), invoices)),
+        ]
+        for name, run in runs:
+            prefix = name.split(",")[0]
+            started = time.perf_counter()
+            pages = run()
+            elapsed = time.perf_counter() - started
+            size = sum(entry.stat().st_size for entry in os.scandir(tmp)
+                       if entry.name.startswith(prefix if prefix == "legacy" else
+                                                ("batch" if "one" in name else "single")))
+            print(f"{name:>22} {pages:>7} {elapsed:>8.2f} {pages / elapsed:>8.1f} "
+                  f"{len(invoices) / elapsed:>10.1f} {size / 2 ** 20:>7.1f}")
+    print("\nThe legacy renderer puts every invoice on one page, running lines past the bottom edge.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+import search
+
+# Typed text from very common to absent, covering every ranking tier
+QUERIES = ['a', 'ab', 'tra', 'pvt l', 'sons', '29', '29AB', '98', '9812', 'xyzq']
+
+
+def seed(path, customers):
+    """Customers with two-word names, GSTINs and phone numbers
+
+    Rows go in before the search migration so its one-pass FTS rebuild does
+    the indexing, rather than the per-row triggers.
+    """
+    rng = random.Random(7)
+    words = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))).title()
+             for _ in range(5000)]
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn, target=6)
+    conn.executemany("INSERT INTO customers (name, gstin, phone) VALUES (?, ?, ?)", (
+        (f"{rng.choice(words)} {rng.choice(words)} {rng.choice(['Traders', 'Pvt Ltd', 'Stores', '& Sons'])}",
+         f"{rng.randint(1, 37):02d}{''.join(rng.choice(string.ascii_uppercase) for _ in range(5))}"
+         f"{rng.randint(0, 9999):04d}{rng.choice(string.ascii_uppercase)}1Z{rng.randint(0, 9)}",
+         f"9{rng.randint(0, 999999999):09d}")
+        for _ in range(customers)))
+    conn.commit()
+    migrations.migrate(conn)
+    return conn
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Typeahead latency over a large customer table")
+    parser.add_argument("--customers", type=int, default=500000, help="Customer rows to generate")
+    parser.add_argument("--repeat", type=int, default=50, help="Searches per query")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        conn = seed(os.path.join(tmp, "bench.db"), args.customers)
+        print(f"Seeded and indexed {args.customers} customers in {time.perf_counter() - started:.1f} s\n")
+
+        print(f"{'query':>10} {'matches':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                matches = search.search(conn, 'customers', query)
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{query:>10} {len(matches):>8} {percentile(timings, 0.5):>8.2f} {percentile(timings, 0.99):>8.2f}")
+
+        # Incremental maintenance: the triggers index a new or edited row in
+        # the same transaction, so it is searchable straight away
+        started = time.perf_counter()
+        cursor = conn.execute("INSERT INTO customers (name, gstin, phone) VALUES ('Zzyzx Benchmark Co', "
+                              "'27ZZYZX0000Z1Z5', '9000000000')")
+        conn.execute("UPDATE customers SET name = 'Zzyzx Renamed Co' WHERE id = ?", (cursor.lastrowid,))
+        conn.commit()
+        elapsed = (time.perf_counter() - started) * 1000
+        found = search.search(conn, 'customers', 'zzyzx ren')
+        print(f"\nInsert + rename + commit: {elapsed:.2f} ms; found after rename: {found}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
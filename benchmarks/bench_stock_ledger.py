@@ -0,0 +1,88 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+import stock_ledger
+
+# Stock as of a date computed from the whole history, the way it would be
+# without checkpoints
+REPLAY_QUERY = """
+    SELECT COALESCE(SUM(quantity), 0) FROM stock_movements
+    WHERE product_id = ? AND movement_date <= ?
+"""
+
+
+def seed(path, products, movements, years):
+    """Products with movements spread over ``years`` years up to today"""
+    rng = random.Random(7)
+    conn = sqlite3.connect(path)
+    migrations.migrate(conn)
+    conn.executemany("INSERT INTO products (id, name, stock_quantity) VALUES (?, ?, 0)",
+                     ((i, f"Product {i}") for i in range(1, products + 1)))
+    start = date.today() - timedelta(days=365 * years)
+    days = 365 * years
+    quantities = [rng.choice([-3, -2, -1, -1, 5, 10]) for _ in range(movements)]
+    stock_ledger.record(conn.cursor(), sorted(
+        ((rng.randint(1, products), str(start + timedelta(days=rng.randrange(days))), quantity,
+          stock_ledger.SALE if quantity < 0 else stock_ledger.PURCHASE, None) for quantity in quantities),
+        key=lambda movement: movement[1]))
+    conn.commit()
+    return conn
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Point-in-time stock from checkpoints vs full replay")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--movements", type=int, default=2000000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        conn = seed(os.path.join(tmp, "bench.db"), args.products, args.movements, args.years)
+        print(f"Seeded {args.movements} movements for {args.products} products "
+              f"in {time.perf_counter() - started:.1f} s")
+
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        written = stock_ledger.checkpoint_months(cursor)
+        conn.commit()
+        print(f"Wrote {written} month-end checkpoints in {time.perf_counter() - started:.1f} s\n")
+
+        rng = random.Random(11)
+        first = date.today() - timedelta(days=365 * args.years)
+        lookups = [(rng.randint(1, args.products), str(first + timedelta(days=rng.randrange(365 * args.years))))
+                   for _ in range(args.lookups)]
+        print(f"{'method':>12} {'p50 ms':>8} {'p99 ms':>8}")
+        results = {}
+        for name, lookup in (("replay", lambda p, d: conn.execute(REPLAY_QUERY, (p, d)).fetchone()[0]),
+                             ("checkpoint", lambda p, d: stock_ledger.balance(conn, p, d))):
+            timings = []
+            values = []
+            for product_id, on_date in lookups:
+                started = time.perf_counter()
+                values.append(lookup(product_id, on_date))
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = values
+            print(f"{name:>12} {percentile(timings, 0.5):>8.3f} {percentile(timings, 0.99):>8.3f}")
+        print(f"\nResults agree: {results['replay'] == results['checkpoint']}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
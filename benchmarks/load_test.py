@@ -0,0 +1,282 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import invoice_store
+import tax_rollup
+from benchmarks import synthetic
+from benchmarks.suite import git_revision, percentiles, throughput
+from core.reports import GSTR1_QUERY, GSTR2_QUERY
+from db import Database
+
+
+def is_locked(error):
+    """SQLITE_BUSY as the sqlite3 module reports it"""
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+def database_options(args):
+    return {'busy_timeout_ms': args.busy_timeout_ms, 'commit_window': args.commit_window_ms / 1000,
+            'journal_mode': args.journal_mode}
+
+
+def billing_client(db, seed, duration, think_ms, start):
+    """Create invoices one at a time for ``duration`` seconds, like a counter
+
+    ``start`` is a barrier shared with the other clients so the clock only
+    runs once all of them are ready. Latency is from queueing the invoice
+    to its commit.
+    """
+    rng = random.Random(seed)
+    with db.reader() as conn:
+        customers = conn.execute("SELECT id, name, state_code FROM customers ORDER BY random() LIMIT 200").fetchall()
+        products = conn.execute("SELECT id, name, price, gst_rate FROM products ORDER BY random() LIMIT 500").fetchall()
+    seller_state = synthetic.SELLER[1][:2]
+    today = date.today()
+    latencies, locked, errors = [], 0, []
+
+    start.wait()
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        invoice = synthetic.counter_invoice(rng, customers, products, seller_state, today)
+        queued = time.perf_counter()
+        try:
+            db.write(invoice_store.insert_invoices, [invoice]).result()
+            latencies.append((time.perf_counter() - queued) * 1000)
+        except sqlite3.Error as e:
+            if is_locked(e):
+                locked += 1
+            else:
+                errors.append(str(e))
+        if think_ms:
+            time.sleep(rng.expovariate(1000 / think_ms))
+    return {'latencies': latencies, 'locked': locked, 'errors': errors, 'seconds': time.perf_counter() - started}
+
+
+def report_job(db, period, duration, start):
+    """Run GSTR-1, GSTR-2 and GSTR-3B over ``period`` back to back for ``duration`` seconds"""
+    reports = (lambda conn: conn.execute(GSTR1_QUERY, period).fetchall(),
+               lambda conn: conn.execute(GSTR2_QUERY, period).fetchall(),
+               lambda conn: tax_rollup.summary(conn, *period))
+    timings, locked, errors = [], 0, []
+
+    start.wait()
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        for report in reports:
+            began = time.perf_counter()
+            try:
+                with db.reader() as conn:
+                    report(conn)
+                timings.append((time.perf_counter() - began) * 1000)
+            except sqlite3.Error as e:
+                if is_locked(e):
+                    locked += 1
+                else:
+                    errors.append(str(e))
+    return {'latencies': timings, 'locked': locked, 'errors': errors, 'seconds': time.perf_counter() - started}
+
+
+def failed(error):
+    return {'latencies': [], 'locked': int(is_locked(error)), 'errors': [repr(error)], 'seconds': 0}
+
+
+def run_in_process(role, path, options, start, results, *args):
+    """Process entry point: open the database the way the app does and run ``role``
+
+    A process that fails before the start breaks the barrier, so the others
+    and the parent stop waiting for it and the run ends with its error.
+    """
+    db = None
+    try:
+        db = Database(path, **options)
+        outcome = (billing_client if role == 'client' else report_job)(db, *args, start)
+    except Exception as e:
+        start.abort()
+        outcome = failed(e)
+    finally:
+        if db is not None:
+            db.close()
+    results.put((role, outcome))
+
+
+def run_in_thread(db, seed, duration, think_ms, start, collected):
+    """Thread entry point of a counter sharing ``db`` (see run_in_process)"""
+    try:
+        outcome = billing_client(db, seed, duration, think_ms, start)
+    except Exception as e:
+        start.abort()
+        outcome = failed(e)
+    collected.put(outcome)
+
+
+def summarize(outcomes, duration):
+    latencies = [value for outcome in outcomes for value in outcome['latencies']]
+    errors = [error for outcome in outcomes for error in outcome['errors']]
+    summary = {'count': len(latencies), 'locked': sum(outcome['locked'] for outcome in outcomes),
+               'errors': len(errors)}
+    if latencies:
+        summary.update(percentiles(latencies))
+        summary['max_ms'] = round(max(latencies), 3)
+    summary['per_second'] = throughput(len(latencies), duration)
+    if errors:
+        summary['first_error'] = errors[0]
+    return summary
+
+
+def run(path, clients, reports, duration, think_ms, options, threads=False):
+    """Run ``clients`` billing counters and ``reports`` report jobs against ``path``
+
+    Each client is its own process with its own Database, as separate
+    counters sharing the file would be, so they contend for SQLite's write
+    lock; with ``threads`` they share one Database and its group commit
+    instead. Report jobs always run in processes of their own.
+    """
+    seeds = range(1, clients + 1)
+    period = period_of(path)
+    context = multiprocessing.get_context("spawn")
+    start = context.Barrier(reports + (0 if threads else clients) + 1)
+    results = context.Queue()
+    processes = [context.Process(target=run_in_process, args=('report', path, options, start, results, period,
+                                                               duration))
+                 for _ in range(reports)]
+    if not threads:
+        processes += [context.Process(target=run_in_process, args=('client', path, options, start, results, seed,
+                                                                   duration, think_ms))
+                      for seed in seeds]
+    for process in processes:
+        process.start()
+
+    outcomes = {'client': [], 'report': []}
+    shared = None
+    try:
+        if threads:
+            shared = Database(path, **options)
+            local = threading.Barrier(clients + 1)
+            collected = queue.Queue()
+            workers = [threading.Thread(target=run_in_thread,
+                                        args=(shared, seed, duration, think_ms, local, collected))
+                       for seed in seeds]
+            for worker in workers:
+                worker.start()
+        try:
+            start.wait()
+        except threading.BrokenBarrierError:
+            # A process failed to start; its error comes back in the results
+            if threads:
+                local.abort()
+        if threads:
+            # Let the threads go once the report processes are ready too
+            try:
+                local.wait()
+            except threading.BrokenBarrierError:
+                # A counter failed to start; its error is in its outcome
+                pass
+            for worker in workers:
+                worker.join()
+            outcomes['client'] = [collected.get() for _ in workers]
+        for _ in processes:
+            role, outcome = results.get()
+            outcomes[role].append(outcome)
+    except BaseException:
+        # Release processes still waiting at the start
+        start.abort()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+        if shared is not None:
+            shared.close()
+
+    elapsed = max([outcome['seconds'] for outcome in outcomes['client']] or [duration])
+    return {'commits': summarize(outcomes['client'], elapsed),
+            'reports': summarize(outcomes['report'], elapsed),
+            'wal_bytes': os.path.getsize(path + "-wal") if os.path.exists(path + "-wal") else 0}
+
+
+def period_of(path):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        first, last = conn.execute("SELECT MIN(invoice_date), MAX(invoice_date) FROM invoices").fetchone()
+    finally:
+        conn.close()
+    return (first or str(date.today()), last or str(date.today()))
+
+
+def print_results(results):
+    print(f"{'':>8} {'count':>7} {'per s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'locked':>7} {'errors':>7}")
+    for name in ('commits', 'reports'):
+        summary = results[name]
+        print(f"{name:>8} {summary['count']:>7} {summary['per_second'] or 0:>8} "
+              + " ".join(f"{summary.get(key, '-'):>8}" for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+              + f" {summary['locked']:>7} {summary['errors']:>7}")
+        if 'first_error' in summary:
+            print(f"{'':>8} first error: {summary['first_error']}")
+    print(f"WAL file after the run: {results['wal_bytes'] / 1024:.0f} KiB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Concurrent billing counters and report jobs against one database file")
+    parser.add_argument("--db", help="Existing database to load (invoices are added to it); "
+                                     "by default a synthetic one is generated")
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--invoices", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent billing counters")
+    parser.add_argument("--reports", type=int, default=2, help="Concurrent report jobs")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds to run")
+    parser.add_argument("--think-ms", type=float, default=0,
+                        help="Mean pause between a counter's invoices (0 = back to back)")
+    parser.add_argument("--threads", action="store_true",
+                        help="Counters share one Database in one process instead of one each")
+    parser.add_argument("--busy-timeout-ms", type=int, default=30000)
+    parser.add_argument("--commit-window-ms", type=float, default=2)
+    parser.add_argument("--journal-mode", default="WAL", choices=["WAL", "DELETE", "TRUNCATE"])
+    parser.add_argument("--out", help="JSON file for the results")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        counts = None
+        if path is None:
+            path = os.path.join(tmp, "load.db")
+            started = time.perf_counter()
+            counts = synthetic.generate(path, args.customers, args.products, args.invoices)
+            print(f"Generated {counts} in {time.perf_counter() - started:.1f} s")
+        # Switch the journal mode once, before anyone else has the file open
+        Database(path, journal_mode=args.journal_mode).close()
+
+        print(f"{args.clients} counters ({'threads' if args.threads else 'processes'}), {args.reports} report jobs, "
+              f"{args.journal_mode}, busy timeout {args.busy_timeout_ms} ms, "
+              f"commit window {args.commit_window_ms} ms, {args.duration:.0f} s")
+        results = run(path, args.clients, args.reports, args.duration, args.think_ms, database_options(args),
+                      args.threads)
+
+    print_results(results)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'meta': {'revision': git_revision(), 'created': datetime.now().isoformat(timespec='seconds'),
+                                'sqlite': sqlite3.sqlite_version, 'cpus': os.cpu_count(), 'dataset': counts,
+                                'options': vars(args)},
+                       'results': results}, f, indent=2)
+        print(f"Results written to {args.out}")
+    # Non-zero when the settings let a writer or reader give up on the lock,
+    # or a counter or report job failed
+    return 1 if any(results[name]['locked'] or results[name]['errors'] for name in ('commits', 'reports')) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bulk_invoicing
+import gstr1
+import invoice_pdf
+import invoice_store
+import report_export
+import search
+import stock_alerts
+import stock_ledger
+import tax_rollup
+from benchmarks import synthetic
+from benchmarks.bench_export_memory import COLUMNS
+from core.reports import GSTR1_QUERY, GSTR2_QUERY
+from core.stock import MOVEMENT_QUERY
+from db import Database
+from master_data import MasterDataCache
+from paged_list import KeysetPager
+
+# Metrics where a larger number is better; every other metric is a time
+HIGHER_IS_BETTER = ('per_second',)
+
+# A change beyond this fraction is flagged when comparing with a baseline
+TOLERANCE = 0.10
+
+
+def percentiles(timings_ms):
+    values = sorted(timings_ms)
+
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(len(values) * fraction))], 3)
+
+    return {'p50_ms': at(0.50), 'p95_ms': at(0.95), 'p99_ms': at(0.99)}
+
+
+def timed(fn, repeat):
+    """Run ``fn`` ``repeat`` times; percentiles of the wall time in ms"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return percentiles(timings)
+
+
+def throughput(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+
+class Context:
+    """What every benchmark gets: the database, its period and a scratch directory"""
+
+    def __init__(self, db, tmp, period, counts):
+        self.db = db
+        self.tmp = tmp
+        self.period = period
+        self.counts = counts
+        self.rng = random.Random(3)
+
+    def reader(self):
+        return self.db.reader()
+
+    def sample_ids(self, table, count):
+        with self.reader() as conn:
+            high = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+        return [self.rng.randint(1, high) for _ in range(count)]
+
+
+def bench_catalogue(ctx):
+    """First and deep pages of the paged lists, typeahead and cached lookups"""
+    results = {}
+    with ctx.reader() as conn:
+        for table, columns in (('customers', ['name', 'gstin', 'phone']), ('products', ['name', 'hsn_code', 'price'])):
+            pager = KeysetPager(table, columns)
+            results[f'{table}_first_page'] = timed(lambda: (pager.reset(), pager.fetch(conn)), 50)['p50_ms']
+            pager.reset()
+
+            def next_page():
+                # Scroll on down, starting over at the end of the list
+                if pager.exhausted:
+                    pager.reset()
+                pager.fetch(conn)
+
+            results[f'{table}_next_page'] = timed(next_page, 50)['p50_ms']
+        queries = ['s', 'sh', 'shree b', '29', 'lap', 'zzz']
+        results['typeahead'] = timed(lambda: [search.search(conn, 'customers', query) for query in queries], 20)
+    cache = MasterDataCache(ctx.db)
+    ids = ctx.sample_ids('products', 2000)
+    started = time.perf_counter()
+    for product_id in ids:
+        cache.get('products', product_id)
+    results['cache_lookups_per_second'] = throughput(len(ids), time.perf_counter() - started)
+    return results
+
+
+def bench_reports(ctx):
+    """GSTR-1 line listing and portal JSON, GSTR-2 and GSTR-3B for the whole period"""
+    results = {}
+    with ctx.reader() as conn:
+        for name, run in (
+                ('gstr1_lines', lambda: len(conn.execute(GSTR1_QUERY, ctx.period).fetchall())),
+                ('gstr1_portal', lambda: len(gstr1.GSTR1Builder(conn, synthetic.SELLER[1]).build(*ctx.period)['b2b'])),
+                ('gstr2_lines', lambda: len(conn.execute(GSTR2_QUERY, ctx.period).fetchall())),
+                ('gstr3b', lambda: len(tax_rollup.summary(conn, *ctx.period)))):
+            started = time.perf_counter()
+            rows = run()
+            elapsed = time.perf_counter() - started
+            results[name] = {'seconds': round(elapsed, 3), 'rows': rows}
+    return results
+
+
+def bench_stock(ctx):
+    """A month of stock movements, point-in-time stock and the low stock list"""
+    results = {}
+    start = date.fromisoformat(ctx.period[0])
+    month = (str(start), str(start.replace(day=28)))
+    with ctx.reader() as conn:
+        results['movements_month'] = timed(lambda: conn.execute(MOVEMENT_QUERY, month).fetchall(), 10)
+        lookups = [(product_id, f"{ctx.period[0][:4]}-{ctx.rng.randint(4, 12):02d}-15")
+                   for product_id in ctx.sample_ids('products', 500)]
+        started = time.perf_counter()
+        for product_id, on_date in lookups:
+            stock_ledger.balance(conn, product_id, on_date)
+        results['balance_lookups_per_second'] = throughput(len(lookups), time.perf_counter() - started)
+        results['low_stock_list'] = timed(lambda: stock_alerts.low_stock(conn), 20)['p50_ms']
+    return results
+
+
+def bench_export(ctx):
+    """GSTR-1 lines for the period streamed to each report format"""
+    results = {}
+    with ctx.reader() as conn:
+        for name in report_export.WRITERS:
+            started = time.perf_counter()
+            _, rows, _ = report_export.export_query(conn, GSTR1_QUERY, ctx.period, COLUMNS,
+                                                    os.path.join(ctx.tmp, "export"), formats=[name])
+            elapsed = time.perf_counter() - started
+            results[name] = {'seconds': round(elapsed, 3), 'rows_per_second': throughput(rows, elapsed)}
+    return results
+
+
+def bench_pdf(ctx, count=200):
+    """Invoices from the database rendered to a file each and to one PDF"""
+    with ctx.reader() as conn:
+        headers = conn.execute("""
+            SELECT i.id, i.invoice_number, i.invoice_date, c.name, c.gstin, c.address,
+                   i.total_amount, i.cgst_amount, i.sgst_amount, i.igst_amount
+            FROM invoices i JOIN customers c ON c.id = i.customer_id
+            ORDER BY i.id DESC LIMIT ?
+        """, (count,)).fetchall()
+        invoices = []
+        for invoice_id, number, invoice_date, name, gstin, address, total, cgst, sgst, igst in headers:
+            lines = conn.execute("""
+                SELECT p.name, ii.quantity, ii.price, ii.gst_amount, ii.total_amount
+                FROM invoice_items ii JOIN products p ON p.id = ii.product_id
+                WHERE ii.invoice_id = ?
+            """, (invoice_id,)).fetchall()
+            invoices.append({'invoice_number': number, 'invoice_date': invoice_date, 'customer_name': name,
+                             'gstin': gstin, 'address': address, 'lines': lines,
+                             'totals': {'taxable': total - cgst - sgst - igst, 'cgst': cgst, 'sgst': sgst,
+                                        'igst': igst, 'total': total}})
+    seller = invoice_pdf.seller_details(ctx.db)
+    results = {}
+    started = time.perf_counter()
+    pages = sum(invoice_pdf.get_template(seller).render(
+        os.path.join(ctx.tmp, invoice_pdf.file_name(invoice['invoice_number'])), invoice) for invoice in invoices)
+    elapsed = time.perf_counter() - started
+    results['file_each'] = {'pages_per_second': throughput(pages, elapsed),
+                            'invoices_per_second': throughput(len(invoices), elapsed)}
+    started = time.perf_counter()
+    pages = invoice_pdf.render_invoices(os.path.join(ctx.tmp, "batch.pdf"), invoices, seller)
+    elapsed = time.perf_counter() - started
+    results['one_pdf'] = {'pages_per_second': throughput(pages, elapsed),
+                          'invoices_per_second': throughput(len(invoices), elapsed)}
+    return results
+
+
+def bench_invoicing(ctx, count=300, orders=5000):
+    """Counter-style invoices priced and committed one at a time, then a bulk run"""
+    with ctx.reader() as conn:
+        customers = conn.execute("SELECT id, name, state_code FROM customers ORDER BY random() LIMIT 200").fetchall()
+        products = conn.execute("SELECT id, name, price, gst_rate FROM products ORDER BY random() LIMIT 500").fetchall()
+    seller_state = synthetic.SELLER[1][:2]
+    today = str(date.today())
+
+    def one_invoice():
+        invoice = synthetic.counter_invoice(ctx.rng, customers, products, seller_state, today)
+        ctx.db.write(invoice_store.insert_invoices, [invoice]).result()
+
+    started = time.perf_counter()
+    results = {'counter_commit': timed(one_invoice, count)}
+    results['counter_commit']['per_second'] = throughput(count, time.perf_counter() - started)
+
+    run = bulk_invoicing.BulkInvoiceRun(ctx.db, seller_state_code=seller_state, render_pdfs=False)
+    stats = run.run({'order_id': n, 'customer': ctx.rng.choice(customers)[1],
+                     'items': [{'product': ctx.rng.choice(products)[1], 'quantity': ctx.rng.randint(1, 5)}
+                               for _ in range(ctx.rng.randint(1, 9))]}
+                    for n in range(orders))
+    results['bulk'] = {'seconds': round(stats['seconds'], 3),
+                       'invoices_per_second': round(stats['invoices_per_second'], 1)}
+    return results
+
+
+# Read-only benchmarks first, so they all see the generated data as is
+BENCHMARKS = [
+    ('catalogue', bench_catalogue),
+    ('reports', bench_reports),
+    ('stock', bench_stock),
+    ('export', bench_export),
+    ('pdf', bench_pdf),
+    ('invoicing', bench_invoicing),
+]
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Lines describing every metric that moved by more than ``tolerance``"""
+    current, before = flatten(results), flatten(baseline)
+    lines = []
+    for name, value in current.items():
+        old = before.get(name)
+        if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old or name.endswith('rows'):
+            continue
+        change = (value - old) / old
+        better = change > 0 if name.endswith(HIGHER_IS_BETTER) else change < 0
+        if abs(change) > tolerance:
+            lines.append(f"{'improved' if better else 'REGRESSED':>9} {name}: {old} -> {value} ({change:+.0%})")
+    return lines
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the application's hot paths on a synthetic database")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--invoices", type=int, default=100000)
+    parser.add_argument("--only", nargs="+", choices=[name for name, _ in BENCHMARKS], help="Benchmarks to run")
+    parser.add_argument("--out", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="Earlier results file to flag regressions against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative change to flag (default 0.10)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        started = time.perf_counter()
+        counts = synthetic.generate(path, args.customers, args.products, args.invoices)
+        generated = time.perf_counter() - started
+        print(f"Generated {counts} in {generated:.1f} s")
+
+        db = Database(path)
+        try:
+            ctx = Context(db, tmp, ('2024-04-01', '2025-03-31'), counts)
+            results = {}
+            for name, bench in BENCHMARKS:
+                if args.only and name not in args.only:
+                    continue
+                started = time.perf_counter()
+                results[name] = bench(ctx)
+                print(f"{name:>10}: {time.perf_counter() - started:.1f} s")
+        finally:
+            db.close()
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'dataset': counts,
+            'generate_seconds': round(generated, 1),
+        },
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    for name, value in flatten(results).items():
+        print(f"  {name}: {value}")
+    print(f"Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare} (revision {baseline['meta'].get('revision')}):")
+        print("\n".join(compare(results, baseline['results'], args.tolerance))
+              or f"  no change beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
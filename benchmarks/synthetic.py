@@ -0,0 +1,212 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import invoice_numbers
+import invoice_pdf
+import migrations
+import tax_engine
+import tax_rollup
+
+SELLER = ("Synthetic Traders Pvt Ltd", "29AABCS1234K1Z7", "12 MG Road, Bengaluru 560001")
+
+GSTIN_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# (GST rate, share of the catalogue, HSN chapters sold at that rate)
+SLABS = [
+    (0, 0.05, ["0401", "0701", "1006"]),
+    (5, 0.20, ["0902", "1101", "6101", "6403"]),
+    (12, 0.20, ["2106", "4820", "6302", "8471"]),
+    (18, 0.45, ["3304", "3401", "8415", "8517", "8528", "9403"]),
+    (28, 0.10, ["2202", "8703", "8711"]),
+]
+
+WORDS = ["Shree", "Ganesh", "Lakshmi", "Bharat", "Royal", "Sai", "Om", "Metro", "City", "Star",
+         "Global", "Sunrise", "Apex", "Krishna", "Balaji", "Prime", "National", "Classic"]
+SUFFIXES = ["Traders", "Enterprises", "Stores", "& Sons", "Pvt Ltd", "Agencies", "Mart"]
+ITEMS = ["Rice", "Tea", "Soap", "Notebook", "Shirt", "Shoes", "Laptop", "Phone", "Fan", "Chair",
+         "Juice", "Shampoo", "Towel", "Television", "Helmet", "Cooler", "Biscuits", "Oil"]
+
+
+def gstin_check_char(first14):
+    """Check character of a GSTIN (the Luhn mod 36 scheme the portal validates)"""
+    total = 0
+    for position, char in enumerate(first14):
+        value = GSTIN_CHARS.index(char) * (2 if position % 2 else 1)
+        total += value // 36 + value % 36
+    return GSTIN_CHARS[(36 - total % 36) % 36]
+
+
+def make_gstin(rng, state_code):
+    """A well-formed GSTIN: state, PAN, entity number, 'Z' and check character"""
+    pan = ("".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(3)) + rng.choice("PCFH")
+           + rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") + f"{rng.randint(0, 9999):04d}"
+           + rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    first14 = f"{state_code}{pan}{rng.choice('123456789')}Z"
+    return first14 + gstin_check_char(first14)
+
+
+def state_codes(rng, count, home="29", home_share=0.6):
+    """Mostly the seller's own state, the rest spread over the others"""
+    return [home if rng.random() < home_share else f"{rng.randint(1, 37):02d}" for _ in range(count)]
+
+
+def counter_invoice(rng, customers, products, seller_state, invoice_date):
+    """An invoice as the billing tab builds it, ready for invoice_store.insert_invoices
+
+    ``customers`` are (id, name, state_code) rows and ``products`` are
+    (id, name, price, gst_rate) rows to pick from.
+    """
+    customer_id, _, state = rng.choice(customers)
+    lines = [rng.choice(products) for _ in range(rng.randint(1, 9))]
+    quantities = [rng.randint(1, 5) for _ in lines]
+    inter_state = tax_engine.is_inter_state(seller_state, state)
+    taxes = tax_engine.compute_line_taxes([line[2] for line in lines], quantities,
+                                          [line[3] for line in lines], inter_state)
+    return {
+        'invoice_date': str(invoice_date), 'customer_id': customer_id, 'place_of_supply': state,
+        'supply_type': 'INTER' if inter_state else 'INTRA', 'totals': tax_engine.summarize(taxes),
+        'items': [(line[0], quantity, line[2], line[3], float(gst), float(total))
+                  for line, quantity, gst, total in zip(lines, quantities, taxes['gst'], taxes['total'])],
+    }
+
+
+def generate(path, customers=10000, products=5000, invoices=100000, lines_per_invoice=5,
+             start=date(2024, 4, 1), days=365, b2c_share=0.3, seed=1, chunk=10000):
+    """Create a database of realistic size and mix at ``path`` and return counts
+
+    Rows are inserted before the search and stock ledger migrations run, so
+    those index everything in one set-based pass (an FTS5 'rebuild' and the
+    ledger backfill) rather than through their per-row triggers and writes.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    migrations.migrate(conn, target=6)
+    seller_state = SELLER[1][:2]
+
+    customer_states = state_codes(rng, customers, seller_state)
+    customer_rows = []
+    for i, state in enumerate(customer_states, 1):
+        registered = rng.random() >= b2c_share
+        customer_rows.append((
+            i, f"{rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(SUFFIXES)} {i}",
+            make_gstin(rng, state) if registered else None,
+            f"{rng.randint(1, 999)}, {rng.choice(WORDS)} Nagar", f"9{rng.randint(0, 999999999):09d}",
+            f"accounts{i}@example.com", state,
+        ))
+    conn.executemany("INSERT INTO customers (id, name, gstin, address, phone, email, state_code) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", customer_rows)
+
+    slabs = rng.choices(SLABS, weights=[share for _, share, _ in SLABS], k=products)
+    product_rows = [
+        (i, f"{rng.choice(ITEMS)} {rng.choice(WORDS)} {i}", rng.choice(chapters) + f"{rng.randint(0, 99):02d}",
+         rate, round(rng.uniform(10, 5000), 2), rng.randint(0, 500), rng.randint(5, 50))
+        for i, (rate, _, chapters) in enumerate(slabs, 1)
+    ]
+    conn.executemany("INSERT INTO products (id, name, hsn_code, gst_rate, price, stock_quantity, min_stock_level) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", product_rows)
+
+    conn.executemany("INSERT INTO vendors (id, name, gstin) VALUES (?, ?, ?)",
+                     [(i, f"{rng.choice(WORDS)} Wholesale {i}", make_gstin(rng, state))
+                      for i, state in enumerate(state_codes(rng, 50, seller_state), 1)])
+    conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                     zip(invoice_pdf.SELLER_SETTINGS, SELLER))
+
+    # Invoices in date order, numbered per financial year as the app would
+    numbers = {}
+    line_count = 0
+    for first in range(1, invoices + 1, chunk):
+        ids = range(first, min(first + chunk, invoices + 1))
+        headers, prices, quantities, rates, inter, owner, line_products = [], [], [], [], [], [], []
+        for position, invoice_id in enumerate(ids):
+            invoice_date = start + timedelta(days=(invoice_id - 1) * days // invoices)
+            customer_id = rng.randint(1, customers)
+            place = customer_states[customer_id - 1]
+            inter_state = tax_engine.is_inter_state(seller_state, place)
+            year = invoice_numbers.financial_year(invoice_date)
+            numbers[year] = numbers.get(year, 0) + 1
+            headers.append((invoice_id, invoice_numbers.format_number("INV", year, numbers[year]), customer_id,
+                            str(invoice_date), place, 'INTER' if inter_state else 'INTRA'))
+            for _ in range(rng.randint(1, 2 * lines_per_invoice - 1)):
+                product = product_rows[rng.randint(0, products - 1)]
+                line_products.append(product[0])
+                prices.append(product[4])
+                quantities.append(rng.randint(1, 10))
+                rates.append(product[3])
+                inter.append(inter_state)
+                owner.append(position)
+
+        taxes = tax_engine.compute_line_taxes(prices, quantities, rates, inter)
+        totals = tax_engine.summarize_by_invoice(taxes, owner, len(headers))
+        conn.executemany("""
+            INSERT INTO invoices (id, invoice_number, customer_id, invoice_date, place_of_supply, supply_type,
+                                  total_amount, cgst_amount, sgst_amount, igst_amount, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'PAID')
+        """, [header + (float(totals['total'][i]), float(totals['cgst'][i]), float(totals['sgst'][i]),
+                        float(totals['igst'][i])) for i, header in enumerate(headers)])
+        conn.executemany("""
+            INSERT INTO invoice_items (invoice_id, product_id, quantity, price, gst_rate, gst_amount, total_amount)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(ids[owner[n]], line_products[n], quantities[n], prices[n], rates[n],
+               float(taxes['gst'][n]), float(taxes['total'][n])) for n in range(len(owner))])
+        line_count += len(owner)
+
+    # Restocking purchases for GSTR-2 and the stock ledger
+    purchase_count = max(1, invoices // 10)
+    purchase_rows = []
+    for i in range(purchase_count):
+        product = product_rows[rng.randint(0, products - 1)]
+        quantity = rng.randint(10, 100)
+        taxable = round(product[4] * 0.7 * quantity, 2)
+        gst = round(taxable * product[3] / 100, 2)
+        purchase_rows.append((f"PUR/{i + 1:06d}", str(start + timedelta(days=i * days // purchase_count)),
+                              rng.randint(1, 50), product[0], product[1], product[2], quantity,
+                              round(product[4] * 0.7, 2), product[3], gst, taxable + gst))
+    conn.executemany("""
+        INSERT INTO purchases (invoice_number, invoice_date, vendor_id, product_id, product_name, hsn_code,
+                               quantity, price, gst_rate, gst_amount, total_amount)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, purchase_rows)
+
+    tax_rollup.rebuild(conn.cursor())
+    conn.commit()
+    migrations.migrate(conn)
+    conn.executemany("INSERT INTO invoice_series (series, financial_year, next_number) VALUES ('INV', ?, ?)",
+                     [(year, count + 1) for year, count in numbers.items()])
+    conn.commit()
+    conn.close()
+    return {'customers': customers, 'products': products, 'invoices': invoices, 'lines': line_count,
+            'purchases': purchase_count}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic GST billing database")
+    parser.add_argument("path", help="Database file to create (must not exist)")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--invoices", type=int, default=100000)
+    parser.add_argument("--lines-per-invoice", type=int, default=5, help="Average line items per invoice")
+    parser.add_argument("--start", default="2024-04-01", help="Date of the first invoice")
+    parser.add_argument("--days", type=int, default=365, help="Days the invoices are spread over")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} already exists")
+    started = time.perf_counter()
+    counts = generate(args.path, args.customers, args.products, args.invoices, args.lines_per_invoice,
+                      date.fromisoformat(args.start), args.days, seed=args.seed)
+    print(", ".join(f"{value} {key}" for key, value in counts.items())
+          + f" in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
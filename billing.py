@@ -1,20 +1,37 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from datetime import datetime
-import sqlite3
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-import os
+import search
+from core.invoices import InvoiceService
+from master_data import MasterDataCache
+import tax_engine
 
 class BillingModule:
-    def __init__(self, parent, db_connection):
+    def __init__(self, parent, db, seller_state_code=None, master_data=None):
         self.parent = parent
-        self.conn = db_connection
+        self.db = db
+        self.conn = db.connect(read_only=True)
         self.cursor = self.conn.cursor()
         
+        # Customer and product rows shared with the other tabs
+        self.master_data = master_data or MasterDataCache(db)
+        self.master_data.subscribe(self.on_master_data_changed)
+        
+        # Name -> id of the matches currently offered in each picker
+        self.customer_ids = {}
+        self.product_ids = {}
+        
         # GST rates
         self.gst_rates = [0, 5, 12, 18, 28]
         
+        # State code of the seller's GSTIN, used to decide IGST vs CGST/SGST
+        self.seller_state_code = seller_state_code
+        
+        # Pricing, saving and rendering happen in the headless service
+        self.invoices = InvoiceService(db, seller_state_code, master_data=self.master_data)
+        
+        # Invoice lines as entered: (product_id, name, quantity, price, gst_rate)
+        self.invoice_lines = []
+        
     def create_billing_frame(self, parent):
         """Create the main billing interface"""
         frame = ttk.Frame(parent)
@@ -28,12 +45,15 @@ class BillingModule:
         self.customer_var = tk.StringVar()
         self.customer_combo = ttk.Combobox(left_frame, textvariable=self.customer_var)
         self.customer_combo.pack(fill=tk.X, pady=(0, 10))
+        self.customer_combo.bind("<<ComboboxSelected>>", lambda event: self.update_totals())
+        self.customer_combo.bind("<KeyRelease>", lambda event: self.on_typed(event, self.load_customers))
         
         # Product selection
         ttk.Label(left_frame, text="Select Product:").pack(anchor=tk.W)
         self.product_var = tk.StringVar()
         self.product_combo = ttk.Combobox(left_frame, textvariable=self.product_var)
         self.product_combo.pack(fill=tk.X, pady=(0, 10))
+        self.product_combo.bind("<KeyRelease>", lambda event: self.on_typed(event, self.load_products))
         
         # Quantity
         ttk.Label(left_frame, text="Quantity:").pack(anchor=tk.W)
@@ -78,9 +98,13 @@ class BillingModule:
         self.sgst_var = tk.StringVar(value="0.00")
         ttk.Label(totals_frame, textvariable=self.sgst_var).grid(row=2, column=1, padx=5)
         
-        ttk.Label(totals_frame, text="Total:").grid(row=3, column=0, sticky=tk.W)
+        ttk.Label(totals_frame, text="IGST:").grid(row=3, column=0, sticky=tk.W)
+        self.igst_var = tk.StringVar(value="0.00")
+        ttk.Label(totals_frame, textvariable=self.igst_var).grid(row=3, column=1, padx=5)
+        
+        ttk.Label(totals_frame, text="Total:").grid(row=4, column=0, sticky=tk.W)
         self.total_var = tk.StringVar(value="0.00")
-        ttk.Label(totals_frame, textvariable=self.total_var).grid(row=3, column=1, padx=5)
+        ttk.Label(totals_frame, textvariable=self.total_var).grid(row=4, column=1, padx=5)
         
         # Buttons
         buttons_frame = ttk.Frame(bottom_frame)
@@ -95,43 +119,58 @@ class BillingModule:
         return frame
     
     def load_customers(self):
-        """Load customers into combobox"""
-        self.cursor.execute("SELECT name FROM customers ORDER BY name")
-        customers = [row[0] for row in self.cursor.fetchall()]
-        self.customer_combo['values'] = customers
+        """Fill the customer dropdown with the best matches for the typed text"""
+        matches = search.search(self.conn, 'customers', self.customer_var.get())
+        self.customer_ids = {name: row_id for row_id, name in reversed(matches)}
+        self.customer_combo['values'] = [name for _, name in matches]
     
     def load_products(self):
-        """Load products into combobox"""
-        self.cursor.execute("SELECT name FROM products ORDER BY name")
-        products = [row[0] for row in self.cursor.fetchall()]
-        self.product_combo['values'] = products
+        """Fill the product dropdown with the best matches for the typed text"""
+        matches = search.search(self.conn, 'products', self.product_var.get())
+        self.product_ids = {name: row_id for row_id, name in reversed(matches)}
+        self.product_combo['values'] = [name for _, name in matches]
+    
+    def on_typed(self, event, load):
+        """Refresh a picker's matches as the user types"""
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab"):
+            return
+        load()
+    
+    def selected_customer(self):
+        """Cached row of the customer in the picker, or None"""
+        name = self.customer_var.get()
+        if name in self.customer_ids:
+            return self.master_data.get('customers', self.customer_ids[name])
+        return self.master_data.by_name('customers', name)
+    
+    def selected_product(self):
+        """Cached row of the product in the picker, or None"""
+        name = self.product_var.get()
+        if name in self.product_ids:
+            return self.master_data.get('products', self.product_ids[name])
+        return self.master_data.by_name('products', name)
+    
+    def on_master_data_changed(self, table, ids, version):
+        """Refresh a picker only if it is offering one of the changed rows"""
+        if table == 'customers':
+            if ids & set(self.customer_ids.values()):
+                self.load_customers()
+                self.update_totals()
+        elif ids & set(self.product_ids.values()):
+            self.load_products()
     
     def add_to_invoice(self):
         """Add selected product to invoice"""
         try:
-            product_name = self.product_var.get()
-            quantity = int(self.quantity_var.get())
-            
-            # Get product details
-            self.cursor.execute("""
-                SELECT id, price, gst_rate FROM products WHERE name = ?
-            """, (product_name,))
-            product_id, price, gst_rate = self.cursor.fetchone()
-            
-            # Calculate amounts
-            subtotal = price * quantity
-            gst_amount = subtotal * (gst_rate / 100)
-            total = subtotal + gst_amount
+            product = self.selected_product()
+            if product is None:
+                messagebox.showwarning("Warning", "Please select a product")
+                return
+            line = self.invoices.line(product, self.quantity_var.get())
+            _, product_name, quantity, price, gst_rate = line
             
-            # Add to treeview
-            self.items_tree.insert("", tk.END, values=(
-                product_name,
-                quantity,
-                f"{price:.2f}",
-                f"{gst_rate}%",
-                f"{gst_amount:.2f}",
-                f"{total:.2f}"
-            ))
+            self.invoice_lines.append(line)
+            self.items_tree.insert("", tk.END, values=(product_name, quantity, f"{price:.2f}", f"{gst_rate}%", "", ""))
             
             # Update totals
             self.update_totals()
@@ -139,113 +178,45 @@ class BillingModule:
         except Exception as e:
             messagebox.showerror("Error", str(e))
     
+    def get_place_of_supply(self):
+        """State code of the selected customer, falling back to their GSTIN"""
+        return self.invoices.place_of_supply(self.selected_customer())
+    
+    def compute_line_taxes(self):
+        """Price all current invoice lines in one batch"""
+        return self.invoices.price(self.selected_customer(), self.invoice_lines)
+    
     def update_totals(self):
-        """Update invoice totals"""
-        subtotal = 0
-        cgst = 0
-        sgst = 0
-        
-        for item in self.items_tree.get_children():
-            values = self.items_tree.item(item)['values']
-            item_total = float(values[5])
-            gst_amount = float(values[4])
-            
-            subtotal += item_total - gst_amount
-            cgst += gst_amount / 2
-            sgst += gst_amount / 2
-        
-        total = subtotal + cgst + sgst
-        
-        self.subtotal_var.set(f"{subtotal:.2f}")
-        self.cgst_var.set(f"{cgst:.2f}")
-        self.sgst_var.set(f"{sgst:.2f}")
-        self.total_var.set(f"{total:.2f}")
+        """Update invoice line amounts and totals"""
+        taxes = self.compute_line_taxes()
+        
+        for item, gst_amount, total in zip(self.items_tree.get_children(), taxes['gst'], taxes['total']):
+            self.items_tree.set(item, "GST Amount", f"{gst_amount:.2f}")
+            self.items_tree.set(item, "Total", f"{total:.2f}")
+        
+        totals = tax_engine.summarize(taxes)
+        self.subtotal_var.set(f"{totals['taxable']:.2f}")
+        self.cgst_var.set(f"{totals['cgst']:.2f}")
+        self.sgst_var.set(f"{totals['sgst']:.2f}")
+        self.igst_var.set(f"{totals['igst']:.2f}")
+        self.total_var.set(f"{totals['total']:.2f}")
     
     def generate_invoice(self):
         """Generate and save invoice"""
         try:
-            # Create invoices directory if it doesn't exist
-            os.makedirs("invoices", exist_ok=True)
-            
-            # Generate invoice number
-            invoice_number = f"INV-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-            
-            # Get customer details
-            customer_name = self.customer_var.get()
-            self.cursor.execute("""
-                SELECT id, gstin, address FROM customers WHERE name = ?
-            """, (customer_name,))
-            customer_id, gstin, address = self.cursor.fetchone()
-            
-            # Create PDF
-            pdf_path = os.path.join("invoices", f"{invoice_number}.pdf")
-            c = canvas.Canvas(pdf_path, pagesize=letter)
-            
-            # Add invoice header
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(50, 750, "INVOICE")
-            
-            # Add invoice details
-            c.setFont("Helvetica", 12)
-            c.drawString(50, 720, f"Invoice Number: {invoice_number}")
-            c.drawString(50, 700, f"Date: {datetime.now().strftime('%Y-%m-%d')}")
-            
-            # Add customer details
-            c.drawString(50, 670, f"Customer: {customer_name}")
-            c.drawString(50, 650, f"GSTIN: {gstin}")
-            c.drawString(50, 630, f"Address: {address}")
-            
-            # Add items table
-            y = 580
-            c.drawString(50, y, "Product")
-            c.drawString(200, y, "Qty")
-            c.drawString(250, y, "Price")
-            c.drawString(300, y, "GST")
-            c.drawString(350, y, "Total")
-            
-            y -= 20
-            for item in self.items_tree.get_children():
-                values = self.items_tree.item(item)['values']
-                c.drawString(50, y, values[0])
-                c.drawString(200, y, str(values[1]))
-                c.drawString(250, y, values[2])
-                c.drawString(300, y, values[4])
-                c.drawString(350, y, values[5])
-                y -= 20
-            
-            # Add totals
-            y -= 20
-            c.drawString(250, y, "Subtotal:")
-            c.drawString(350, y, self.subtotal_var.get())
-            y -= 20
-            c.drawString(250, y, "CGST:")
-            c.drawString(350, y, self.cgst_var.get())
-            y -= 20
-            c.drawString(250, y, "SGST:")
-            c.drawString(350, y, self.sgst_var.get())
-            y -= 20
-            c.drawString(250, y, "Total:")
-            c.drawString(350, y, self.total_var.get())
-            
-            c.save()
-            
-            # Save to database
-            self.cursor.execute("""
-                INSERT INTO invoices (
-                    invoice_number, customer_id, invoice_date,
-                    total_amount, cgst_amount, sgst_amount, status
-                ) VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                invoice_number, customer_id, datetime.now().date(),
-                float(self.total_var.get()),
-                float(self.cgst_var.get()),
-                float(self.sgst_var.get()),
-                "PAID"
-            ))
-            
-            self.conn.commit()
-            
-            messagebox.showinfo("Success", f"Invoice generated successfully: {pdf_path}")
+            if not self.invoice_lines:
+                messagebox.showwarning("Warning", "Please add items to the invoice")
+                return
+            customer = self.selected_customer()
+            if customer is None:
+                messagebox.showwarning("Warning", "Please select a customer")
+                return
+            
+            # Saves header, line items and stock decrements in one
+            # transaction, then renders the PDF
+            invoice = self.invoices.create(customer, self.invoice_lines)
+            
+            messagebox.showinfo("Success", f"Invoice generated successfully: {invoice['pdf_path']}")
             self.clear_invoice()
             
         except Exception as e:
@@ -254,5 +225,6 @@ class BillingModule:
     def clear_invoice(self):
         """Clear the current invoice"""
         self.items_tree.delete(*self.items_tree.get_children())
+        self.invoice_lines = []
         self.update_totals()
         self.quantity_var.set("1") 
\ No newline at end of file
@@ -0,0 +1,440 @@
+import gzip
+import json
+import uuid
+from datetime import datetime
+
+import tax_rollup
+
+FORMAT = "gstbill-changes"
+VERSION = 2
+# Version 1 batches only ever refer to rows of the exporting branch
+READABLE_VERSIONS = (1, VERSION)
+
+# Columns carried for each table, in the order batches are applied (parents
+# before children). Stock levels stay out: each branch keeps its own.
+COLUMNS = {
+    'customers': ('name', 'gstin', 'address', 'phone', 'email', 'state_code'),
+    'products': ('name', 'hsn_code', 'gst_rate', 'price', 'min_stock_level'),
+    'invoices': ('invoice_number', 'customer_id', 'invoice_date', 'place_of_supply', 'supply_type',
+                 'total_amount', 'cgst_amount', 'sgst_amount', 'igst_amount', 'status'),
+    'invoice_items': ('invoice_id', 'product_id', 'quantity', 'price', 'gst_rate', 'gst_amount', 'total_amount'),
+}
+
+# Columns holding ids of another synced table, translated to local ids on
+# import. A row the exporting branch got from another branch is referred to
+# as [that branch, its id there], since it is not in the batch.
+REFERENCES = {
+    'invoices': {'customer_id': 'customers'},
+    'invoice_items': {'invoice_id': 'invoices', 'product_id': 'products'},
+}
+
+# Master data can be edited at more than one branch, so conflicting edits are
+# settled by a rule. Invoices belong to the branch that raised them.
+MASTER_TABLES = ('customers', 'products')
+
+# How a row of master data first seen from another branch is matched to one
+# already here: customers by GSTIN, else by name; products by name
+NATURAL_KEYS = {'customers': ('gstin', 'name'), 'products': ('name',)}
+
+# Master data still referenced by (table, column) is never deleted by a sync
+IN_USE = {'customers': ('invoices', 'customer_id'), 'products': ('invoice_items', 'product_id')}
+
+# newer: the later edit wins; theirs: the incoming edit always wins; ours:
+# local edits always win. changed_at is in whole seconds, so under newer a
+# tie goes to the branch with the greater id, which both sides agree on.
+RULES = ('newer', 'theirs', 'ours')
+
+# Rows per IN (...) lookup
+CHUNK = 500
+
+
+def branch_id(cursor):
+    """This database's branch id, generated and stored the first time it is needed
+
+    Set a readable one before the first export with
+    ``python migrations.py --set branch_id=PUNE``.
+    """
+    cursor.execute("SELECT value FROM settings WHERE key = 'branch_id'")
+    row = cursor.fetchone()
+    if row and row[0]:
+        return row[0]
+    value = uuid.uuid4().hex[:12]
+    cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('branch_id', ?)", (value,))
+    return value
+
+
+def chunks(values, size=CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def changed_rows(conn, table, since, until):
+    """(seq, changed_at, id, values or None if deleted) for local changes in (since, until]
+
+    Several changes to one row collapse into its current state at the
+    sequence number of the last of them. References to rows imported from
+    another branch, and never changed here up to ``until``, are given as
+    [branch, id] (see REFERENCES).
+    """
+    columns = ", ".join(f"t.{column}" for column in COLUMNS[table])
+    references = REFERENCES.get(table, {})
+    # One link is enough when a row stands for rows of several branches
+    origins = "".join(f""",
+        (SELECT json_array(s.origin, s.remote_id) FROM sync_rows s
+         WHERE s.table_name = '{target}' AND s.local_id = t.{column}
+           AND NOT EXISTS (SELECT 1 FROM change_log c
+                           WHERE c.table_name = '{target}' AND c.row_id = t.{column}
+                             AND c.origin IS NULL AND c.seq <= :until)
+         ORDER BY s.origin
+         LIMIT 1)""" for column, target in references.items())
+    # With MAX() SQLite takes the bare changed_at from the row holding the maximum
+    rows = conn.execute(f"""
+        WITH changed AS (
+            SELECT row_id, MAX(seq) AS seq, changed_at
+            FROM change_log
+            WHERE seq > :since AND seq <= :until AND table_name = :table AND origin IS NULL
+            GROUP BY row_id
+        )
+        SELECT changed.seq, changed.changed_at, changed.row_id, t.id IS NOT NULL, {columns}{origins}
+        FROM changed
+        LEFT JOIN {table} t ON t.id = changed.row_id
+        ORDER BY changed.seq
+    """, {'since': since, 'until': until, 'table': table})
+    positions = [COLUMNS[table].index(column) for column in references]
+    for seq, changed_at, row_id, exists, *values in rows:
+        if not exists:
+            yield seq, changed_at, row_id, None
+            continue
+        values, links = values[:len(COLUMNS[table])], values[len(COLUMNS[table]):]
+        for position, link in zip(positions, links):
+            if link is not None:
+                values[position] = json.loads(link)
+        yield seq, changed_at, row_id, values
+
+
+def export_changes(db, path, since=None):
+    """Write this branch's changes after ``since`` to a gzipped JSON lines file
+
+    ``since`` defaults to where the previous export stopped. The first line
+    is a header with the branch id and the (since, until] sequence range;
+    every further line is one row: [table, seq, changed_at, id, values], with
+    values null for a deleted row (see changed_rows for references). Only changes made here are exported, not
+    ones imported from other branches. Returns the header.
+    """
+    origin = db.write(branch_id).result()
+    if since is None:
+        since = int(db.get_setting('sync_exported_seq', 0))
+    with db.reader() as conn:
+        # One read transaction so every table is read at the same point
+        conn.execute("BEGIN")
+        until = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        header = {'format': FORMAT, 'version': VERSION, 'origin': origin, 'since': since, 'until': until,
+                  'exported_at': datetime.now().isoformat(timespec='seconds'),
+                  'columns': {table: list(columns) for table, columns in COLUMNS.items()}, 'counts': {}}
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps(header) + "\n")
+            for table in COLUMNS:
+                count = 0
+                for seq, changed_at, row_id, values in changed_rows(conn, table, since, until):
+                    f.write(json.dumps([table, seq, changed_at, row_id, values], separators=(',', ':')) + "\n")
+                    count += 1
+                header['counts'][table] = count
+    db.set_setting('sync_exported_seq', str(until)).result()
+    return header
+
+
+def read_changes(path):
+    """Header and row list of an exported batch"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header.get('format') != FORMAT:
+            raise ValueError(f"{path} is not a change batch")
+        columns = {table: list(columns) for table, columns in COLUMNS.items()}
+        if header.get('version') not in READABLE_VERSIONS or header.get('columns') != columns:
+            raise ValueError(f"{path} was exported by a different version of the application")
+        return header, [json.loads(line) for line in f if line.strip()]
+
+
+def import_changes(db, path, rule='newer'):
+    """Apply a batch exported by another branch in one transaction
+
+    ``rule`` (see RULES) settles master data edited both here and there, or
+    a dict of rules per table. Returns counts per table.
+    """
+    header, rows = read_changes(path)
+    rules = rule if isinstance(rule, dict) else dict.fromkeys(MASTER_TABLES, rule)
+    for table in MASTER_TABLES:
+        if rules.setdefault(table, 'newer') not in RULES:
+            raise ValueError(f"Conflict rule must be one of {', '.join(RULES)}, not {rules[table]!r}")
+    return db.write(apply_changes, header, rows, rules).result()
+
+
+def apply_changes(cursor, header, rows, rules):
+    """Apply a change batch inside the caller's transaction and return counts per table
+
+    Rows of another branch get local ids of their own, recorded in
+    sync_rows, and references between them are translated. Imported invoices
+    are added to the tax rollup but do not move local stock. Batches from a
+    branch must be imported in order; rows already imported are skipped.
+    """
+    origin = header['origin']
+    if origin == branch_id(cursor):
+        raise ValueError("This batch was exported by this branch")
+    cursor.execute("SELECT last_seq FROM sync_peers WHERE origin = ?", (origin,))
+    row = cursor.fetchone()
+    last_seq = row[0] if row else 0
+    if header['since'] > last_seq:
+        raise ValueError(f"Changes {last_seq + 1} to {header['since']} of branch {origin} have not been "
+                         f"imported yet; export again from {last_seq}")
+    stats = {table: {'inserted': 0, 'updated': 0, 'deleted': 0, 'conflicts': 0} for table in COLUMNS}
+    if header['until'] <= last_seq:
+        return stats
+
+    changes = {table: [] for table in COLUMNS}
+    for table, seq, changed_at, row_id, values in rows:
+        if seq > last_seq:
+            changes[table].append((changed_at, row_id, values))
+    mapping = {table: {} for table in COLUMNS}
+    cursor.execute("SELECT table_name, remote_id, local_id FROM sync_rows WHERE origin = ?", (origin,))
+    for table, remote_id, local_id in cursor.fetchall():
+        mapping[table][remote_id] = local_id
+
+    cursor.execute("INSERT INTO sync_applying (origin) VALUES (?)", (origin,))
+    # Take the invoices concerned out of the rollup and add them back as they end up
+    tax_rollup.apply(cursor, invoice_states(cursor, touched_invoices(cursor, changes, mapping)), sign=-1)
+    taken = []
+    for table in COLUMNS:
+        upsert_rows(cursor, origin, table, changes[table], mapping, rules.get(table), stats[table], taken)
+    for table in reversed(list(COLUMNS)):
+        delete_rows(cursor, origin, table, changes[table], mapping, rules.get(table), stats[table])
+    tax_rollup.apply(cursor, invoice_states(cursor, touched_invoices(cursor, changes, mapping)))
+    cursor.execute("DELETE FROM sync_applying")
+
+    # Local edits from here on are what count as conflicts next time
+    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log")
+    synced_seq = cursor.fetchone()[0]
+    cursor.executemany("UPDATE sync_rows SET synced_seq = ? WHERE origin = ? AND table_name = ? AND remote_id = ?",
+                       [(synced_seq, origin, table, remote_id) for table, remote_id in taken])
+    cursor.execute("""
+        INSERT INTO sync_peers (origin, last_seq) VALUES (?, ?)
+        ON CONFLICT (origin) DO UPDATE SET last_seq = excluded.last_seq, imported_at = CURRENT_TIMESTAMP
+    """, (origin, header['until']))
+    return stats
+
+
+def referenced_id(cursor, target, value, mapping):
+    """Local id of the ``target`` row a reference in a batch stands for, or None if there is none yet"""
+    if not isinstance(value, list):
+        return mapping[target].get(value)
+    origin, remote_id = value
+    if origin == branch_id(cursor):
+        # A row this branch passed on comes back as itself
+        cursor.execute(f"SELECT id FROM {target} WHERE id = ?", (remote_id,))
+    else:
+        cursor.execute("SELECT local_id FROM sync_rows WHERE origin = ? AND table_name = ? AND remote_id = ?",
+                       (origin, target, remote_id))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def touched_invoices(cursor, changes, mapping):
+    """Local ids of the invoices a batch adds, changes or removes lines of"""
+    invoice_ids = mapping['invoices']
+    ids = {invoice_ids[row_id] for _, row_id, _ in changes['invoices'] if row_id in invoice_ids}
+    position = COLUMNS['invoice_items'].index('invoice_id')
+    items = []
+    for _, row_id, values in changes['invoice_items']:
+        invoice_id = values and referenced_id(cursor, 'invoices', values[position], mapping)
+        if invoice_id is not None:
+            ids.add(invoice_id)
+        if row_id in mapping['invoice_items']:
+            items.append(mapping['invoice_items'][row_id])
+    for chunk in chunks(items):
+        cursor.execute(f"SELECT DISTINCT invoice_id FROM invoice_items WHERE id IN ({', '.join('?' * len(chunk))})",
+                       chunk)
+        ids.update(row[0] for row in cursor.fetchall())
+    return ids
+
+
+def invoice_states(cursor, invoice_ids):
+    """Invoices that count towards the rollup, as dicts for tax_rollup.apply"""
+    invoices = {}
+    for chunk in chunks(invoice_ids):
+        placeholders = ", ".join("?" * len(chunk))
+        cursor.execute(f"""
+            SELECT id, invoice_date, place_of_supply, supply_type, igst_amount, total_amount, cgst_amount, sgst_amount
+            FROM invoices
+            WHERE id IN ({placeholders}) AND COALESCE(status, '') != 'CANCELLED'
+        """, chunk)
+        for invoice_id, invoice_date, place_of_supply, supply_type, igst, total, cgst, sgst in cursor.fetchall():
+            invoices[invoice_id] = {'invoice_date': invoice_date, 'place_of_supply': place_of_supply,
+                                    'supply_type': supply_type or ('INTER' if igst else 'INTRA'),
+                                    'totals': {'total': total, 'cgst': cgst, 'sgst': sgst, 'igst': igst}, 'items': []}
+        cursor.execute(f"""
+            SELECT invoice_id, product_id, quantity, price, gst_rate, gst_amount, total_amount
+            FROM invoice_items
+            WHERE invoice_id IN ({placeholders})
+        """, chunk)
+        for row in cursor.fetchall():
+            if row[0] in invoices:
+                invoices[row[0]]['items'].append(row[1:])
+    return list(invoices.values())
+
+
+def local_values(cursor, table, local_id):
+    cursor.execute(f"SELECT {', '.join(COLUMNS[table])} FROM {table} WHERE id = ?", (local_id,))
+    row = cursor.fetchone()
+    return list(row) if row else None
+
+
+def local_edit(cursor, origin, table, local_id, remote_id):
+    """changed_at of the latest local change to a row since it was last synced from ``origin``, or None"""
+    cursor.execute("""
+        SELECT changed_at FROM change_log
+        WHERE table_name = ? AND row_id = ? AND origin IS NULL
+          AND seq > COALESCE((SELECT synced_seq FROM sync_rows
+                              WHERE origin = ? AND table_name = ? AND remote_id = ?), 0)
+        ORDER BY seq DESC
+        LIMIT 1
+    """, (table, local_id, origin, table, remote_id))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def natural_match(cursor, table, values, mapped):
+    """Id of a local row that is the same customer or product, not yet linked to the branch"""
+    for key in NATURAL_KEYS[table]:
+        value = values[COLUMNS[table].index(key)]
+        if value is None:
+            continue
+        cursor.execute(f"SELECT id FROM {table} WHERE {key} = ? ORDER BY id", (value,))
+        for (local_id,) in cursor.fetchall():
+            if local_id not in mapped:
+                return local_id
+        return None
+    return None
+
+
+def keep_ours(cursor, origin, table, local_id, remote_id, changed_at, values, rule, stats):
+    """Whether a local edit to master data wins over the incoming one; conflicts are recorded"""
+    current = local_values(cursor, table, local_id)
+    if current == values:
+        return False
+    edited_at = local_edit(cursor, origin, table, local_id, remote_id)
+    if edited_at is None:
+        return False
+    ours = rule == 'ours' or (rule == 'newer' and (edited_at, branch_id(cursor)) > (changed_at, origin))
+    record_conflict(cursor, origin, table, local_id, 'local' if ours else 'remote', current, values, stats)
+    return ours
+
+
+def record_conflict(cursor, origin, table, local_id, kept, current, values, stats):
+    cursor.execute("""
+        INSERT INTO sync_conflicts (origin, table_name, local_id, kept, local_values, remote_values)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, (origin, table, local_id, kept, json.dumps(current), json.dumps(values)))
+    stats['conflicts'] += 1
+
+
+def upsert_rows(cursor, origin, table, changes, mapping, rule, stats, taken):
+    columns = COLUMNS[table]
+    inserts, updates = [], []
+    for changed_at, remote_id, values in changes:
+        if values is None:
+            continue
+        for column, target in REFERENCES.get(table, {}).items():
+            position = columns.index(column)
+            if values[position] is not None:
+                local_reference = referenced_id(cursor, target, values[position], mapping)
+                if local_reference is None:
+                    owner, referenced = values[position] if isinstance(values[position], list) else (
+                        origin, values[position])
+                    raise ValueError(f"{table} row {remote_id} of branch {origin} refers to {target} row "
+                                     f"{referenced} of branch {owner}, which has not been imported")
+                values[position] = local_reference
+        local_id = mapping[table].get(remote_id)
+        if table in MASTER_TABLES:
+            if local_id is None:
+                local_id = natural_match(cursor, table, values, set(mapping[table].values()))
+                if local_id is not None:
+                    mapping[table][remote_id] = local_id
+                    cursor.execute("""
+                        INSERT INTO sync_rows (origin, table_name, remote_id, local_id) VALUES (?, ?, ?, ?)
+                    """, (origin, table, remote_id, local_id))
+            if local_id is not None:
+                if local_values(cursor, table, local_id) is None:
+                    # Deleted here since it was linked; bring it back as a new row
+                    del mapping[table][remote_id]
+                    local_id = None
+                elif keep_ours(cursor, origin, table, local_id, remote_id, changed_at, values, rule, stats):
+                    continue
+        taken.append((table, remote_id))
+        if local_id is None:
+            inserts.append((remote_id, values))
+        else:
+            updates.append(values + [local_id])
+
+    if table == 'invoices' and inserts:
+        position = columns.index('invoice_number')
+        for chunk in chunks(values[position] for _, values in inserts):
+            cursor.execute(f"""
+                SELECT invoice_number FROM invoices WHERE invoice_number IN ({', '.join('?' * len(chunk))})
+            """, chunk)
+            taken_numbers = [row[0] for row in cursor.fetchall()]
+            if taken_numbers:
+                raise ValueError(f"Invoice {taken_numbers[0]} of branch {origin} is already used here; give each "
+                                 f"branch its own series (migrations.py --set invoice_series=...)")
+
+    # Ids are allocated up front, past any ever used, so inserts can be batched
+    cursor.execute(f"""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0), COALESCE(MAX(id), 0)) FROM {table}
+    """, (table,))
+    next_id = cursor.fetchone()[0] + 1
+    for offset, (remote_id, _) in enumerate(inserts):
+        mapping[table][remote_id] = next_id + offset
+    cursor.executemany(f"INSERT INTO {table} (id, {', '.join(columns)}) VALUES (?{', ?' * len(columns)})",
+                       [[next_id + offset] + values for offset, (_, values) in enumerate(inserts)])
+    cursor.executemany("""
+        INSERT OR REPLACE INTO sync_rows (origin, table_name, remote_id, local_id) VALUES (?, ?, ?, ?)
+    """, [(origin, table, remote_id, next_id + offset) for offset, (remote_id, _) in enumerate(inserts)])
+    cursor.executemany(f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+                       updates)
+    stats['inserted'] += len(inserts)
+    stats['updated'] += len(updates)
+
+
+def delete_rows(cursor, origin, table, changes, mapping, rule, stats):
+    deleted = []
+    for changed_at, remote_id, values in changes:
+        local_id = mapping[table].get(remote_id)
+        if values is not None or local_id is None:
+            continue
+        current = local_values(cursor, table, local_id) if table in MASTER_TABLES else None
+        if current is not None:
+            referencing_table, column = IN_USE[table]
+            cursor.execute(f"SELECT 1 FROM {referencing_table} WHERE {column} = ? LIMIT 1", (local_id,))
+            if cursor.fetchone() is not None:
+                # Invoices here still refer to it
+                record_conflict(cursor, origin, table, local_id, 'local', current, None, stats)
+                continue
+            if keep_ours(cursor, origin, table, local_id, remote_id, changed_at, None, rule, stats):
+                continue
+        deleted.append((remote_id, local_id))
+        del mapping[table][remote_id]
+    cursor.executemany(f"DELETE FROM {table} WHERE id = ?", [(local_id,) for _, local_id in deleted])
+    cursor.executemany("DELETE FROM sync_rows WHERE origin = ? AND table_name = ? AND remote_id = ?",
+                       [(origin, table, remote_id) for remote_id, _ in deleted])
+    stats['deleted'] += len(deleted)
+
+
+def status(db):
+    """This branch's id and position, and what has been imported from each other branch"""
+    origin = db.write(branch_id).result()
+    with db.reader() as conn:
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        peers = conn.execute("SELECT origin, last_seq, imported_at FROM sync_peers ORDER BY origin").fetchall()
+        conflicts = conn.execute("SELECT COUNT(*) FROM sync_conflicts").fetchone()[0]
+    return {'branch_id': origin, 'last_seq': last_seq, 'exported_seq': int(db.get_setting('sync_exported_seq', 0)),
+            'peers': [{'origin': origin, 'last_seq': seq, 'imported_at': at} for origin, seq, at in peers],
+            'conflicts': conflicts}
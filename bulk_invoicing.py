@@ -0,0 +1,293 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+import tax_engine
+import invoice_numbers
+import invoice_pdf
+import invoice_store
+from db import Database
+
+
+def read_orders(path):
+    """Stream orders from a CSV or JSONL file
+
+    CSV files have one row per line item with ``order_id``, ``customer``,
+    ``product``, ``quantity`` and optional ``invoice_date``/``invoice_number``
+    columns; rows of the same order must be contiguous. JSONL files have one
+    order per line with the same header fields and an ``items`` list of
+    ``{"product": ..., "quantity": ...}`` objects.
+    """
+    if path.lower().endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with open(path, newline='', encoding='utf-8') as f:
+        for order_id, rows in itertools.groupby(csv.DictReader(f), key=lambda row: row['order_id']):
+            rows = list(rows)
+            yield {
+                'order_id': order_id,
+                'customer': rows[0]['customer'],
+                'invoice_date': rows[0].get('invoice_date') or None,
+                'invoice_number': rows[0].get('invoice_number') or None,
+                'items': [{'product': row['product'], 'quantity': row['quantity']} for row in rows],
+            }
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process and its finished children, in MB"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+class BulkInvoiceRun:
+    def __init__(self, db, seller_state_code=None, chunk_size=5000, render_pdfs=True,
+                 pdf_dir="invoices", workers=None, pdf_batch_size=200, series=None):
+        self.db = db
+        self.pending_write = None
+        self.seller_state_code = seller_state_code
+        self.chunk_size = chunk_size
+        self.render_pdfs = render_pdfs
+        self.pdf_dir = pdf_dir
+        self.workers = workers or os.cpu_count()
+        self.pdf_batch_size = pdf_batch_size
+        # Invoice series for orders without a number (default: the invoice_series setting)
+        self.series = series and invoice_numbers.check_series(series)
+        self.stats = {'orders': 0, 'invoices': 0, 'lines': 0, 'rejected': 0, 'pdfs': 0}
+        self.errors = []
+
+    def load_master_data(self):
+        """Load customers and products once, keyed by name"""
+        self.seller = invoice_pdf.seller_details(self.db)
+        with self.db.reader() as conn:
+            self.customers = {row[0]: row[1:] for row in conn.execute(
+                "SELECT name, id, gstin, address, state_code FROM customers")}
+            self.products = {row[0]: row[1:] for row in conn.execute(
+                "SELECT name, id, price, gst_rate FROM products")}
+
+    def reject(self, order, reason):
+        """Record an order that could not be invoiced"""
+        self.stats['rejected'] += 1
+        self.errors.append(f"{order.get('order_id')}: {reason}")
+
+    def price_chunk(self, orders):
+        """Resolve and price a chunk of orders in one vectorized pass"""
+        invoices = []
+        prices, quantities, rates, inter_state, invoice_index, line_refs = [], [], [], [], [], []
+
+        for order in orders:
+            customer = self.customers.get(order['customer'])
+            if customer is None:
+                self.reject(order, f"unknown customer {order['customer']!r}")
+                continue
+            invoice_date = order.get('invoice_date') or datetime.now().strftime('%Y-%m-%d')
+            try:
+                # The date decides the financial year the number is taken from
+                invoice_numbers.financial_year(invoice_date)
+                items = [(self.products[item['product']], item['product'], int(item['quantity']))
+                         for item in order['items']]
+            except KeyError as e:
+                self.reject(order, f"unknown product {e.args[0]!r}")
+                continue
+            except ValueError as e:
+                self.reject(order, str(e))
+                continue
+
+            customer_id, gstin, address, state_code = customer
+            place_of_supply = state_code or tax_engine.state_code_from_gstin(gstin)
+            is_inter_state = tax_engine.is_inter_state(self.seller_state_code, place_of_supply)
+            position = len(invoices)
+            invoices.append({
+                'invoice_number': order.get('invoice_number'),
+                'series': self.series,
+                'invoice_date': invoice_date,
+                'customer_id': customer_id,
+                'place_of_supply': place_of_supply,
+                'supply_type': 'INTER' if is_inter_state else 'INTRA',
+                'customer_name': order['customer'],
+                'gstin': gstin,
+                'address': address,
+            })
+            for (product_id, price, gst_rate), product_name, quantity in items:
+                prices.append(price)
+                quantities.append(quantity)
+                rates.append(gst_rate)
+                inter_state.append(is_inter_state)
+                invoice_index.append(position)
+                line_refs.append((product_id, product_name))
+
+        taxes = tax_engine.compute_line_taxes(prices, quantities, rates, inter_state)
+        totals = tax_engine.summarize_by_invoice(taxes, invoice_index, len(invoices))
+        for position, invoice in enumerate(invoices):
+            invoice['totals'] = {key: float(values[position]) for key, values in totals.items()}
+            invoice['lines'] = []
+            invoice['items'] = []
+
+        for i, position in enumerate(invoice_index):
+            product_id, product_name = line_refs[i]
+            gst_amount, total = float(taxes['gst'][i]), float(taxes['total'][i])
+            invoices[position]['items'].append((product_id, quantities[i], prices[i], rates[i], gst_amount, total))
+            invoices[position]['lines'].append((product_name, quantities[i], prices[i], gst_amount, total))
+
+        return invoices
+
+    def write_chunk(self, invoices):
+        """Queue a chunk of invoices, line items and stock decrements as one write
+
+        The previous chunk is awaited first and returned, so pricing the next
+        chunk overlaps with the writer thread committing this one. Invoice
+        numbers are taken as one block per chunk inside that transaction, so
+        the series has no gaps even if a chunk fails.
+        """
+        committed = self.finish_write()
+        self.pending_write = (self.db.write(invoice_store.insert_invoices, invoices), invoices)
+        self.stats['invoices'] += len(invoices)
+        self.stats['lines'] += sum(len(invoice['items']) for invoice in invoices)
+        return committed
+
+    def finish_write(self):
+        """Wait for the last queued chunk to commit and return it, re-raising any error"""
+        if self.pending_write is None:
+            return []
+        future, invoices = self.pending_write
+        self.pending_write = None
+        future.result()
+        return invoices
+
+    def pdf_jobs(self, invoices):
+        """Split a chunk into (pdf_path, invoice) batches for the worker pool"""
+        jobs = [
+            (os.path.join(self.pdf_dir, invoice_pdf.file_name(invoice['invoice_number'])),
+             {key: invoice[key] for key in ('invoice_number', 'invoice_date', 'customer_name',
+                                            'gstin', 'address', 'lines', 'totals')})
+            for invoice in invoices
+        ]
+        for start in range(0, len(jobs), self.pdf_batch_size):
+            yield jobs[start:start + self.pdf_batch_size]
+
+    def run(self, orders):
+        """Invoice every order from an iterable and return the run statistics"""
+        started = time.perf_counter()
+        self.load_master_data()
+        if self.render_pdfs:
+            os.makedirs(self.pdf_dir, exist_ok=True)
+
+        pending = set()
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.render_pdfs else None
+        try:
+            orders = iter(orders)
+            while True:
+                chunk = list(itertools.islice(orders, self.chunk_size))
+                if not chunk:
+                    break
+                self.stats['orders'] += len(chunk)
+                invoices = self.price_chunk(chunk)
+                if not invoices:
+                    continue
+                # PDFs are rendered once a chunk has committed and so has its numbers
+                committed = self.write_chunk(invoices)
+                if executor is not None:
+                    pending = self.submit_pdfs(executor, pending, committed)
+
+            committed = self.finish_write()
+            if executor is not None:
+                pending = self.submit_pdfs(executor, pending, committed)
+            if pending:
+                done, pending = wait(pending)
+                self.collect_pdfs(done)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        self.stats['seconds'] = elapsed
+        self.stats['invoices_per_second'] = self.stats['invoices'] / elapsed if elapsed else 0.0
+        self.stats['peak_memory_mb'], self.stats['peak_worker_memory_mb'] = peak_memory_mb()
+        return self.stats
+
+    def submit_pdfs(self, executor, pending, invoices):
+        """Queue PDF batches for committed invoices and return the in-flight set"""
+        for batch in self.pdf_jobs(invoices):
+            # Keep the number of in-flight batches bounded so memory
+            # does not grow with the size of the order file
+            while len(pending) >= self.workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                self.collect_pdfs(done)
+            pending.add(executor.submit(invoice_pdf.render_invoice_batch, batch, self.seller))
+        return pending
+
+    def collect_pdfs(self, futures):
+        """Count finished PDF batches, re-raising any worker error"""
+        for future in futures:
+            self.stats['pdfs'] += len(future.result())
+
+
+def format_report(stats, errors):
+    """Human readable summary of a bulk run"""
+    lines = [
+        f"Orders read:       {stats['orders']}",
+        f"Invoices written:  {stats['invoices']} ({stats['lines']} lines)",
+        f"PDFs rendered:     {stats['pdfs']}",
+        f"Rejected orders:   {stats['rejected']}",
+        f"Elapsed:           {stats['seconds']:.2f} s",
+        f"Throughput:        {stats['invoices_per_second']:.1f} invoices/sec",
+    ]
+    if stats['peak_memory_mb'] is not None:
+        lines.append(f"Peak memory:       {stats['peak_memory_mb']:.1f} MB "
+                     f"(largest PDF worker {stats['peak_worker_memory_mb']:.1f} MB)")
+    lines.extend(f"  rejected {error}" for error in errors[:20])
+    if len(errors) > 20:
+        lines.append(f"  ... and {len(errors) - 20} more")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate invoices in bulk from a CSV or JSONL order file")
+    parser.add_argument("orders", help="CSV (one row per line item) or JSONL (one order per line) file")
+    parser.add_argument("--db", default=os.path.join('data', 'gst_billing.db'), help="SQLite database path")
+    parser.add_argument("--seller-state", help="Two digit state code of the seller GSTIN "
+                                               "(default: from the seller_gstin setting)")
+    parser.add_argument("--series", help="Invoice series for orders without a number "
+                                         "(default: from the invoice_series setting)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Orders per database transaction")
+    parser.add_argument("--workers", type=int, help="PDF rendering processes (default: CPU count)")
+    parser.add_argument("--pdf-dir", default="invoices", help="Directory for rendered PDFs")
+    parser.add_argument("--no-pdf", action="store_true", help="Only write invoices, skip PDF rendering")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    try:
+        run = BulkInvoiceRun(
+            db,
+            seller_state_code=args.seller_state or tax_engine.state_code_from_gstin(db.get_setting('seller_gstin')),
+            chunk_size=args.chunk_size,
+            render_pdfs=not args.no_pdf,
+            pdf_dir=args.pdf_dir,
+            workers=args.workers,
+            series=args.series,
+        )
+        stats = run.run(read_orders(args.orders))
+    finally:
+        db.close()
+
+    print(format_report(stats, run.errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+"""Business logic without a user interface
+
+Everything in this package runs headless (batch servers, the gstbill CLI,
+benchmarks) and imports neither tkinter, reportlab nor pandas; the Tk tabs
+are views over these services. Invoice PDFs load reportlab when rendered.
+"""
+from core.customers import CustomerService
+from core.invoices import InvoiceService
+from core.products import ProductService
+from core.stock import StockService
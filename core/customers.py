@@ -0,0 +1,88 @@
+from master_data import MasterDataCache
+
+# Columns a customer is added or imported with
+FIELDS = ('name', 'gstin', 'address', 'phone', 'email', 'state_code')
+
+# GST state codes: 01 to 38 for the states and union territories, 97 for
+# Other Territory
+STATE_CODES = {f"{code:02d}" for code in range(1, 39)} | {"97"}
+
+
+def parse_state_code(value, gstin=None):
+    """Two digit state code from user input, else the GSTIN's (ValueError if not a state)"""
+    text = str(value).strip() if value is not None else ''
+    if not text:
+        # A registered customer's state is the first two digits of the GSTIN
+        text = gstin[:2] if gstin and gstin[:2].isdigit() else ''
+        if not text:
+            return None
+    if text.isdigit() and len(text) < 2:
+        text = text.zfill(2)
+    if text not in STATE_CODES:
+        raise ValueError(f"State code {text!r} is not a GST state code (01 to 38, or 97)")
+    return text
+
+
+class CustomerService:
+    """Look up, add, change and import customers
+
+    Reads go through the shared master data cache. Writes wait for their
+    commit and then announce the change on the cache, so every open view
+    refreshes just the rows concerned.
+    """
+
+    def __init__(self, db, master_data=None):
+        self.db = db
+        self.master_data = master_data or MasterDataCache(db)
+
+    def get(self, customer_id):
+        """Customer as a dict, or None"""
+        return self.master_data.get('customers', customer_id)
+
+    def find(self, key):
+        """Customer with this exact name, or else this id, or None"""
+        customer = self.master_data.by_name('customers', str(key))
+        if customer is None and str(key).isdigit():
+            customer = self.get(int(key))
+        return customer
+
+    def add(self, name, gstin=None, address=None, phone=None, email=None, state_code=None):
+        """Insert a customer and return its id"""
+        return self.import_rows([{'name': name, 'gstin': gstin, 'address': address,
+                                  'phone': phone, 'email': email, 'state_code': state_code}])[0]
+
+    def import_rows(self, rows):
+        """Insert customers (dicts with FIELDS) in one transaction; returns their ids"""
+        values = []
+        for row in rows:
+            if not row.get('name'):
+                raise ValueError("Customer name is required")
+            row = dict(row, state_code=parse_state_code(row.get('state_code'), row.get('gstin')))
+            values.append(tuple(row.get(field) for field in FIELDS))
+
+        def insert(cursor):
+            ids = []
+            for value in values:
+                cursor.execute(f"""
+                    INSERT INTO customers ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))})
+                """, value)
+                ids.append(cursor.lastrowid)
+            return ids
+
+        ids = self.db.write(insert).result()
+        self.master_data.changed('customers', ids)
+        return ids
+
+    def update(self, customer_id, gstin=None, address=None, phone=None, email=None, state_code=None):
+        """Change a customer's details (the name stays as it is)"""
+        state_code = parse_state_code(state_code, gstin)
+        self.db.execute("""
+            UPDATE customers
+            SET gstin = ?, address = ?, phone = ?, email = ?, state_code = ?
+            WHERE id = ?
+        """, (gstin, address, phone, email, state_code, customer_id)).result()
+        self.master_data.changed('customers', [customer_id])
+
+    def delete(self, customer_id):
+        self.db.execute("DELETE FROM customers WHERE id = ?", (customer_id,)).result()
+        self.master_data.changed('customers', [customer_id])
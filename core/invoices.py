@@ -0,0 +1,148 @@
+import os
+from datetime import date
+
+import invoice_store
+import tax_engine
+from master_data import MasterDataCache
+
+
+class InvoiceService:
+    """Price, save, render and cancel invoices
+
+    Lines are (product_id, name, quantity, price, gst_rate) tuples, as a
+    counter builds them up. The invoice number comes from the invoice
+    series when the invoice is saved.
+    """
+
+    def __init__(self, db, seller_state_code=None, master_data=None, pdf_dir="invoices"):
+        self.db = db
+        self.seller_state_code = seller_state_code
+        self.master_data = master_data or MasterDataCache(db)
+        self.pdf_dir = pdf_dir
+
+    def line(self, product, quantity):
+        """Invoice line for ``quantity`` of a product row"""
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise ValueError(f"Quantity of {product['name']} must be positive")
+        return (product['id'], product['name'], quantity, product['price'], product['gst_rate'])
+
+    def place_of_supply(self, customer):
+        """State code of the customer, falling back to their GSTIN"""
+        if customer is None:
+            return None
+        return customer['state_code'] or tax_engine.state_code_from_gstin(customer['gstin'])
+
+    def price(self, customer, lines):
+        """Taxes of every line in one batch (see tax_engine.compute_line_taxes)"""
+        _, _, quantities, prices, rates = zip(*lines) if lines else ((),) * 5
+        inter_state = tax_engine.is_inter_state(self.seller_state_code, self.place_of_supply(customer))
+        return tax_engine.compute_line_taxes(prices, quantities, rates, inter_state)
+
+    def build(self, customer, lines, invoice_date=None):
+        """Price lines into an invoice ready for invoice_store.insert_invoices
+
+        Besides the database fields the invoice carries its PDF ``lines``
+        as (name, quantity, price, gst_amount, total).
+        """
+        if not lines:
+            raise ValueError("The invoice has no items")
+        if customer is None:
+            raise ValueError("The invoice has no customer")
+
+        # Price all lines once for both the database and the PDF
+        taxes = self.price(customer, lines)
+        items = []
+        pdf_lines = []
+        for (product_id, product_name, quantity, price, gst_rate), gst_amount, total in zip(
+                lines, taxes['gst'], taxes['total']):
+            items.append((product_id, quantity, price, gst_rate, float(gst_amount), float(total)))
+            pdf_lines.append((product_name, quantity, price, float(gst_amount), float(total)))
+
+        place_of_supply = self.place_of_supply(customer)
+        inter_state = tax_engine.is_inter_state(self.seller_state_code, place_of_supply)
+        return {
+            'invoice_date': str(invoice_date or date.today()),
+            'customer_id': customer['id'],
+            'place_of_supply': place_of_supply,
+            'supply_type': 'INTER' if inter_state else 'INTRA',
+            'totals': tax_engine.summarize(taxes),
+            'items': items,
+            'lines': pdf_lines,
+        }
+
+    def create(self, customer, lines, invoice_date=None, render_pdf=True):
+        """Save an invoice and its stock movements, then render its PDF
+
+        Returns the saved invoice dict with its ``invoice_number`` and, if
+        rendered, ``pdf_path``.
+        """
+        invoice = self.build(customer, lines, invoice_date)
+        self.db.write(invoice_store.insert_invoices, [invoice]).result()
+        self.saved(invoice)
+        if render_pdf:
+            invoice['pdf_path'] = self.render_pdf(invoice, customer)
+        return invoice
+
+    def saved(self, invoice):
+        """Announce the stock change of a committed invoice"""
+        self.master_data.changed('products', {item[0] for item in invoice['items']})
+
+    def render_pdf(self, invoice, customer):
+        """Write the PDF of a saved invoice and return its path"""
+        # reportlab is only needed here, not to save invoices
+        import invoice_pdf
+
+        os.makedirs(self.pdf_dir, exist_ok=True)
+        pdf_path = os.path.join(self.pdf_dir, invoice_pdf.file_name(invoice['invoice_number']))
+        invoice_pdf.render_invoice(pdf_path, {
+            'invoice_number': invoice['invoice_number'],
+            'invoice_date': invoice['invoice_date'],
+            'customer_name': customer['name'],
+            'gstin': customer['gstin'],
+            'address': customer['address'],
+            'lines': invoice['lines'],
+            'totals': invoice['totals'],
+        }, seller=invoice_pdf.seller_details(self.db))
+        return pdf_path
+
+    def find(self, invoice_number):
+        """Saved invoice with its customer and line items as a dict, or None"""
+        with self.db.reader() as conn:
+            row = conn.execute("""
+                SELECT i.id, i.invoice_number, i.invoice_date, i.customer_id, c.name, c.gstin, i.place_of_supply,
+                       i.supply_type, i.total_amount, i.cgst_amount, i.sgst_amount, i.igst_amount, i.status
+                FROM invoices i
+                LEFT JOIN customers c ON c.id = i.customer_id
+                WHERE i.invoice_number = ?
+            """, (invoice_number,)).fetchone()
+            if row is None:
+                return None
+            items = conn.execute("""
+                SELECT ii.product_id, p.name, ii.quantity, ii.price, ii.gst_rate, ii.gst_amount, ii.total_amount
+                FROM invoice_items ii
+                LEFT JOIN products p ON p.id = ii.product_id
+                WHERE ii.invoice_id = ?
+                ORDER BY ii.id
+            """, (row[0],)).fetchall()
+        invoice = dict(zip(('id', 'invoice_number', 'invoice_date', 'customer_id', 'customer_name', 'gstin',
+                            'place_of_supply', 'supply_type', 'total_amount', 'cgst_amount', 'sgst_amount',
+                            'igst_amount', 'status'), row))
+        invoice['items'] = [dict(zip(('product_id', 'name', 'quantity', 'price', 'gst_rate', 'gst_amount',
+                                      'total_amount'), item)) for item in items]
+        return invoice
+
+    def cancel(self, invoice_numbers):
+        """Cancel invoices by number; returns how many were cancelled"""
+        with self.db.reader() as conn:
+            rows = conn.execute(f"""
+                SELECT i.id, ii.product_id FROM invoices i
+                LEFT JOIN invoice_items ii ON ii.invoice_id = i.id
+                WHERE i.invoice_number IN ({', '.join('?' * len(invoice_numbers))})
+            """, list(invoice_numbers)).fetchall()
+        found = {row[0] for row in rows}
+        if not found:
+            return 0
+        cancelled = self.db.write(invoice_store.cancel_invoices, sorted(found)).result()
+        self.master_data.changed('products', {row[1] for row in rows if row[1] is not None})
+        return cancelled
@@ -0,0 +1,94 @@
+import stock_ledger
+from master_data import MasterDataCache
+
+# Columns a product is imported with; only name is required
+FIELDS = ('name', 'hsn_code', 'gst_rate', 'price', 'stock_quantity', 'min_stock_level')
+
+# GST slabs offered when entering a product
+GST_RATES = [0, 5, 12, 18, 28]
+
+
+def parse(row):
+    """Product fields from user input, with numbers converted (ValueError if malformed)"""
+    if not row.get('name'):
+        raise ValueError("Product name is required")
+    minimum = row.get('min_stock_level')
+    return {
+        'name': row['name'],
+        'hsn_code': row.get('hsn_code'),
+        'gst_rate': float(row.get('gst_rate') or 0),
+        'price': float(row.get('price') or 0),
+        'stock_quantity': int(row.get('stock_quantity') or 0),
+        'min_stock_level': 0 if minimum in (None, '') else int(minimum),
+    }
+
+
+class ProductService:
+    """Look up, add, change and import products
+
+    Stock is never written directly: opening stock and manual changes go
+    through the stock ledger as movements. Writes announce the products
+    they touched on the master data cache once committed.
+    """
+
+    def __init__(self, db, master_data=None):
+        self.db = db
+        self.master_data = master_data or MasterDataCache(db)
+
+    def get(self, product_id):
+        """Product as a dict, or None"""
+        return self.master_data.get('products', product_id)
+
+    def find(self, key):
+        """Product with this exact name, or else this id, or None"""
+        product = self.master_data.by_name('products', str(key))
+        if product is None and str(key).isdigit():
+            product = self.get(int(key))
+        return product
+
+    def add(self, name, hsn_code=None, gst_rate=0, price=0, stock_quantity=0, min_stock_level=None):
+        """Insert a product with its opening stock and return its id"""
+        return self.import_rows([{'name': name, 'hsn_code': hsn_code, 'gst_rate': gst_rate, 'price': price,
+                                  'stock_quantity': stock_quantity, 'min_stock_level': min_stock_level}])[0]
+
+    def import_rows(self, rows):
+        """Insert products (dicts with FIELDS) in one transaction; returns their ids"""
+        products = [parse(row) for row in rows]
+
+        def insert(cursor):
+            ids = []
+            for product in products:
+                # Starting stock goes in through the ledger as its opening entry
+                cursor.execute("""
+                    INSERT INTO products (name, hsn_code, gst_rate, price, stock_quantity, min_stock_level)
+                    VALUES (?, ?, ?, ?, 0, ?)
+                """, (product['name'], product['hsn_code'], product['gst_rate'], product['price'],
+                      product['min_stock_level']))
+                product_id = cursor.lastrowid
+                stock_ledger.set_stock(cursor, product_id, product['stock_quantity'], kind=stock_ledger.OPENING)
+                ids.append(product_id)
+            return ids
+
+        ids = self.db.write(insert).result()
+        self.master_data.changed('products', ids)
+        return ids
+
+    def update(self, product_id, hsn_code, gst_rate, price, stock_quantity):
+        """Change a product; a new stock figure is recorded as an adjustment"""
+        values = (hsn_code, float(gst_rate), float(price), product_id)
+        quantity = int(stock_quantity)
+
+        def update(cursor):
+            cursor.execute("""
+                UPDATE products
+                SET hsn_code = ?, gst_rate = ?, price = ?
+                WHERE id = ?
+            """, values)
+            stock_ledger.set_stock(cursor, product_id, quantity, reference="Manual adjustment")
+
+        self.db.write(update).result()
+        self.master_data.changed('products', [product_id])
+
+    def delete(self, product_id):
+        self.db.execute("DELETE FROM products WHERE id = ?", (product_id,)).result()
+        self.master_data.changed('products', [product_id])
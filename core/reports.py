@@ -0,0 +1,180 @@
+import calendar
+import os
+from datetime import date, datetime
+
+import gstr1
+import report_export
+import tax_engine
+import tax_rollup
+
+# Report queries are kept at module level so the schema check in
+# migrations.py can EXPLAIN exactly what the reports run
+GSTR1_QUERY = """
+    SELECT 
+        i.invoice_number,
+        i.invoice_date,
+        c.gstin,
+        c.name as customer_name,
+        p.hsn_code,
+        ii.quantity,
+        ii.price,
+        ii.gst_rate,
+        ii.gst_amount,
+        ii.total_amount
+    FROM invoices i
+    JOIN customers c ON i.customer_id = c.id
+    JOIN invoice_items ii ON i.id = ii.invoice_id
+    JOIN products p ON ii.product_id = p.id
+    WHERE i.invoice_date BETWEEN ? AND ?
+      AND COALESCE(i.status, '') != 'CANCELLED'
+    ORDER BY i.invoice_date
+"""
+
+GSTR2_QUERY = """
+    SELECT 
+        p.invoice_number,
+        p.invoice_date,
+        v.gstin,
+        v.name as vendor_name,
+        p.hsn_code,
+        p.quantity,
+        p.price,
+        p.gst_rate,
+        p.gst_amount,
+        p.total_amount
+    FROM purchases p
+    JOIN vendors v ON p.vendor_id = v.id
+    WHERE p.invoice_date BETWEEN ? AND ?
+    ORDER BY p.invoice_date
+"""
+
+# GSTR-3B reads the daily rollup maintained alongside invoice writes
+GSTR3B_QUERY = tax_rollup.SUMMARY_QUERY
+
+GSTR1_COLUMNS = [
+    'Invoice Number', 'Date', 'GSTIN', 'Customer Name',
+    'HSN Code', 'Quantity', 'Price', 'GST Rate', 'Taxable Value',
+    'GST Amount', 'CGST', 'SGST', 'IGST', 'Total Amount'
+]
+
+GSTR2_COLUMNS = [
+    'Invoice Number', 'Date', 'GSTIN', 'Vendor Name',
+    'HSN Code', 'Quantity', 'Price', 'GST Rate',
+    'GST Amount', 'Total Amount'
+]
+
+GSTR3B_COLUMNS = ['Total Taxable Value', 'Total CGST', 'Total SGST', 'Total IGST', 'Total Tax']
+
+
+def parse_period(text):
+    """(from, to) dates of a month ('2024-04'), a financial year ('FY2024-25')
+    or an explicit range ('2024-04-01:2024-06-30')"""
+    try:
+        if ':' in text:
+            first, last = (datetime.strptime(part.strip(), '%Y-%m-%d').date() for part in text.split(':', 1))
+        elif text.upper().startswith('FY'):
+            year = datetime.strptime(text[2:6], '%Y').year
+            if text[6:] != f"-{(year + 1) % 100:02d}":
+                raise ValueError
+            first, last = date(year, 4, 1), date(year + 1, 3, 31)
+        else:
+            first = datetime.strptime(text, '%Y-%m').date()
+            last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+    except ValueError:
+        raise ValueError(f"Period {text!r} is not a month (2024-04), financial year (FY2024-25) "
+                         f"or range (2024-04-01:2024-06-30)") from None
+    if first > last:
+        raise ValueError(f"Period {text!r} ends before it starts")
+    return first, last
+
+
+def gstr1_pages(conn, from_date, to_date, seller_state_code=None):
+    """Outward supplies, page by page, with the tax split appended"""
+    cursor = conn.execute(GSTR1_QUERY, (str(from_date), str(to_date)))
+    for page in report_export.iter_pages(cursor):
+        # Split the line tax into CGST/SGST/IGST by place of supply
+        _, _, gstins, _, _, quantities, prices, rates, _, _ = zip(*page)
+        inter_state = [
+            tax_engine.is_inter_state(seller_state_code, tax_engine.state_code_from_gstin(gstin))
+            for gstin in gstins
+        ]
+        taxes = tax_engine.compute_line_taxes(prices, quantities, rates, inter_state)
+        yield [
+            row[:8] + (float(taxable), row[8], float(cgst), float(sgst), float(igst), row[9])
+            for row, taxable, cgst, sgst, igst
+            in zip(page, taxes['taxable'], taxes['cgst'], taxes['sgst'], taxes['igst'])
+        ]
+
+
+def gstr2_pages(conn, from_date, to_date, seller_state_code=None):
+    """Inward supplies (purchases), page by page"""
+    return report_export.iter_pages(conn.execute(GSTR2_QUERY, (str(from_date), str(to_date))))
+
+
+def gstr3b_pages(conn, from_date, to_date, seller_state_code=None):
+    """Summary return as a single one-row page"""
+    paise = tax_rollup.summary(conn, from_date, to_date)
+    total_tax = sum(paise[1:])
+    yield [tuple(float(value) for value in tax_engine.to_rupees(paise)) + (float(tax_engine.to_rupees(total_tax)),)]
+
+
+# Report type -> (columns, pages(conn, from_date, to_date, seller_state_code))
+REPORTS = {
+    'GSTR1': (GSTR1_COLUMNS, gstr1_pages),
+    'GSTR2': (GSTR2_COLUMNS, gstr2_pages),
+    'GSTR3B': (GSTR3B_COLUMNS, gstr3b_pages),
+}
+
+
+def report_path(directory, name, tag=None):
+    """Time-stamped base path for a report file
+
+    ``tag`` (e.g. a job id) keeps apart files of the same report started
+    in the same second.
+    """
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(directory, f"{name}_{stamp}" + (f"_{tag}" if tag is not None else ""))
+
+
+def export_report(db, report_type, from_date, to_date, seller_state_code=None, formats=tuple(report_export.WRITERS),
+                  directory="reports", job=None, on_page=None, tag=None):
+    """Stream a report to one file per format; returns (paths, rows, seconds per format)
+
+    Rows go from the cursor to the writers a page at a time, so memory
+    stays bounded however long the period is. If a ``job`` (see jobs.py)
+    is given, cancelling it interrupts the query even mid-statement.
+    """
+    columns, pages = REPORTS[report_type]
+    with db.reader() as conn:
+        if job is not None:
+            job.on_cancel(conn.interrupt)
+        try:
+            return report_export.export_pages(pages(conn, from_date, to_date, seller_state_code), columns,
+                                              report_path(directory, report_type, tag), formats, on_page=on_page)
+        finally:
+            if job is not None:
+                job.remove_cancel_hook(conn.interrupt)
+
+
+def export_gstr1_portal(db, seller_gstin, from_date, to_date, directory="reports", job=None, tag=None):
+    """Aggregate B2B/B2CL/B2CS/HSN in SQL and write the portal JSON
+
+    Returns the path and the number of entries in each section.
+    """
+    path = report_path(directory, "GSTR1_portal", tag) + ".json"
+    os.makedirs(directory, exist_ok=True)
+    with db.reader() as conn:
+        if job is not None:
+            job.on_cancel(conn.interrupt)
+        try:
+            data = gstr1.GSTR1Builder(conn, seller_gstin).write_json(path, from_date, to_date)
+        finally:
+            if job is not None:
+                job.remove_cancel_hook(conn.interrupt)
+    counts = {
+        'b2b': sum(len(entry['inv']) for entry in data['b2b']),
+        'b2cl': sum(len(entry['inv']) for entry in data['b2cl']),
+        'b2cs': len(data['b2cs']),
+        'hsn': len(data['hsn']['data']),
+    }
+    return path, counts
@@ -0,0 +1,76 @@
+import stock_alerts
+import stock_ledger
+from master_data import MasterDataCache
+
+# Kept at module level so the schema check in migrations.py can EXPLAIN it
+MOVEMENT_QUERY = """
+    SELECT 
+        m.movement_date as date,
+        COALESCE(p.name, '#' || m.product_id) as product,
+        m.kind as type,
+        m.quantity,
+        m.reference
+    FROM stock_movements m
+    LEFT JOIN products p ON m.product_id = p.id
+    WHERE m.movement_date BETWEEN ? AND ?
+    ORDER BY m.movement_date DESC, m.id DESC
+"""
+
+STOCK_QUERY = """
+    SELECT 
+        id,
+        name,
+        hsn_code,
+        stock_quantity,
+        min_stock_level,
+        CASE 
+            WHEN stock_quantity <= min_stock_level THEN 'Low Stock'
+            ELSE 'OK'
+        END as status
+    FROM products
+    ORDER BY name
+"""
+
+
+class StockService:
+    """Stock levels, the movement ledger and reorder alerts
+
+    Every change of stock is a movement in the ledger (see stock_ledger);
+    ``products.stock_quantity`` is its running balance.
+    """
+
+    def __init__(self, db, master_data=None):
+        self.db = db
+        self.master_data = master_data or MasterDataCache(db)
+
+    def levels(self):
+        """(id, name, hsn_code, stock, minimum, status) of every product, by name"""
+        with self.db.reader() as conn:
+            return conn.execute(STOCK_QUERY).fetchall()
+
+    def movements(self, from_date, to_date):
+        """(date, product, kind, quantity, reference) rows, latest first"""
+        with self.db.reader() as conn:
+            return conn.execute(MOVEMENT_QUERY, (str(from_date), str(to_date))).fetchall()
+
+    def low_stock(self):
+        """(id, name, stock, minimum) of products at or below their reorder level"""
+        with self.db.reader() as conn:
+            return stock_alerts.low_stock(conn)
+
+    def balance(self, product_id, on_date):
+        """Stock of a product at the end of ``on_date``"""
+        with self.db.reader() as conn:
+            return stock_ledger.balance(conn, product_id, on_date)
+
+    def set_stock(self, product_id, quantity, reference="Manual adjustment"):
+        """Bring a product's stock to ``quantity`` with an adjustment; returns the change"""
+        change = self.db.write(stock_ledger.set_stock, product_id, int(quantity), reference=reference).result()
+        self.master_data.changed('products', [product_id])
+        return change
+
+    def record_purchases(self, purchases):
+        """Insert purchase lines (see stock_ledger.record_purchases) and take them into stock"""
+        self.db.write(stock_ledger.record_purchases, purchases).result()
+        self.master_data.changed('products', {purchase['product_id'] for purchase in purchases
+                                              if purchase.get('product_id') is not None})
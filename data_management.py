@@ -1,13 +1,32 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
+from paged_list import PagedTreeview
+from master_data import MasterDataCache
+from core.customers import CustomerService
+from core.products import GST_RATES, ProductService
+
+# (heading, column) pairs shown in the lists; every column is sortable
+CUSTOMER_COLUMNS = [("Name", "name"), ("GSTIN", "gstin"), ("Phone", "phone"), ("Email", "email")]
+PRODUCT_COLUMNS = [
+    ("Name", "name"), ("HSN Code", "hsn_code"), ("GST Rate", "gst_rate"),
+    ("Price", "price"), ("Stock", "stock_quantity"),
+]
 
 class DataManagement:
-    def __init__(self, parent, db_connection):
+    def __init__(self, parent, db, master_data=None):
         self.parent = parent
-        self.conn = db_connection
+        self.db = db
+        self.conn = db.connect(read_only=True)
         self.cursor = self.conn.cursor()
         
+        # Every write here is announced through the shared cache
+        self.master_data = master_data or MasterDataCache(db)
+        self.master_data.subscribe(self.on_master_data_changed)
+        self.customers = CustomerService(db, self.master_data)
+        self.products = ProductService(db, self.master_data)
+        self.customer_list = None
+        self.product_list = None
+        
     def create_customer_frame(self, parent):
         """Create the customer management interface"""
         frame = ttk.Frame(parent)
@@ -16,14 +35,10 @@ class DataManagement:
         list_frame = ttk.Frame(frame)
         list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        columns = ("Name", "GSTIN", "Phone", "Email")
-        self.customer_tree = ttk.Treeview(list_frame, columns=columns, show="headings")
-        
-        for col in columns:
-            self.customer_tree.heading(col, text=col)
-            self.customer_tree.column(col, width=100)
-        
-        self.customer_tree.pack(fill=tk.BOTH, expand=True)
+        headings, columns = zip(*CUSTOMER_COLUMNS)
+        self.customer_list = PagedTreeview(list_frame, self.conn, "customers", headings, columns, not_null=("name",))
+        self.customer_tree = self.customer_list.tree
+        self.customer_list.pack(fill=tk.BOTH, expand=True)
         
         # Customer form
         form_frame = ttk.Frame(frame)
@@ -54,6 +69,11 @@ class DataManagement:
         self.email_var = tk.StringVar()
         ttk.Entry(form_frame, textvariable=self.email_var).pack(fill=tk.X, pady=(0, 10))
         
+        # State code, for the place of supply; taken from the GSTIN if left blank
+        ttk.Label(form_frame, text="State Code:").pack(anchor=tk.W)
+        self.state_code_var = tk.StringVar()
+        ttk.Entry(form_frame, textvariable=self.state_code_var).pack(fill=tk.X, pady=(0, 10))
+        
         # Buttons
         button_frame = ttk.Frame(form_frame)
         button_frame.pack(fill=tk.X, pady=10)
@@ -78,14 +98,10 @@ class DataManagement:
         list_frame = ttk.Frame(frame)
         list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        columns = ("Name", "HSN Code", "GST Rate", "Price", "Stock")
-        self.product_tree = ttk.Treeview(list_frame, columns=columns, show="headings")
-        
-        for col in columns:
-            self.product_tree.heading(col, text=col)
-            self.product_tree.column(col, width=100)
-        
-        self.product_tree.pack(fill=tk.BOTH, expand=True)
+        headings, columns = zip(*PRODUCT_COLUMNS)
+        self.product_list = PagedTreeview(list_frame, self.conn, "products", headings, columns, not_null=("name",))
+        self.product_tree = self.product_list.tree
+        self.product_list.pack(fill=tk.BOTH, expand=True)
         
         # Product form
         form_frame = ttk.Frame(frame)
@@ -104,7 +120,7 @@ class DataManagement:
         # GST Rate
         ttk.Label(form_frame, text="GST Rate (%):").pack(anchor=tk.W)
         self.gst_rate_var = tk.StringVar()
-        ttk.Combobox(form_frame, textvariable=self.gst_rate_var, values=[0, 5, 12, 18, 28]).pack(fill=tk.X, pady=(0, 10))
+        ttk.Combobox(form_frame, textvariable=self.gst_rate_var, values=GST_RATES).pack(fill=tk.X, pady=(0, 10))
         
         # Price
         ttk.Label(form_frame, text="Price:").pack(anchor=tk.W)
@@ -133,33 +149,30 @@ class DataManagement:
         return frame
     
     def load_customers(self):
-        """Load customers into treeview"""
-        self.customer_tree.delete(*self.customer_tree.get_children())
-        self.cursor.execute("SELECT name, gstin, phone, email FROM customers ORDER BY name")
-        for row in self.cursor.fetchall():
-            self.customer_tree.insert("", tk.END, values=row)
+        """Show the first page of customers; more load on scroll"""
+        self.customer_list.reload()
     
     def load_products(self):
-        """Load products into treeview"""
-        self.product_tree.delete(*self.product_tree.get_children())
-        self.cursor.execute("SELECT name, hsn_code, gst_rate, price, stock_quantity FROM products ORDER BY name")
-        for row in self.cursor.fetchall():
-            self.product_tree.insert("", tk.END, values=row)
+        """Show the first page of products; more load on scroll"""
+        self.product_list.reload()
+    
+    def on_master_data_changed(self, table, ids, version):
+        """Update just the changed rows in whichever list shows them"""
+        paged_list = self.customer_list if table == 'customers' else self.product_list
+        if paged_list is not None:
+            paged_list.refresh_rows(ids)
     
     def add_customer(self):
         """Add a new customer"""
         try:
-            self.cursor.execute("""
-                INSERT INTO customers (name, gstin, address, phone, email)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
+            self.customers.add(
                 self.name_var.get(),
                 self.gstin_var.get(),
                 self.address_var.get(),
                 self.phone_var.get(),
-                self.email_var.get()
-            ))
-            self.conn.commit()
+                self.email_var.get(),
+                self.state_code_var.get()
+            )
             self.load_customers()
             self.clear_customer_form()
             messagebox.showinfo("Success", "Customer added successfully")
@@ -169,25 +182,19 @@ class DataManagement:
     def update_customer(self):
         """Update selected customer"""
         try:
-            selected = self.customer_tree.selection()
-            if not selected:
+            customer_id = self.customer_list.selected_id()
+            if customer_id is None:
                 messagebox.showwarning("Warning", "Please select a customer to update")
                 return
             
-            customer_name = self.customer_tree.item(selected[0])['values'][0]
-            self.cursor.execute("""
-                UPDATE customers
-                SET gstin = ?, address = ?, phone = ?, email = ?
-                WHERE name = ?
-            """, (
+            self.customers.update(
+                customer_id,
                 self.gstin_var.get(),
                 self.address_var.get(),
                 self.phone_var.get(),
                 self.email_var.get(),
-                customer_name
-            ))
-            self.conn.commit()
-            self.load_customers()
+                self.state_code_var.get()
+            )
             self.clear_customer_form()
             messagebox.showinfo("Success", "Customer updated successfully")
         except Exception as e:
@@ -196,16 +203,13 @@ class DataManagement:
     def delete_customer(self):
         """Delete selected customer"""
         try:
-            selected = self.customer_tree.selection()
-            if not selected:
+            customer_id = self.customer_list.selected_id()
+            if customer_id is None:
                 messagebox.showwarning("Warning", "Please select a customer to delete")
                 return
             
             if messagebox.askyesno("Confirm", "Are you sure you want to delete this customer?"):
-                customer_name = self.customer_tree.item(selected[0])['values'][0]
-                self.cursor.execute("DELETE FROM customers WHERE name = ?", (customer_name,))
-                self.conn.commit()
-                self.load_customers()
+                self.customers.delete(customer_id)
                 self.clear_customer_form()
                 messagebox.showinfo("Success", "Customer deleted successfully")
         except Exception as e:
@@ -214,17 +218,14 @@ class DataManagement:
     def add_product(self):
         """Add a new product"""
         try:
-            self.cursor.execute("""
-                INSERT INTO products (name, hsn_code, gst_rate, price, stock_quantity)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
+            # Starting stock goes in through the ledger as its opening entry
+            self.products.add(
                 self.product_name_var.get(),
                 self.hsn_var.get(),
-                float(self.gst_rate_var.get()),
-                float(self.price_var.get()),
-                int(self.stock_var.get())
-            ))
-            self.conn.commit()
+                self.gst_rate_var.get(),
+                self.price_var.get(),
+                self.stock_var.get()
+            )
             self.load_products()
             self.clear_product_form()
             messagebox.showinfo("Success", "Product added successfully")
@@ -234,25 +235,19 @@ class DataManagement:
     def update_product(self):
         """Update selected product"""
         try:
-            selected = self.product_tree.selection()
-            if not selected:
+            product_id = self.product_list.selected_id()
+            if product_id is None:
                 messagebox.showwarning("Warning", "Please select a product to update")
                 return
             
-            product_name = self.product_tree.item(selected[0])['values'][0]
-            self.cursor.execute("""
-                UPDATE products
-                SET hsn_code = ?, gst_rate = ?, price = ?, stock_quantity = ?
-                WHERE name = ?
-            """, (
+            # A changed stock figure is recorded as an adjustment, not overwritten
+            self.products.update(
+                product_id,
                 self.hsn_var.get(),
-                float(self.gst_rate_var.get()),
-                float(self.price_var.get()),
-                int(self.stock_var.get()),
-                product_name
-            ))
-            self.conn.commit()
-            self.load_products()
+                self.gst_rate_var.get(),
+                self.price_var.get(),
+                self.stock_var.get()
+            )
             self.clear_product_form()
             messagebox.showinfo("Success", "Product updated successfully")
         except Exception as e:
@@ -261,16 +256,13 @@ class DataManagement:
     def delete_product(self):
         """Delete selected product"""
         try:
-            selected = self.product_tree.selection()
-            if not selected:
+            product_id = self.product_list.selected_id()
+            if product_id is None:
                 messagebox.showwarning("Warning", "Please select a product to delete")
                 return
             
             if messagebox.askyesno("Confirm", "Are you sure you want to delete this product?"):
-                product_name = self.product_tree.item(selected[0])['values'][0]
-                self.cursor.execute("DELETE FROM products WHERE name = ?", (product_name,))
-                self.conn.commit()
-                self.load_products()
+                self.products.delete(product_id)
                 self.clear_product_form()
                 messagebox.showinfo("Success", "Product deleted successfully")
         except Exception as e:
@@ -278,29 +270,26 @@ class DataManagement:
     
     def on_customer_select(self, event):
         """Handle customer selection"""
-        selected = self.customer_tree.selection()
-        if selected:
-            values = self.customer_tree.item(selected[0])['values']
-            self.name_var.set(values[0])
-            self.gstin_var.set(values[1])
-            self.phone_var.set(values[2])
-            self.email_var.set(values[3])
-            
-            # Get address from database
-            self.cursor.execute("SELECT address FROM customers WHERE name = ?", (values[0],))
-            address = self.cursor.fetchone()[0]
-            self.address_var.set(address)
+        customer_id = self.customer_list.selected_id()
+        customer = customer_id and self.master_data.get('customers', customer_id)
+        if customer:
+            self.name_var.set(customer['name'])
+            self.gstin_var.set(customer['gstin'] or "")
+            self.address_var.set(customer['address'] or "")
+            self.phone_var.set(customer['phone'] or "")
+            self.email_var.set(customer['email'] or "")
+            self.state_code_var.set(customer['state_code'] or "")
     
     def on_product_select(self, event):
         """Handle product selection"""
-        selected = self.product_tree.selection()
-        if selected:
-            values = self.product_tree.item(selected[0])['values']
-            self.product_name_var.set(values[0])
-            self.hsn_var.set(values[1])
-            self.gst_rate_var.set(values[2])
-            self.price_var.set(values[3])
-            self.stock_var.set(values[4])
+        product_id = self.product_list.selected_id()
+        product = product_id and self.master_data.get('products', product_id)
+        if product:
+            self.product_name_var.set(product['name'])
+            self.hsn_var.set(product['hsn_code'] or "")
+            self.gst_rate_var.set(product['gst_rate'])
+            self.price_var.set(product['price'])
+            self.stock_var.set(product['stock_quantity'])
     
     def clear_customer_form(self):
         """Clear customer form fields"""
@@ -309,6 +298,7 @@ class DataManagement:
         self.address_var.set("")
         self.phone_var.set("")
         self.email_var.set("")
+        self.state_code_var.set("")
     
     def clear_product_form(self):
         """Clear product form fields"""
@@ -0,0 +1,176 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+import migrations
+
+
+class Database:
+    """Shared access to the SQLite database
+
+    Reads use pooled read-only connections and never wait on writers (WAL).
+    All writes are funnelled through one writer thread which batches whatever
+    is queued into a single transaction (group commit), so one fsync covers
+    many small writes and a long report never blocks the billing counter.
+    """
+
+    def __init__(self, path, readers=4, mmap_size=256 * 1024 * 1024, cache_size_kb=64 * 1024,
+                 busy_timeout_ms=30000, commit_window=0.002, max_batch=500, journal_mode="WAL"):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.journal_mode = journal_mode
+        self.max_readers = readers
+        self._readers = queue.LifoQueue()
+        self._writes = queue.Queue()
+        self._closed = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # The writer connection owns schema upgrades and the WAL switch, which
+        # is persistent in the database file. Other journal modes are only for
+        # comparison (benchmarks/load_test.py): readers then block the writer.
+        self._writer_conn = self.connect()
+        self._writer_conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        migrations.migrate(self._writer_conn)
+        self._writer_conn.isolation_level = None
+        # Every write runs inside a savepoint, so each statement that fires a
+        # change_log trigger also opens a statement journal. Held in memory
+        # (temp_store = MEMORY) that journal makes bulk inserts several times
+        # slower; the default lets it spill to a temporary file instead.
+        self._writer_conn.execute("PRAGMA temp_store = DEFAULT")
+
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
+    def connect(self, read_only=False):
+        """Open a new connection with the tuned pragmas applied"""
+        if read_only:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False,
+                                   timeout=self.busy_timeout_ms / 1000)
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self.busy_timeout_ms / 1000)
+            conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        # A negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Borrow a pooled read-only connection"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self.connect(read_only=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed or self._readers.qsize() >= self.max_readers:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    def write(self, fn, *args, **kwargs):
+        """Queue ``fn(cursor, *args, **kwargs)`` for the writer thread
+
+        ``fn`` runs inside the group transaction and must not commit. Returns
+        a Future that resolves to its return value once the transaction that
+        contains it has committed.
+        """
+        if self._closed:
+            raise sqlite3.ProgrammingError("Database is closed")
+        future = Future()
+        self._writes.put((future, fn, args, kwargs))
+        return future
+
+    def execute(self, sql, params=()):
+        """Queue a single write statement; the Future resolves to its rowcount"""
+        return self.write(lambda cursor: cursor.execute(sql, params).rowcount)
+
+    def get_setting(self, key, default=None):
+        """Read a business setting (e.g. seller_gstin)"""
+        with self.reader() as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row and row[0] is not None else default
+
+    def set_setting(self, key, value):
+        """Queue an update to a business setting"""
+        return self.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+    def _writer_loop(self):
+        """Apply queued writes in batches, one transaction per batch"""
+        conn = self._writer_conn
+        cursor = conn.cursor()
+        while True:
+            item = self._writes.get()
+            if item is None:
+                break
+            batch = [item]
+            # Give concurrent writers a moment to join this commit
+            deadline = time.perf_counter() + self.commit_window
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._writes.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._writes.put(None)
+                    break
+                batch.append(item)
+
+            results = []
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                for future, fn, args, kwargs in batch:
+                    # A savepoint per write lets one failure roll back alone
+                    # without discarding the rest of the batch
+                    cursor.execute("SAVEPOINT write")
+                    try:
+                        results.append((future, fn(cursor, *args, **kwargs), None))
+                        cursor.execute("RELEASE write")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO write")
+                        cursor.execute("RELEASE write")
+                        results.append((future, None, e))
+                cursor.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    cursor.execute("ROLLBACK")
+                for future, _, _, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def close(self):
+        """Finish queued writes and close every connection"""
+        if self._closed:
+            return
+        self._closed = True
+        self._writes.put(None)
+        self._writer.join()
+        self._writer_conn.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
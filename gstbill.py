@@ -0,0 +1,183 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+from datetime import date
+
+import branch_sync
+import core.reports
+import report_export
+import tax_engine
+from core import CustomerService, InvoiceService, ProductService
+from db import Database
+from master_data import MasterDataCache
+
+# Command line report names -> core.reports report types
+REPORTS = {'gstr1': 'GSTR1', 'gstr2': 'GSTR2', 'gstr3b': 'GSTR3B'}
+
+
+def read_rows(path):
+    """Dicts from a CSV file with a header row, or from a JSONL file"""
+    if path.lower().endswith(('.jsonl', '.ndjson')):
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, newline='', encoding='utf-8') as f:
+        return [{key: value or None for key, value in row.items()} for row in csv.DictReader(f)]
+
+
+def parse_item(text):
+    """'PRODUCT=QUANTITY' (or just 'PRODUCT' for one) -> (product, quantity)"""
+    product, separator, quantity = text.rpartition('=')
+    if not separator:
+        return text, 1
+    return product, quantity
+
+
+def invoice_create(db, args):
+    master_data = MasterDataCache(db)
+    invoices = InvoiceService(db, tax_engine.state_code_from_gstin(db.get_setting('seller_gstin')),
+                              master_data=master_data, pdf_dir=args.pdf_dir)
+    customer = CustomerService(db, master_data).find(args.customer)
+    if customer is None:
+        raise ValueError(f"Unknown customer {args.customer!r}")
+    products = ProductService(db, master_data)
+    lines = []
+    for product_name, quantity in map(parse_item, args.item):
+        product = products.find(product_name)
+        if product is None:
+            raise ValueError(f"Unknown product {product_name!r}")
+        lines.append(invoices.line(product, quantity))
+
+    invoice = invoices.create(customer, lines, args.date, render_pdf=not args.no_pdf)
+    print(f"Invoice {invoice['invoice_number']} for {customer['name']}: "
+          f"{invoice['totals']['total']:.2f} including {invoice['totals']['gst']:.2f} GST")
+    if 'pdf_path' in invoice:
+        print(f"PDF written to {invoice['pdf_path']}")
+
+
+def invoice_cancel(db, args):
+    cancelled = InvoiceService(db).cancel(args.numbers)
+    print(f"Cancelled {cancelled} of {len(args.numbers)} invoices")
+
+
+def report(db, args):
+    from_date, to_date = core.reports.parse_period(args.period)
+    if args.report == 'gstr1-portal':
+        path, counts = core.reports.export_gstr1_portal(db, db.get_setting('seller_gstin'), from_date, to_date,
+                                                        args.out_dir)
+        print(", ".join(f"{count} {section}" for section, count in counts.items()))
+        print(f"Written to {path}")
+        return
+    seller_state_code = tax_engine.state_code_from_gstin(db.get_setting('seller_gstin'))
+    paths, rows, timings = core.reports.export_report(db, REPORTS[args.report], from_date, to_date,
+                                                      seller_state_code, args.format, args.out_dir)
+    print(f"{args.report.upper()} {from_date} to {to_date}: {rows} rows in "
+          + ", ".join(f"{name} {seconds:.1f} s" for name, seconds in timings.items()))
+    for path in paths:
+        print(f"Written to {path}")
+
+
+def import_file(db, args):
+    if args.kind == 'orders':
+        # Bulk invoicing renders PDFs with reportlab
+        import bulk_invoicing
+
+        run = bulk_invoicing.BulkInvoiceRun(
+            db, seller_state_code=tax_engine.state_code_from_gstin(db.get_setting('seller_gstin')),
+            render_pdfs=not args.no_pdf, pdf_dir=args.pdf_dir, series=args.series)
+        stats = run.run(bulk_invoicing.read_orders(args.path))
+        print(bulk_invoicing.format_report(stats, run.errors))
+        return
+    service = (CustomerService if args.kind == 'customers' else ProductService)(db)
+    ids = service.import_rows(read_rows(args.path))
+    print(f"Imported {len(ids)} {args.kind}")
+
+
+def sync(db, args):
+    if args.action == 'export':
+        header = branch_sync.export_changes(db, args.path, args.since)
+        print(f"Branch {header['origin']} changes {header['since'] + 1} to {header['until']}: "
+              + ", ".join(f"{count} {table}" for table, count in header['counts'].items()))
+        print(f"Written to {args.path}")
+    elif args.action == 'import':
+        stats = branch_sync.import_changes(db, args.path, args.rule)
+        for table, counts in stats.items():
+            print(f"{table}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+    else:
+        state = branch_sync.status(db)
+        print(f"Branch {state['branch_id']} at change {state['last_seq']}, exported up to {state['exported_seq']}")
+        for peer in state['peers']:
+            print(f"  imported {peer['origin']} up to {peer['last_seq']} at {peer['imported_at']}")
+        print(f"{state['conflicts']} master data conflicts recorded in sync_conflicts")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="gstbill", description="GST billing from the command line")
+    parser.add_argument("--db", default=os.path.join('data', 'gst_billing.db'), help="SQLite database path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    invoice = commands.add_parser("invoice", help="Create or cancel invoices")
+    invoice_commands = invoice.add_subparsers(dest="action", required=True)
+    create = invoice_commands.add_parser("create", help="Create one invoice")
+    create.add_argument("--customer", required=True, help="Customer name or id")
+    create.add_argument("--item", action="append", required=True, metavar="PRODUCT=QUANTITY",
+                        help="Product name or id and quantity; repeat for more lines")
+    create.add_argument("--date", type=date.fromisoformat, help="Invoice date (YYYY-MM-DD, default today)")
+    create.add_argument("--pdf-dir", default="invoices", help="Directory for the PDF")
+    create.add_argument("--no-pdf", action="store_true", help="Save the invoice without rendering its PDF")
+    create.set_defaults(handler=invoice_create)
+    cancel = invoice_commands.add_parser("cancel", help="Cancel invoices and return their stock")
+    cancel.add_argument("numbers", nargs="+", help="Invoice numbers")
+    cancel.set_defaults(handler=invoice_cancel)
+
+    report_parser = commands.add_parser("report", help="Write a GST return for a period")
+    report_parser.add_argument("report", choices=list(REPORTS) + ["gstr1-portal"])
+    report_parser.add_argument("--period", required=True,
+                               help="Month (2024-04), financial year (FY2024-25) or range (2024-04-01:2024-06-30)")
+    report_parser.add_argument("--format", nargs="+", choices=list(report_export.WRITERS),
+                               default=list(report_export.WRITERS), help="Formats to write (default: all)")
+    report_parser.add_argument("--out-dir", default="reports", help="Directory for the report files")
+    report_parser.set_defaults(handler=report)
+
+    import_parser = commands.add_parser("import", help="Import customers, products or orders from a file")
+    import_parser.add_argument("kind", choices=["customers", "products", "orders"])
+    import_parser.add_argument("path", help="CSV with a header row or JSONL; orders as for bulk_invoicing.py")
+    import_parser.add_argument("--series", help="Invoice series for orders without a number")
+    import_parser.add_argument("--pdf-dir", default="invoices", help="Directory for order PDFs")
+    import_parser.add_argument("--no-pdf", action="store_true", help="Do not render PDFs for orders")
+    import_parser.set_defaults(handler=import_file)
+
+    sync_parser = commands.add_parser("sync", help="Exchange changes with other branch databases")
+    sync_commands = sync_parser.add_subparsers(dest="action", required=True)
+    export = sync_commands.add_parser("export", help="Write this branch's changes to a batch file")
+    export.add_argument("path", help="Batch file to write (gzipped JSON lines)")
+    export.add_argument("--since", type=int, help="Sequence number to export after (default: the last export)")
+    sync_import = sync_commands.add_parser("import", help="Apply a batch exported by another branch")
+    sync_import.add_argument("path", help="Batch file to read")
+    sync_import.add_argument("--rule", choices=branch_sync.RULES, default="newer",
+                             help="Which edit wins when a customer or product changed at both branches")
+    sync_commands.add_parser("status", help="Show this branch's id and what has been imported")
+    sync_parser.set_defaults(handler=sync)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    db = Database(args.db)
+    try:
+        args.handler(db, args)
+    except (ValueError, KeyError, OSError, sqlite3.Error) as e:
+        print(f"gstbill: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    # Bulk PDF rendering and XLSX export use child processes
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import itertools
+import json
+from datetime import datetime
+
+import tax_engine
+
+# Inter-state invoices to unregistered buyers above this value are reported
+# invoice-wise in B2CL; everything else to unregistered buyers goes to B2CS
+B2CL_THRESHOLD = 100000
+
+# B2B, B2CL and B2CS are invoice-level, so they read invoice lines without
+# the products join. The CTEs are flattened into each query: the buyer filter
+# of a section is applied per invoice before its lines are read, and lines
+# come back in (invoice_date, invoice_id, gst_rate) index order, so grouping
+# per invoice and rate needs no sort.
+# Parameters: from date, to date, seller state (twice).
+INVOICE_LINES_CTE = """
+    WITH lines AS (
+        SELECT
+            i.id AS invoice_id,
+            i.invoice_number,
+            i.invoice_date,
+            i.total_amount AS invoice_value,
+            COALESCE(c.gstin, '') AS gstin,
+            COALESCE(NULLIF(i.place_of_supply, ''), NULLIF(c.state_code, ''),
+                     NULLIF(substr(c.gstin, 1, 2), '')) AS pos,
+            ii.gst_rate AS rt,
+            ii.quantity * ii.price AS txval,
+            ii.gst_amount AS tax
+        FROM invoices i
+        JOIN customers c ON i.customer_id = c.id
+        JOIN invoice_items ii ON i.id = ii.invoice_id
+        WHERE i.invoice_date BETWEEN ? AND ?
+          AND COALESCE(i.status, '') != 'CANCELLED'
+    ),
+    classified AS (
+        SELECT *, (? IS NOT NULL AND pos IS NOT NULL AND pos != ?) AS inter
+        FROM lines
+    )
+"""
+
+# The tax split follows tax_engine: inter-state tax is all IGST, intra-state
+# tax is CGST and SGST in exact halves
+TAX_COLUMNS = """
+    ROUND(SUM(txval), 2) AS txval,
+    ROUND(SUM(CASE WHEN inter THEN tax ELSE 0 END), 2) AS iamt,
+    ROUND(SUM(CASE WHEN inter THEN 0 ELSE tax END) / 2.0, 2) AS camt,
+    ROUND(SUM(CASE WHEN inter THEN 0 ELSE tax END) / 2.0, 2) AS samt
+"""
+
+SECTION_QUERIES = {
+    'b2b': INVOICE_LINES_CTE + f"""
+        SELECT gstin, invoice_number, invoice_date, invoice_value, pos, rt, {TAX_COLUMNS}
+        FROM classified
+        WHERE gstin != ''
+        GROUP BY invoice_date, invoice_id, rt
+        ORDER BY gstin, invoice_id, rt
+    """,
+    'b2cl': INVOICE_LINES_CTE + f"""
+        SELECT pos, invoice_number, invoice_date, invoice_value, rt, {TAX_COLUMNS}
+        FROM classified
+        WHERE gstin = '' AND inter AND invoice_value > ?
+        GROUP BY invoice_date, invoice_id, rt
+        ORDER BY pos, invoice_id, rt
+    """,
+    'b2cs': INVOICE_LINES_CTE + f"""
+        SELECT CASE WHEN inter THEN 'INTER' ELSE 'INTRA' END AS sply_ty, pos, rt, {TAX_COLUMNS}
+        FROM classified
+        WHERE gstin = '' AND NOT (inter AND invoice_value > ?)
+        GROUP BY inter, pos, rt
+        ORDER BY pos, rt
+    """,
+    # HSN is the only section that needs product rows; the supply type is
+    # carried per line so the IGST/CGST/SGST columns add up
+    'hsn': """
+        WITH invoice_supplies AS (
+            SELECT
+                i.id,
+                COALESCE(NULLIF(i.place_of_supply, ''), NULLIF(c.state_code, ''),
+                         NULLIF(substr(c.gstin, 1, 2), '')) AS pos
+            FROM invoices i
+            JOIN customers c ON i.customer_id = c.id
+            WHERE i.invoice_date BETWEEN ? AND ?
+              AND COALESCE(i.status, '') != 'CANCELLED'
+        ),
+        supplies AS (
+            SELECT id, (? IS NOT NULL AND pos IS NOT NULL AND pos != ?) AS inter
+            FROM invoice_supplies
+        )
+        SELECT
+            COALESCE(p.hsn_code, '') AS hsn_code,
+            ii.gst_rate AS rt,
+            SUM(ii.quantity) AS qty,
+            ROUND(SUM(ii.total_amount), 2) AS val,
+            ROUND(SUM(ii.quantity * ii.price), 2) AS txval,
+            ROUND(SUM(CASE WHEN s.inter THEN ii.gst_amount ELSE 0 END), 2) AS iamt,
+            ROUND(SUM(CASE WHEN s.inter THEN 0 ELSE ii.gst_amount END) / 2.0, 2) AS camt,
+            ROUND(SUM(CASE WHEN s.inter THEN 0 ELSE ii.gst_amount END) / 2.0, 2) AS samt
+        FROM supplies s
+        JOIN invoice_items ii ON s.id = ii.invoice_id
+        JOIN products p ON ii.product_id = p.id
+        GROUP BY hsn_code, rt
+        ORDER BY hsn_code, rt
+    """,
+}
+
+
+def portal_date(value):
+    """Portal dates are dd-mm-yyyy"""
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').strftime('%d-%m-%Y')
+
+
+def item_details(rate, txval, iamt, camt, samt, inter):
+    """itm_det block; intra-state sections carry CGST/SGST, inter-state IGST"""
+    details = {'rt': rate, 'txval': txval}
+    if inter:
+        details['iamt'] = iamt
+    else:
+        details['camt'] = camt
+        details['samt'] = samt
+    details['csamt'] = 0
+    return details
+
+
+class GSTR1Builder:
+    def __init__(self, conn, seller_gstin, b2cl_threshold=B2CL_THRESHOLD):
+        self.conn = conn
+        self.seller_gstin = seller_gstin or ""
+        self.seller_state_code = tax_engine.state_code_from_gstin(seller_gstin)
+        self.b2cl_threshold = b2cl_threshold
+
+    def params(self, from_date, to_date, *extra):
+        """Bind values for a section query"""
+        return (str(from_date), str(to_date), self.seller_state_code, self.seller_state_code) + extra
+
+    def section(self, name, from_date, to_date, *extra):
+        """Run one section's GROUP BY query and return its rows"""
+        return self.conn.execute(SECTION_QUERIES[name], self.params(from_date, to_date, *extra)).fetchall()
+
+    def b2b(self, from_date, to_date):
+        """Invoices to registered buyers, grouped by buyer GSTIN"""
+        rows = self.section('b2b', from_date, to_date)
+        result = []
+        for ctin, by_buyer in itertools.groupby(rows, key=lambda row: row[0]):
+            invoices = []
+            for (inum, idt, val, pos), items in itertools.groupby(by_buyer, key=lambda row: row[1:5]):
+                inter = tax_engine.is_inter_state(self.seller_state_code, pos)
+                invoices.append({
+                    'inum': inum,
+                    'idt': portal_date(idt),
+                    'val': round(val or 0, 2),
+                    'pos': pos,
+                    'rchrg': 'N',
+                    'inv_typ': 'R',
+                    'itms': [
+                        {'num': num, 'itm_det': item_details(row[5], row[6], row[7], row[8], row[9], inter)}
+                        for num, row in enumerate(items, 1)
+                    ],
+                })
+            result.append({'ctin': ctin, 'inv': invoices})
+        return result
+
+    def b2cl(self, from_date, to_date):
+        """Large inter-state invoices to unregistered buyers, by place of supply"""
+        rows = self.section('b2cl', from_date, to_date, self.b2cl_threshold)
+        result = []
+        for pos, by_state in itertools.groupby(rows, key=lambda row: row[0]):
+            invoices = []
+            for (inum, idt, val), items in itertools.groupby(by_state, key=lambda row: row[1:4]):
+                invoices.append({
+                    'inum': inum,
+                    'idt': portal_date(idt),
+                    'val': round(val or 0, 2),
+                    'itms': [
+                        {'num': num, 'itm_det': item_details(row[4], row[5], row[6], row[7], row[8], True)}
+                        for num, row in enumerate(items, 1)
+                    ],
+                })
+            result.append({'pos': pos, 'inv': invoices})
+        return result
+
+    def b2cs(self, from_date, to_date):
+        """Other supplies to unregistered buyers, by place of supply and rate"""
+        result = []
+        for sply_ty, pos, rate, txval, iamt, camt, samt in self.section(
+                'b2cs', from_date, to_date, self.b2cl_threshold):
+            entry = {'sply_ty': sply_ty, 'pos': pos or self.seller_state_code, 'typ': 'OE'}
+            entry.update(item_details(rate, txval, iamt, camt, samt, sply_ty == 'INTER'))
+            result.append(entry)
+        return result
+
+    def hsn(self, from_date, to_date):
+        """HSN-wise summary of outward supplies"""
+        data = []
+        for num, (hsn_code, rate, qty, val, txval, iamt, camt, samt) in enumerate(
+                self.section('hsn', from_date, to_date), 1):
+            data.append({
+                'num': num,
+                'hsn_sc': hsn_code,
+                'uqc': 'NOS',
+                'qty': qty,
+                'rt': rate,
+                'val': val,
+                'txval': txval,
+                'iamt': iamt,
+                'camt': camt,
+                'samt': samt,
+                'csamt': 0,
+            })
+        return {'data': data}
+
+    def build(self, from_date, to_date):
+        """Portal-schema GSTR-1 for the period; the return period is taken from to_date"""
+        period_end = datetime.strptime(str(to_date)[:10], '%Y-%m-%d')
+        return {
+            'gstin': self.seller_gstin,
+            'fp': period_end.strftime('%m%Y'),
+            'b2b': self.b2b(from_date, to_date),
+            'b2cl': self.b2cl(from_date, to_date),
+            'b2cs': self.b2cs(from_date, to_date),
+            'hsn': self.hsn(from_date, to_date),
+        }
+
+    def write_json(self, path, from_date, to_date):
+        """Build the return and write it as portal upload JSON"""
+        data = self.build(from_date, to_date)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        return data
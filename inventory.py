@@ -1,17 +1,35 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime
+from master_data import MasterDataCache
+from core.stock import StockService
+import stock_alerts
 
 class InventoryManagement:
-    def __init__(self, parent, db_connection):
+    def __init__(self, parent, db, master_data=None, monitor=None):
         self.parent = parent
-        self.conn = db_connection
-        self.cursor = self.conn.cursor()
+        self.db = db
+        
+        # Stock rows are refreshed individually when products change
+        self.master_data = master_data or MasterDataCache(db)
+        self.master_data.subscribe(self.on_master_data_changed)
+        self.stock = StockService(db, self.master_data)
+        self.stock_tree = None
+        self.alerts_tree = None
+        
+        # Reorder alerts arrive as sales and purchases commit
+        self.monitor = monitor
+        if monitor is not None:
+            monitor.subscribe(self.on_stock_alerts)
+        self.alert_var = tk.StringVar()
         
     def create_inventory_frame(self, parent):
         """Create the inventory management interface"""
         frame = ttk.Frame(parent)
         
+        # Latest reorder alert
+        ttk.Label(frame, textvariable=self.alert_var, foreground="red").pack(anchor=tk.W, padx=5)
+        
         # Create notebook for different views
         notebook = ttk.Notebook(frame)
         notebook.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -110,28 +128,17 @@ class InventoryManagement:
         
         ttk.Button(button_frame, text="Refresh", command=self.refresh_alerts).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Export", command=self.export_alerts).pack(side=tk.LEFT, padx=5)
+        
+        # Load initial data; after this rows change only as alerts arrive
+        self.refresh_alerts()
     
     def refresh_stock(self):
         """Refresh stock overview"""
         try:
             self.stock_tree.delete(*self.stock_tree.get_children())
             
-            self.cursor.execute("""
-                SELECT 
-                    name,
-                    hsn_code,
-                    stock_quantity,
-                    min_stock_level,
-                    CASE 
-                        WHEN stock_quantity <= min_stock_level THEN 'Low Stock'
-                        ELSE 'OK'
-                    END as status
-                FROM products
-                ORDER BY name
-            """)
-            
-            for row in self.cursor.fetchall():
-                self.stock_tree.insert("", tk.END, values=row)
+            for row in self.stock.levels():
+                self.stock_tree.insert("", tk.END, iid=row[0], values=row[1:])
                 
         except Exception as e:
             messagebox.showerror("Error", str(e))
@@ -144,34 +151,8 @@ class InventoryManagement:
             from_date = datetime.strptime(self.from_date.get(), '%Y-%m-%d').date()
             to_date = datetime.strptime(self.to_date.get(), '%Y-%m-%d').date()
             
-            # Query stock movements from invoices and purchases
-            self.cursor.execute("""
-                SELECT 
-                    i.invoice_date as date,
-                    p.name as product,
-                    'OUT' as type,
-                    ii.quantity,
-                    i.invoice_number as reference
-                FROM invoices i
-                JOIN invoice_items ii ON i.id = ii.invoice_id
-                JOIN products p ON ii.product_id = p.id
-                WHERE i.invoice_date BETWEEN ? AND ?
-                
-                UNION ALL
-                
-                SELECT 
-                    p.invoice_date as date,
-                    p.product_name as product,
-                    'IN' as type,
-                    p.quantity,
-                    p.invoice_number as reference
-                FROM purchases p
-                WHERE p.invoice_date BETWEEN ? AND ?
-                
-                ORDER BY date DESC
-            """, (from_date, to_date, from_date, to_date))
-            
-            for row in self.cursor.fetchall():
+            # Every sale, cancellation, purchase and adjustment is in the ledger
+            for row in self.stock.movements(from_date, to_date):
                 self.movement_tree.insert("", tk.END, values=row)
                 
         except Exception as e:
@@ -182,26 +163,53 @@ class InventoryManagement:
         try:
             self.alerts_tree.delete(*self.alerts_tree.get_children())
             
-            self.cursor.execute("""
-                SELECT 
-                    name,
-                    stock_quantity,
-                    min_stock_level,
-                    CASE 
-                        WHEN stock_quantity <= min_stock_level THEN 'Low Stock'
-                        ELSE 'OK'
-                    END as status
-                FROM products
-                WHERE stock_quantity <= min_stock_level
-                ORDER BY name
-            """)
-            
-            for row in self.cursor.fetchall():
-                self.alerts_tree.insert("", tk.END, values=row)
+            # Only the low products are read, through their partial index
+            for row in self.stock.low_stock():
+                self.alerts_tree.insert("", tk.END, iid=row[0], values=row[1:] + ('Low Stock',))
                 
         except Exception as e:
             messagebox.showerror("Error", str(e))
     
+    def on_master_data_changed(self, table, ids, version):
+        """Update the stock and alert rows of changed products in place"""
+        if table != 'products' or self.alerts_tree is None:
+            return
+        for product_id in ids:
+            product = self.master_data.get('products', product_id)
+            if product is None:
+                for tree in (self.stock_tree, self.alerts_tree):
+                    if tree.exists(product_id):
+                        tree.delete(product_id)
+                continue
+            
+            stock, minimum = product['stock_quantity'], product['min_stock_level']
+            low = stock_alerts.is_low(stock, minimum)
+            status = 'Low Stock' if low else 'OK'
+            self.set_row(self.stock_tree, product_id, (
+                product['name'], product['hsn_code'], stock, minimum, status))
+            if low:
+                self.set_row(self.alerts_tree, product_id, (product['name'], stock, minimum, status))
+            elif self.alerts_tree.exists(product_id):
+                self.alerts_tree.delete(product_id)
+    
+    def on_stock_alerts(self, alerts):
+        """Show the latest reorder alert; the rows themselves follow the cache change"""
+        alert = alerts[-1]
+        name = alert['name'] or f"#{alert['product_id']}"
+        if alert['low']:
+            self.alert_var.set(f"Low stock: {name} has {alert['stock_quantity']} left "
+                               f"(reorder level {alert['min_stock_level']})")
+        else:
+            self.alert_var.set(f"Restocked: {name} now has {alert['stock_quantity']}")
+    
+    def set_row(self, tree, iid, values):
+        """Update a row, or add it at the end if it is not shown yet"""
+        values = ["" if value is None else value for value in values]
+        if tree.exists(iid):
+            tree.item(iid, values=values)
+        else:
+            tree.insert("", tk.END, iid=iid, values=values)
+    
     def export_stock(self):
         """Export stock overview to Excel"""
         try:
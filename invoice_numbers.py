@@ -0,0 +1,138 @@
+import re
+import threading
+from datetime import date
+
+# GST allows up to 16 characters: letters, digits, '/' and '-'
+MAX_LENGTH = 16
+DEFAULT_SERIES = "INV"
+
+# A series is followed by '/' in the number, so it is kept alphanumeric
+_SERIES = re.compile(r"[A-Za-z0-9]+")
+
+
+def financial_year(invoice_date):
+    """Indian financial year (April to March) of an ISO date, e.g. '2024-25'"""
+    if isinstance(invoice_date, str):
+        invoice_date = date.fromisoformat(invoice_date[:10])
+    start = invoice_date.year if invoice_date.month >= 4 else invoice_date.year - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def format_number(series, year, number):
+    """Printed invoice number, e.g. INV/2425/00042 for series INV in 2024-25"""
+    text = f"{series}/{year[2:4]}{year[5:7]}/{number:05d}"
+    if len(text) > MAX_LENGTH:
+        raise ValueError(f"Invoice number {text} is longer than {MAX_LENGTH} characters; "
+                         f"use a shorter series than {series!r}")
+    return text
+
+
+def check_series(series):
+    if not _SERIES.fullmatch(series or ""):
+        raise ValueError(f"Invoice series must be letters and digits, not {series!r}")
+    # Room left beside '/yyyy/' and five digits
+    longest = MAX_LENGTH - len(format_number("", "2000-01", 1))
+    if len(series) > longest:
+        raise ValueError(f"Invoice series {series!r} is longer than {longest} characters")
+    return series
+
+
+def reserve(cursor, series, year, count=1):
+    """Take the next ``count`` numbers of a series and return the first
+
+    One UPDATE covers the whole block, so a bulk chunk costs the same as a
+    single invoice. The caller owns the transaction: if it rolls back, the
+    numbers go back with it, which is what keeps a series gapless.
+    """
+    cursor.execute("INSERT OR IGNORE INTO invoice_series (series, financial_year) VALUES (?, ?)",
+                   (series, year))
+    cursor.execute("""
+        UPDATE invoice_series SET next_number = next_number + ?
+        WHERE series = ? AND financial_year = ?
+    """, (count, series, year))
+    cursor.execute("SELECT next_number FROM invoice_series WHERE series = ? AND financial_year = ?",
+                   (series, year))
+    return cursor.fetchone()[0] - count
+
+
+def release(cursor, series, year, first, last):
+    """Give back the unused numbers ``first``..``last`` of a reserved block
+
+    If nothing has been taken after the block they simply become the next
+    numbers again. Otherwise they are recorded as void, so the gap can be
+    reported as cancelled serials in GSTR-1. Returns True if given back.
+    """
+    cursor.execute("""
+        UPDATE invoice_series SET next_number = ?
+        WHERE series = ? AND financial_year = ? AND next_number = ?
+    """, (first, series, year, last + 1))
+    if cursor.rowcount:
+        return True
+    cursor.execute("""
+        INSERT INTO invoice_number_voids (series, financial_year, first_number, last_number)
+        VALUES (?, ?, ?, ?)
+    """, (series, year, first, last))
+    return False
+
+
+def default_series(cursor):
+    cursor.execute("SELECT value FROM settings WHERE key = 'invoice_series'")
+    row = cursor.fetchone()
+    return row[0] if row and row[0] else DEFAULT_SERIES
+
+
+def assign_numbers(cursor, invoices, series=None):
+    """Number the invoices that do not have an invoice_number yet
+
+    Invoices are numbered in list order within their financial year, from
+    the ``series`` key of the invoice, then the ``series`` argument, then
+    the invoice_series setting. Run inside the transaction that inserts them.
+    """
+    pending = {}
+    for invoice in invoices:
+        if not invoice.get('invoice_number'):
+            if series is None and not invoice.get('series'):
+                series = default_series(cursor)
+            key = (check_series(invoice.get('series') or series), financial_year(invoice['invoice_date']))
+            pending.setdefault(key, []).append(invoice)
+    for (invoice_series, year), group in pending.items():
+        first = reserve(cursor, invoice_series, year, len(group))
+        for offset, invoice in enumerate(group):
+            invoice['invoice_number'] = format_number(invoice_series, year, first + offset)
+
+
+class NumberBlock:
+    """Numbers handed out locally from a block reserved up front
+
+    For a counter or job that must print numbers before its invoices are
+    written (e.g. to name PDFs) and should not take the write lock for each
+    one. Every number is in ``year``, so a block should not outlive its
+    financial year. Call ``close`` when done to give back what was not used.
+    """
+
+    def __init__(self, db, series=DEFAULT_SERIES, year=None, size=100):
+        self.db = db
+        self.series = check_series(series)
+        self.year = year or financial_year(date.today())
+        self.size = size
+        self.next = self.last = None
+        self._lock = threading.Lock()
+
+    def take(self):
+        """The next invoice number, reserving a fresh block when this one runs out"""
+        with self._lock:
+            if self.next is None or self.next > self.last:
+                self.next = self.db.write(reserve, self.series, self.year, self.size).result()
+                self.last = self.next + self.size - 1
+            number = self.next
+            self.next += 1
+        return format_number(self.series, self.year, number)
+
+    def close(self):
+        """Release the unused rest of the block; returns True if it was given back"""
+        with self._lock:
+            if self.next is None or self.next > self.last:
+                return True
+            first, last = self.next, self.last
+            self.next = self.last = None
+        return self.db.write(release, self.series, self.year, first, last).result()
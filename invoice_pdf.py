@@ -0,0 +1,227 @@
+from functools import lru_cache
+
+from reportlab import rl_config
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+
+FONT = "Helvetica"
+BOLD = "Helvetica-Bold"
+FONT_SIZE = 10
+ROW_HEIGHT = 16
+
+LEFT = 50
+RIGHT = letter[0] - 50
+BOTTOM = 60
+
+# Item table columns: (heading, x, right aligned)
+COLUMNS = [("Product", LEFT, False), ("Qty", 330, True), ("Price", 400, True),
+           ("GST", 470, True), ("Total", RIGHT, True)]
+
+TOTALS = [("Subtotal:", 'taxable'), ("CGST:", 'cgst'), ("SGST:", 'sgst'), ("IGST:", 'igst'), ("Total:", 'total')]
+
+# Settings that make up the letterhead
+SELLER_SETTINGS = ('seller_name', 'seller_gstin', 'seller_address')
+
+# Write compressed page streams as binary; ASCII85 only makes them larger
+# and, without reportlab's C accelerator, costs a sixth of the render time
+rl_config.useA85 = 0
+
+
+def file_name(invoice_number):
+    """PDF file name for an invoice number, which may contain '/'"""
+    return invoice_number.replace('/', '-') + ".pdf"
+
+
+def seller_details(db):
+    """Letterhead fields from the settings table"""
+    return tuple(db.get_setting(key, '') for key in SELLER_SETTINGS)
+
+
+@lru_cache(maxsize=4096)
+def fit(text, width, font=FONT, size=FONT_SIZE):
+    """Truncate text with an ellipsis so it fits in ``width`` points"""
+    text = str(text)
+    if stringWidth(text, font, size) <= width:
+        return text
+    while text and stringWidth(text + "...", font, size) > width:
+        text = text[:-1]
+    return text + "..."
+
+
+class InvoiceTemplate:
+    """Invoice layout compiled once and reused for every invoice
+
+    Everything that does not change between invoices (letterhead, field
+    labels, table headings and rules) is drawn once per document into PDF
+    form XObjects and placed on each page with a single operator, so a batch
+    rendered into one PDF stores it only once. Rows per page are worked out
+    up front, so long invoices break across pages with the headings repeated
+    and the totals kept together on the last page.
+    """
+
+    def __init__(self, seller=('', '', ''), pagesize=letter):
+        self.seller = seller
+        self.pagesize = pagesize
+        top = pagesize[1]
+        self.first_table_y = top - 212
+        self.next_table_y = top - 72
+        self.totals_height = ROW_HEIGHT * (len(TOTALS) + 1)
+        self.first_rows = int((self.first_table_y - ROW_HEIGHT - BOTTOM) // ROW_HEIGHT)
+        self.next_rows = int((self.next_table_y - ROW_HEIGHT - BOTTOM) // ROW_HEIGHT)
+        self.product_width = COLUMNS[1][1] - LEFT - 40
+        # Helvetica digits share one width, so amounts are measured from a table
+        self.char_widths = {char: stringWidth(char, FONT, FONT_SIZE) for char in "0123456789.,-"}
+        self.label_width = max(stringWidth(label, BOLD, FONT_SIZE)
+                               for label in ("Invoice Number:", "Date:", "Customer:", "GSTIN:", "Address:")) + 6
+
+    def paginate(self, lines):
+        """Split invoice lines into pages; the totals go on the last page"""
+        pages = []
+        capacity = self.first_rows
+        while True:
+            pages.append(lines[:capacity])
+            lines = lines[capacity:]
+            if not lines:
+                break
+            capacity = self.next_rows
+        # Move to a fresh page if the totals do not fit under the last rows
+        used = len(pages[-1]) * ROW_HEIGHT
+        space = (self.first_table_y if len(pages) == 1 else self.next_table_y) - ROW_HEIGHT - BOTTOM
+        if used + self.totals_height > space:
+            pages.append([])
+        return pages
+
+    def compile(self, c):
+        """Define the static forms on a canvas (once per document)"""
+        if getattr(c, '_invoice_forms', None) is self:
+            return
+        top = self.pagesize[1]
+
+        c.beginForm("invoice_first")
+        c.setFont(BOLD, 16)
+        c.drawString(LEFT, top - 42, "TAX INVOICE")
+        name, gstin, address = self.seller
+        c.setFont(BOLD, 12)
+        c.drawRightString(RIGHT, top - 42, fit(name, 300, BOLD, 12))
+        c.setFont(FONT, FONT_SIZE)
+        if gstin:
+            c.drawRightString(RIGHT, top - 58, f"GSTIN: {gstin}")
+        c.drawRightString(RIGHT, top - 72, fit(address, 300))
+        c.setFont(BOLD, FONT_SIZE)
+        for i, label in enumerate(("Invoice Number:", "Date:", "Customer:", "GSTIN:", "Address:")):
+            c.drawString(LEFT, top - 100 - i * ROW_HEIGHT - (10 if i >= 2 else 0), label)
+        self.draw_headings(c, self.first_table_y)
+        c.endForm()
+
+        c.beginForm("invoice_next")
+        self.draw_headings(c, self.next_table_y)
+        c.endForm()
+        c._invoice_forms = self
+
+    def draw_headings(self, c, y):
+        c.setFont(BOLD, FONT_SIZE)
+        for heading, x, right in COLUMNS:
+            (c.drawRightString if right else c.drawString)(x, y, heading)
+        c.setLineWidth(0.5)
+        c.line(LEFT, y - 5, RIGHT, y - 5)
+
+    def amount_width(self, value):
+        widths = self.char_widths
+        return sum(widths[char] for char in value)
+
+    def draw(self, c, invoice):
+        """Draw one invoice onto a canvas, ending each of its pages"""
+        self.compile(c)
+        top = self.pagesize[1]
+        pages = self.paginate(invoice['lines'])
+        for number, page_lines in enumerate(pages, 1):
+            text = c.beginText()
+            text.setFont(FONT, FONT_SIZE)
+            # Relative moves (Td) from the last text position keep the page
+            # stream short: two numbers per string instead of a full matrix
+            at = [0, 0]
+
+            def put(x, y, value):
+                text.moveCursor(x - at[0], at[1] - y)
+                at[0], at[1] = x, y
+                text.textOut(value)
+
+            if number == 1:
+                c.doForm("invoice_first")
+                x = LEFT + self.label_width
+                for i, value in enumerate((invoice['invoice_number'], invoice['invoice_date'],
+                                           invoice['customer_name'], invoice['gstin'], invoice['address'])):
+                    put(x, top - 100 - i * ROW_HEIGHT - (10 if i >= 2 else 0),
+                        fit(str(value) if value is not None else "", RIGHT - x))
+                y = self.first_table_y
+            else:
+                c.doForm("invoice_next")
+                put(LEFT, top - 42, f"Invoice {invoice['invoice_number']} (continued)")
+                y = self.next_table_y
+
+            for product_name, quantity, price, gst_amount, total in page_lines:
+                y -= ROW_HEIGHT
+                put(LEFT, y, fit(product_name, self.product_width))
+                for (_, x, _), value in zip(COLUMNS[1:], (str(quantity), f"{price:.2f}",
+                                                          f"{gst_amount:.2f}", f"{total:.2f}")):
+                    put(x - self.amount_width(value), y, value)
+
+            if number == len(pages):
+                y -= ROW_HEIGHT / 2
+                c.line(COLUMNS[2][1] - 60, y, RIGHT, y)
+                totals = invoice['totals']
+                for label, key in TOTALS:
+                    y -= ROW_HEIGHT
+                    value = f"{totals[key]:.2f}"
+                    put(COLUMNS[2][1] - 60, y, label)
+                    put(RIGHT - self.amount_width(value), y, value)
+
+            footer = f"Page {number} of {len(pages)}"
+            put(RIGHT - stringWidth(footer, FONT, FONT_SIZE), BOTTOM - 30, footer)
+            c.drawText(text)
+            c.showPage()
+        return len(pages)
+
+    def render(self, pdf_path, invoice):
+        """Render one invoice to its own PDF; returns the page count"""
+        c = canvas.Canvas(pdf_path, pagesize=self.pagesize)
+        pages = self.draw(c, invoice)
+        c.save()
+        return pages
+
+    def render_many(self, pdf_path, invoices):
+        """Render a sequence of invoices into one PDF; returns the page count"""
+        c = canvas.Canvas(pdf_path, pagesize=self.pagesize)
+        pages = sum(self.draw(c, invoice) for invoice in invoices)
+        c.save()
+        return pages
+
+
+@lru_cache(maxsize=8)
+def get_template(seller=('', '', '')):
+    """The compiled template for a letterhead, built once per process"""
+    return InvoiceTemplate(seller)
+
+
+def render_invoice(pdf_path, invoice, seller=('', '', '')):
+    """Render a single invoice to a PDF file
+
+    ``invoice`` is a plain dict (so it can be shipped to worker processes)
+    with ``invoice_number``, ``invoice_date``, ``customer_name``, ``gstin``,
+    ``address``, ``lines`` as (product, quantity, price, gst_amount, total)
+    tuples and ``totals`` with taxable/cgst/sgst/igst/total amounts.
+    ``seller`` is the (name, gstin, address) letterhead.
+    """
+    get_template(seller).render(pdf_path, invoice)
+    return pdf_path
+
+
+def render_invoices(pdf_path, invoices, seller=('', '', '')):
+    """Render many invoices into one PDF, e.g. for printing; returns the page count"""
+    return get_template(seller).render_many(pdf_path, invoices)
+
+
+def render_invoice_batch(jobs, seller=('', '', '')):
+    """Render a list of (pdf_path, invoice) pairs; used by worker processes"""
+    return [render_invoice(pdf_path, invoice, seller) for pdf_path, invoice in jobs]
@@ -0,0 +1,146 @@
+from collections import defaultdict
+from datetime import date
+
+import invoice_numbers
+import stock_ledger
+import tax_rollup
+
+
+def first_free_id(cursor, table):
+    """Lowest id past every one ``table`` has ever used
+
+    AUTOINCREMENT tables record the highest id in sqlite_sequence, so the
+    id of a deleted newest row is not handed out again; change_log and
+    sync_rows would otherwise take the new row for the old one.
+    """
+    cursor.execute(f"""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0), COALESCE(MAX(id), 0)) FROM {table}
+    """, (table,))
+    return cursor.fetchone()[0] + 1
+
+
+def insert_invoices(cursor, invoices):
+    """Insert invoice headers, line items and stock decrements
+
+    Each invoice is a dict with ``invoice_number`` (assigned from the
+    invoice series if missing, see invoice_numbers), ``customer_id``,
+    ``invoice_date``, ``place_of_supply`` (optional state code),
+    ``supply_type`` ('INTRA' or 'INTER'; inferred from IGST if missing), ``totals``
+    (as returned by tax_engine.summarize) and ``items`` as (product_id, quantity, price, gst_rate, gst_amount, total)
+    tuples. Ids are assigned to the dicts. Stock is taken out through the
+    stock ledger. Every statement is a single
+    executemany, so the cost per line stays flat however long the invoice is.
+    The caller owns the transaction.
+    """
+    invoice_numbers.assign_numbers(cursor, invoices)
+
+    # Allocate ids up front so line items can reference them without a round
+    # trip per invoice
+    next_id = first_free_id(cursor, 'invoices')
+    for offset, invoice in enumerate(invoices):
+        invoice['id'] = next_id + offset
+        invoice.setdefault('supply_type', 'INTER' if invoice['totals']['igst'] else 'INTRA')
+
+    cursor.executemany("""
+        INSERT INTO invoices (
+            id, invoice_number, customer_id, invoice_date, place_of_supply, supply_type,
+            total_amount, cgst_amount, sgst_amount, igst_amount, status
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (invoice['id'], invoice['invoice_number'], invoice['customer_id'], invoice['invoice_date'],
+         invoice.get('place_of_supply'), invoice['supply_type'], invoice['totals']['total'], invoice['totals']['cgst'],
+         invoice['totals']['sgst'], invoice['totals']['igst'], invoice.get('status', "PAID"))
+        for invoice in invoices
+    ])
+
+    cursor.executemany("""
+        INSERT INTO invoice_items (
+            invoice_id, product_id, quantity, price, gst_rate, gst_amount, total_amount
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        (invoice['id'],) + tuple(item)
+        for invoice in invoices
+        for item in invoice['items']
+    ))
+
+    # Stock leaves through the ledger, one movement per product per invoice
+    sold = defaultdict(int)
+    for invoice in invoices:
+        for item in invoice['items']:
+            sold[invoice['id'], item[0]] += item[1]
+    references = {invoice['id']: (invoice['invoice_date'], invoice['invoice_number']) for invoice in invoices}
+    stock_ledger.record(cursor, [
+        (product_id, references[invoice_id][0], -quantity, stock_ledger.SALE, references[invoice_id][1])
+        for (invoice_id, product_id), quantity in sold.items()
+    ])
+
+    # Keep the daily tax rollup in step with the invoices it summarises
+    tax_rollup.apply(cursor, [invoice for invoice in invoices if invoice.get('status') != "CANCELLED"])
+
+
+def cancel_invoices(cursor, invoice_ids):
+    """Mark invoices cancelled, put their stock back and drop them from the rollup
+
+    Invoices that are already cancelled are left alone. Returns the number
+    cancelled. The caller owns the transaction.
+    """
+    placeholders = ", ".join("?" * len(invoice_ids))
+    cursor.execute(f"""
+        SELECT id, invoice_date, place_of_supply, supply_type, igst_amount, invoice_number,
+               total_amount, cgst_amount, sgst_amount
+        FROM invoices
+        WHERE id IN ({placeholders}) AND COALESCE(status, '') != 'CANCELLED'
+    """, list(invoice_ids))
+    invoices = {
+        row[0]: {
+            'id': row[0],
+            'invoice_date': row[1],
+            'place_of_supply': row[2],
+            'supply_type': row[3] or ('INTER' if row[4] else 'INTRA'),
+            'invoice_number': row[5],
+            'totals': {'total': row[6], 'cgst': row[7], 'sgst': row[8], 'igst': row[4]},
+            'items': [],
+        }
+        for row in cursor.fetchall()
+    }
+    if not invoices:
+        return 0
+
+    placeholders = ", ".join("?" * len(invoices))
+    cursor.execute(f"""
+        SELECT invoice_id, product_id, quantity, price, gst_rate, gst_amount, total_amount
+        FROM invoice_items
+        WHERE invoice_id IN ({placeholders})
+    """, list(invoices))
+    returned = defaultdict(int)
+    for row in cursor.fetchall():
+        invoices[row[0]]['items'].append(row[1:])
+        returned[row[0], row[1]] += row[2]
+
+    cursor.executemany("UPDATE invoices SET status = 'CANCELLED' WHERE id = ?", [(invoice_id,) for invoice_id in invoices])
+    # The goods come back on the day of the cancellation
+    today = str(date.today())
+    stock_ledger.record(cursor, [
+        (product_id, today, quantity, stock_ledger.CANCEL, invoices[invoice_id]['invoice_number'])
+        for (invoice_id, product_id), quantity in returned.items()
+    ])
+    tax_rollup.apply(cursor, invoices.values(), sign=-1)
+    return len(invoices)
+
+
+def save_invoices(conn, invoices):
+    """Write invoices with their items and stock decrements in one transaction"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        insert_invoices(cursor, invoices)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return invoices
+
+
+def save_invoice(conn, invoice):
+    """Write a single invoice atomically and return its id"""
+    return save_invoices(conn, [invoice])[0]['id']
@@ -0,0 +1,176 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once it has been asked to stop"""
+
+
+class Job:
+    """Handle for a background job, passed as the first argument to its function"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, runner, name):
+        self.id = next(self._ids)
+        self.name = name
+        self.status = "Queued"
+        self.progress = 0.0
+        self.message = ""
+        self.future = None
+        self._runner = runner
+        self._cancel_event = threading.Event()
+        self._cancel_hooks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Stop the job at a safe point if cancellation was requested"""
+        if self._cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def on_cancel(self, hook):
+        """Register a callable (e.g. sqlite3.Connection.interrupt) run on cancel"""
+        with self._lock:
+            self._cancel_hooks.append(hook)
+            if not self._cancel_event.is_set():
+                return
+        hook()
+
+    def remove_cancel_hook(self, hook):
+        """Forget a hook once the resource it interrupts is released"""
+        with self._lock:
+            if hook in self._cancel_hooks:
+                self._cancel_hooks.remove(hook)
+
+    def cancel(self):
+        """Ask the job to stop; a job that has not started yet never runs"""
+        with self._lock:
+            self._cancel_event.set()
+            hooks = list(self._cancel_hooks)
+        if self.future is not None:
+            self.future.cancel()
+        for hook in hooks:
+            hook()
+
+    def report_progress(self, fraction=None, message=""):
+        """Publish progress (0..1, or None if unknown) to the UI thread"""
+        self.check_cancelled()
+        self._runner.post(self, "progress", (fraction, message))
+
+
+class JobRunner:
+    """Run jobs on a thread pool and deliver their events on the Tk thread
+
+    Worker threads never touch Tk. They push events onto a queue which the
+    UI drains from ``root.after``, so callbacks always run on the main loop.
+    """
+
+    def __init__(self, root, max_workers=3, poll_interval_ms=50):
+        self.root = root
+        self.poll_interval_ms = poll_interval_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.jobs = {}
+        self._events = queue.Queue()
+        self._callbacks = {}
+        self._listeners = []
+        self._polling = False
+
+    def submit(self, name, fn, *args, on_progress=None, on_done=None, on_error=None, **kwargs):
+        """Queue ``fn(job, *args, **kwargs)`` and return its Job"""
+        job = Job(self, name)
+        self.jobs[job.id] = job
+        self._callbacks[job.id] = (on_progress, on_done, on_error)
+        job.future = self.executor.submit(self._run, job, fn, args, kwargs)
+        self._notify(job)
+        self._schedule_poll()
+        return job
+
+    def add_listener(self, listener):
+        """Call ``listener(job)`` on the Tk thread whenever any job changes"""
+        self._listeners.append(listener)
+
+    def post(self, job, kind, payload=None):
+        """Queue an event for the UI thread (safe to call from any thread)"""
+        self._events.put((job, kind, payload))
+
+    def cancel(self, job):
+        """Cancel a queued or running job"""
+        job.cancel()
+        if job.future.cancelled():
+            self.post(job, "cancelled")
+            self._schedule_poll()
+
+    def cancel_all(self):
+        for job in list(self.jobs.values()):
+            if job.status in ("Queued", "Running"):
+                self.cancel(job)
+
+    def shutdown(self):
+        """Cancel outstanding jobs and stop the worker threads"""
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            self.post(job, "cancelled")
+            return
+        self.post(job, "started")
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self.post(job, "cancelled")
+        except Exception as e:
+            # An interrupted query surfaces as sqlite3.OperationalError
+            self.post(job, "cancelled" if job.cancelled else "error", e)
+        else:
+            self.post(job, "done", result)
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval_ms, self._poll)
+
+    def _poll(self):
+        """Dispatch queued events on the Tk thread"""
+        while True:
+            try:
+                job, kind, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch(job, kind, payload)
+
+        self._polling = False
+        if any(job.status in ("Queued", "Running") for job in self.jobs.values()):
+            self._schedule_poll()
+
+    def _dispatch(self, job, kind, payload):
+        on_progress, on_done, on_error = self._callbacks.get(job.id, (None, None, None))
+        if kind == "started":
+            job.status = "Running"
+        elif kind == "progress":
+            fraction, job.message = payload
+            if fraction is not None:
+                job.progress = fraction
+            if on_progress:
+                on_progress(job, fraction, job.message)
+        elif kind == "done":
+            job.status, job.progress = "Done", 1.0
+            if on_done:
+                on_done(job, payload)
+        elif kind == "error":
+            job.status, job.message = "Failed", str(payload)
+            if on_error:
+                on_error(job, payload)
+        elif kind == "cancelled":
+            job.status = "Cancelled"
+        self._notify(job)
+
+    def _notify(self, job):
+        for listener in self._listeners:
+            listener(job)
@@ -1,10 +1,30 @@
+import time
+
+# Start of the clock for the startup report (see startup_timing.py)
+STARTED = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk
 from ttkthemes import ThemedTk
-import sqlite3
 from datetime import datetime
+import json
+import logging
+import multiprocessing
 import os
-from PIL import Image, ImageTk
+from db import Database
+from jobs import JobRunner
+from master_data import ChangeLogMonitor, MasterDataCache
+from stock_alerts import LowStockMonitor
+import stock_ledger
+import tax_rollup
+
+# The tab modules (and what they import) load when their tab is first shown
+IMPORTED = time.perf_counter()
+
+# Set to a file path to have the app write its startup timings there and quit
+STARTUP_REPORT_ENV = "GSTBILL_STARTUP_REPORT"
+
+logger = logging.getLogger(__name__)
 
 class GSTBillingApp:
     def __init__(self, root):
@@ -14,6 +34,16 @@ class GSTBillingApp:
         
         # Initialize database
         self.init_database()
+        self.master_data = MasterDataCache(self.db)
+        self.stock_alerts = LowStockMonitor(self.db, master_data=self.master_data)
+        self.stock_alerts.start(self.root)
+        # Picks up customer and product edits from other processes, such as
+        # a branch sync import
+        self.master_changes = ChangeLogMonitor(self.db, self.master_data)
+        self.master_changes.start(self.root)
+        self.jobs = JobRunner(self.root)
+        self.seller_gstin = self.db.get_setting('seller_gstin')
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
         # Create main menu
         self.create_menu()
@@ -21,87 +51,28 @@ class GSTBillingApp:
         # Create main notebook for tabs
         self.notebook = ttk.Notebook(self.root)
         self.notebook.pack(expand=True, fill='both', padx=5, pady=5)
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         
-        # Create main tabs
+        # Only the dashboard is built now; every other tab is an empty frame
+        # until it is first selected
+        self.unbuilt_tabs = {}
         self.create_dashboard_tab()
-        self.create_billing_tab()
-        self.create_accounting_tab()
-        self.create_inventory_tab()
-        self.create_reports_tab()
+        self.billing_frame = self.add_tab("Billing", self.create_billing_tab)
+        self.add_tab("Customers & Products", self.create_data_tab)
+        self.add_tab("Accounting", self.create_accounting_tab)
+        self.add_tab("Inventory", self.create_inventory_tab)
+        self.reports_frame = self.add_tab("Reports", self.create_reports_tab)
+        
+        # Tab name -> milliseconds it took to build, for the startup report
+        self.tab_build_ms = {}
+        self.root.after_idle(self.on_first_window)
         
     def init_database(self):
-        """Initialize SQLite database and create necessary tables"""
+        """Open the shared database; tables are created or upgraded on open"""
         db_path = os.path.join('data', 'gst_billing.db')
-        os.makedirs('data', exist_ok=True)
-        
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
-        
-        # Create necessary tables
-        self.create_tables()
-        
-    def create_tables(self):
-        """Create all necessary database tables"""
-        # Customers table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS customers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                gstin TEXT,
-                address TEXT,
-                phone TEXT,
-                email TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Products table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                hsn_code TEXT,
-                gst_rate REAL,
-                price REAL,
-                stock_quantity INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Invoices table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_number TEXT UNIQUE,
-                customer_id INTEGER,
-                invoice_date DATE,
-                total_amount REAL,
-                cgst_amount REAL,
-                sgst_amount REAL,
-                igst_amount REAL,
-                status TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (customer_id) REFERENCES customers (id)
-            )
-        ''')
-        
-        # Invoice items table
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoice_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                invoice_id INTEGER,
-                product_id INTEGER,
-                quantity INTEGER,
-                price REAL,
-                gst_rate REAL,
-                gst_amount REAL,
-                total_amount REAL,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id),
-                FOREIGN KEY (product_id) REFERENCES products (id)
-            )
-        ''')
-        
-        self.conn.commit()
+        self.db = Database(db_path)
+        # Month-end stock checkpoints, queued so start-up does not wait on them
+        self.db.write(stock_ledger.checkpoint_months)
         
     def create_menu(self):
         """Create the main menu bar"""
@@ -114,7 +85,7 @@ class GSTBillingApp:
         file_menu.add_command(label="New Invoice", command=self.new_invoice)
         file_menu.add_command(label="Export Data", command=self.export_data)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.on_close)
         
         # Reports menu
         reports_menu = tk.Menu(menubar, tearoff=0)
@@ -128,44 +99,137 @@ class GSTBillingApp:
         menubar.add_cascade(label="Help", menu=help_menu)
         help_menu.add_command(label="About", command=self.show_about)
         
+    def add_tab(self, text, build):
+        """Add an empty tab that ``build(frame)`` fills the first time it is shown"""
+        frame = ttk.Frame(self.notebook)
+        self.notebook.add(frame, text=text)
+        self.unbuilt_tabs[str(frame)] = (text, frame, build)
+        return frame
+        
+    def build_tab(self, frame):
+        """Build a tab now if it has not been built yet"""
+        pending = self.unbuilt_tabs.pop(str(frame), None)
+        if pending is None:
+            return
+        text, frame, build = pending
+        started = time.perf_counter()
+        build(frame)
+        self.tab_build_ms[text] = (time.perf_counter() - started) * 1000
+        logger.info("Built the %s tab in %.0f ms", text, self.tab_build_ms[text])
+        
+    def show_tab(self, frame):
+        """Bring a tab to the front, building it first if needed"""
+        self.build_tab(frame)
+        self.notebook.select(frame)
+        
+    def on_first_window(self):
+        """Log the time to the first window and write the startup report if asked"""
+        self.root.update_idletasks()
+        report = {
+            'import_ms': round((IMPORTED - STARTED) * 1000, 1),
+            'first_window_ms': round((time.perf_counter() - STARTED) * 1000, 1),
+        }
+        logger.info("First window after %.0f ms (%.0f ms of imports)", report['first_window_ms'], report['import_ms'])
+        path = os.environ.get(STARTUP_REPORT_ENV)
+        if not path:
+            return
+        # Build the other tabs too so their cost shows in the report
+        for frame in [frame for _, frame, _ in self.unbuilt_tabs.values()]:
+            self.build_tab(frame)
+        report['tab_build_ms'] = {text: round(ms, 1) for text, ms in self.tab_build_ms.items()}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.on_close()
+        
     def create_dashboard_tab(self):
         """Create the dashboard tab with summary information"""
         dashboard_frame = ttk.Frame(self.notebook)
         self.notebook.add(dashboard_frame, text="Dashboard")
         
-        # Add dashboard widgets here
-        
-    def create_billing_tab(self):
+        # Period summaries read the daily tax rollup, so they cost one row
+        # per day rather than one per invoice
+        columns = ("Period", "Sales", "CGST", "SGST", "IGST")
+        self.summary_tree = ttk.Treeview(dashboard_frame, columns=columns, show="headings", height=3)
+        for col in columns:
+            self.summary_tree.heading(col, text=col)
+            self.summary_tree.column(col, width=150)
+        self.summary_tree.pack(fill=tk.X, padx=5, pady=5)
+        ttk.Button(dashboard_frame, text="Refresh", command=self.refresh_dashboard).pack(anchor=tk.W, padx=5)
+        
+        self.dashboard_frame = dashboard_frame
+        self.refresh_dashboard()
+        
+    def refresh_dashboard(self):
+        """Reload today's, this month's and this financial year's totals"""
+        today = datetime.now().date()
+        year_start = today.replace(month=4, day=1)
+        if today.month < 4:
+            year_start = year_start.replace(year=today.year - 1)
+        periods = [
+            ("Today", today),
+            ("This Month", today.replace(day=1)),
+            ("Financial Year", year_start),
+        ]
+        
+        self.summary_tree.delete(*self.summary_tree.get_children())
+        with self.db.reader() as conn:
+            for label, start in periods:
+                # Plain division: numpy (tax_engine) is only loaded once a tab needs it
+                paise = tax_rollup.summary(conn, start, today)
+                self.summary_tree.insert("", tk.END, values=(label,) + tuple(f"{value / 100:.2f}" for value in paise))
+        
+    def on_tab_changed(self, event):
+        """Build a tab on its first selection; refresh the dashboard on every one"""
+        selected = self.notebook.select()
+        if selected == str(self.dashboard_frame):
+            self.refresh_dashboard()
+        else:
+            self.build_tab(selected)
+        
+    def create_billing_tab(self, billing_frame):
         """Create the billing tab for invoice management"""
-        billing_frame = ttk.Frame(self.notebook)
-        self.notebook.add(billing_frame, text="Billing")
+        from billing import BillingModule
+        import tax_engine
         
-        # Add billing widgets here
+        seller_state_code = tax_engine.state_code_from_gstin(self.seller_gstin)
+        self.billing = BillingModule(billing_frame, self.db, seller_state_code=seller_state_code,
+                                     master_data=self.master_data)
+        self.billing.create_billing_frame(billing_frame).pack(expand=True, fill='both')
         
-    def create_accounting_tab(self):
-        """Create the accounting tab for financial management"""
-        accounting_frame = ttk.Frame(self.notebook)
-        self.notebook.add(accounting_frame, text="Accounting")
+    def create_data_tab(self, data_frame):
+        """Create the customer and product management tab"""
+        from data_management import DataManagement
         
+        self.data_management = DataManagement(data_frame, self.db, master_data=self.master_data)
+        data_notebook = ttk.Notebook(data_frame)
+        data_notebook.pack(expand=True, fill='both')
+        data_notebook.add(self.data_management.create_customer_frame(data_notebook), text="Customers")
+        data_notebook.add(self.data_management.create_product_frame(data_notebook), text="Products")
+        
+    def create_accounting_tab(self, accounting_frame):
+        """Create the accounting tab for financial management"""
         # Add accounting widgets here
+        pass
         
-    def create_inventory_tab(self):
+    def create_inventory_tab(self, inventory_frame):
         """Create the inventory management tab"""
-        inventory_frame = ttk.Frame(self.notebook)
-        self.notebook.add(inventory_frame, text="Inventory")
+        from inventory import InventoryManagement
         
-        # Add inventory widgets here
+        self.inventory = InventoryManagement(inventory_frame, self.db, master_data=self.master_data,
+                                             monitor=self.stock_alerts)
+        self.inventory.create_inventory_frame(inventory_frame).pack(expand=True, fill='both')
         
-    def create_reports_tab(self):
+    def create_reports_tab(self, reports_frame):
         """Create the reports tab for GST reports"""
-        reports_frame = ttk.Frame(self.notebook)
-        self.notebook.add(reports_frame, text="Reports")
+        from reports import GSTReports
         
-        # Add reports widgets here
+        self.reports = GSTReports(reports_frame, self.db, seller_gstin=self.seller_gstin, job_runner=self.jobs)
+        self.reports.create_reports_frame(reports_frame).pack(expand=True, fill='both')
         
     def new_invoice(self):
         """Create a new invoice"""
-        pass
+        self.show_tab(self.billing_frame)
+        self.billing.clear_invoice()
         
     def export_data(self):
         """Export data to Excel/CSV"""
@@ -173,21 +237,35 @@ class GSTBillingApp:
         
     def generate_gstr1(self):
         """Generate GSTR-1 report"""
-        pass
+        self.show_tab(self.reports_frame)
+        self.reports.generate_gstr1()
         
     def generate_gstr2(self):
         """Generate GSTR-2 report"""
-        pass
+        self.show_tab(self.reports_frame)
+        self.reports.generate_gstr2()
         
     def generate_gstr3b(self):
         """Generate GSTR-3B report"""
-        pass
+        self.show_tab(self.reports_frame)
+        self.reports.generate_gstr3b()
         
     def show_about(self):
         """Show about dialog"""
         pass
+        
+    def on_close(self):
+        """Stop background jobs, flush pending writes and close the database"""
+        self.jobs.shutdown()
+        self.db.close()
+        self.root.destroy()
 
 if __name__ == "__main__":
+    # Report writers and bulk PDF rendering use child processes
+    multiprocessing.freeze_support()
+    os.makedirs('data', exist_ok=True)
+    logging.basicConfig(filename=os.path.join('data', 'gst_billing.log'), level=logging.INFO,
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
     root = ThemedTk(theme="arc")  # Using a modern theme
     app = GSTBillingApp(root)
     root.mainloop() 
\ No newline at end of file
@@ -0,0 +1,174 @@
+import threading
+from collections import OrderedDict
+
+# Rows kept per table; the least recently used are dropped beyond this
+CACHE_SIZE = 5000
+
+# Columns cached for each table, id first
+COLUMNS = {
+    'customers': ('id', 'name', 'gstin', 'address', 'phone', 'email', 'state_code'),
+    'products': ('id', 'name', 'hsn_code', 'gst_rate', 'price', 'stock_quantity', 'min_stock_level'),
+}
+
+
+class MasterDataCache:
+    """Customers and products shared by every tab, keyed by id and by name
+
+    Rows are loaded on first use and evicted least recently used. Whoever
+    writes to these tables calls ``changed`` once the write has committed:
+    the rows are dropped, ``version`` goes up and every subscriber is told
+    which ids changed so it can refresh just those rows. Subscribers are
+    called on the thread that calls ``changed`` (the Tk thread in the app).
+    """
+
+    def __init__(self, db, max_rows=CACHE_SIZE):
+        self.db = db
+        self.max_rows = max_rows
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._rows = {table: OrderedDict() for table in COLUMNS}
+        self._names = {table: {} for table in COLUMNS}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def get(self, table, row_id):
+        """Row as a dict, or None if there is no such id"""
+        with self._lock:
+            row = self._rows[table].get(row_id)
+            if row is not None:
+                self._rows[table].move_to_end(row_id)
+                self.hits += 1
+                return row
+        return self._load(table, "id = ?", row_id)
+
+    def by_name(self, table, name):
+        """A row with this exact name, or None"""
+        with self._lock:
+            row_id = self._names[table].get(name)
+            if row_id is not None:
+                self._rows[table].move_to_end(row_id)
+                self.hits += 1
+                return self._rows[table][row_id]
+        return self._load(table, "name = ? ORDER BY id LIMIT 1", name)
+
+    def _load(self, table, where, value):
+        with self._lock:
+            self.misses += 1
+            version = self.version
+        with self.db.reader() as conn:
+            values = conn.execute(f"SELECT {', '.join(COLUMNS[table])} FROM {table} WHERE {where}",
+                                  (value,)).fetchone()
+        if values is None:
+            return None
+        row = dict(zip(COLUMNS[table], values))
+        with self._lock:
+            # A write committed while this read was in flight may have made
+            # the row stale; return it but do not cache it
+            if version == self.version:
+                self._store(table, row)
+        return row
+
+    def _store(self, table, row):
+        rows = self._rows[table]
+        names = self._names[table]
+        if row['id'] in rows:
+            self._forget(table, row['id'])
+        rows[row['id']] = row
+        names.setdefault(row['name'], row['id'])
+        while len(rows) > self.max_rows:
+            self._forget(table, next(iter(rows)))
+
+    def _forget(self, table, row_id):
+        row = self._rows[table].pop(row_id, None)
+        if row is not None and self._names[table].get(row['name']) == row_id:
+            del self._names[table][row['name']]
+
+    def changed(self, table, ids):
+        """Record committed inserts, updates or deletes of these ids and notify subscribers"""
+        ids = set(ids)
+        with self._lock:
+            self.version += 1
+            version = self.version
+            for row_id in ids:
+                self._forget(table, row_id)
+            # A renamed or deleted row may have been shadowing another with
+            # the same name, so name lookups start afresh
+            names = self._names[table] = {}
+            for row_id, row in self._rows[table].items():
+                names.setdefault(row['name'], row_id)
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(table, ids, version)
+
+    def subscribe(self, callback):
+        """Call ``callback(table, ids, version)`` after every change"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def clear(self):
+        """Drop every cached row, e.g. after another process changed the database"""
+        with self._lock:
+            self.version += 1
+            for table in COLUMNS:
+                self._rows[table].clear()
+                self._names[table].clear()
+
+
+class ChangeLogMonitor:
+    """Drops cached rows that another process changed, e.g. a branch sync import
+
+    Reads the customer and product entries of ``change_log`` committed since
+    the last poll, every ``interval_ms`` on the UI thread once started, and
+    passes their ids to ``MasterDataCache.changed``. Stock is not in the
+    change log (every sale would log its products), so products with new
+    ``stock_movements`` are refreshed too. Changes this process made itself
+    are announced a second time, which only refreshes those rows again.
+    """
+
+    def __init__(self, db, master_data, interval_ms=2000):
+        self.db = db
+        self.master_data = master_data
+        self.interval_ms = interval_ms
+        self._widget = None
+        with db.reader() as conn:
+            self.last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+            self.last_movement_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM stock_movements").fetchone()[0]
+
+    def start(self, widget):
+        """Start polling on the Tk main loop of ``widget``"""
+        self._widget = widget
+        widget.after(self.interval_ms, self._tick)
+
+    def _tick(self):
+        try:
+            self.poll()
+        finally:
+            self._widget.after(self.interval_ms, self._tick)
+
+    def poll(self):
+        """Announce customers and products (or their stock) changed since the last poll; returns {table: ids}"""
+        # The unary + keeps the planner on the seq range, which holds only
+        # the changes since the last poll
+        with self.db.reader() as conn:
+            rows = conn.execute("""
+                SELECT seq, table_name, row_id FROM change_log
+                WHERE seq > ? AND +table_name IN ('customers', 'products')
+                ORDER BY seq
+            """, (self.last_seq,)).fetchall()
+            movements = conn.execute("SELECT id, product_id FROM stock_movements WHERE id > ? ORDER BY id",
+                                     (self.last_movement_id,)).fetchall()
+        changed = {}
+        if rows:
+            self.last_seq = rows[-1][0]
+            for _, table, row_id in rows:
+                changed.setdefault(table, set()).add(row_id)
+        if movements:
+            self.last_movement_id = movements[-1][0]
+            changed.setdefault('products', set()).update(product_id for _, product_id in movements)
+        for table, ids in changed.items():
+            self.master_data.changed(table, ids)
+        return changed
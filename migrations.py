@@ -0,0 +1,528 @@
+import argparse
+import os
+import sqlite3
+
+
+def add_column(cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists
+
+    Adding a column only rewrites the schema, never the table, so this is
+    cheap even on very large databases.
+    """
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def backfill_tax_rollup(cursor):
+    """Populate tax_rollup_daily from the invoices already in the database"""
+    import tax_rollup
+
+    tax_rollup.rebuild(cursor)
+
+
+def backfill_stock_ledger(cursor):
+    """Populate stock_movements and its checkpoints from existing invoices and purchases"""
+    import stock_ledger
+
+    stock_ledger.backfill(cursor)
+
+
+def change_log_triggers(table, update_columns=None):
+    """Triggers recording every insert, update and delete on ``table`` in change_log
+
+    Rows written while a sync import holds a row in sync_applying are
+    tagged with the branch they came from; local changes have no origin.
+    """
+    steps = []
+    for event, row in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+        columns = f" OF {', '.join(update_columns)}" if event == "UPDATE" and update_columns else ""
+        steps.append(f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_log_{event.lower()} AFTER {event}{columns} ON {table} BEGIN
+            INSERT INTO change_log (table_name, row_id, op, origin)
+            VALUES ('{table}', {row}.id, '{event[0]}', (SELECT origin FROM sync_applying));
+        END
+        """)
+    return steps
+
+
+def backfill_change_log(cursor):
+    """Log the rows already in the database as inserts, so a first export carries them all"""
+    for table in ("customers", "products", "invoices", "invoice_items"):
+        cursor.execute(f"INSERT INTO change_log (table_name, row_id, op) SELECT '{table}', id, 'I' FROM {table}")
+
+
+# Ordered list of (version, description, steps). A step is either an SQL
+# statement or a callable taking a cursor. Migrations are append-only: never
+# edit one that has shipped, add a new version instead.
+MIGRATIONS = [
+    (1, "Base tables", [
+        '''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            gstin TEXT,
+            address TEXT,
+            phone TEXT,
+            email TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            hsn_code TEXT,
+            gst_rate REAL,
+            price REAL,
+            stock_quantity INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_number TEXT UNIQUE,
+            customer_id INTEGER,
+            invoice_date DATE,
+            total_amount REAL,
+            cgst_amount REAL,
+            sgst_amount REAL,
+            igst_amount REAL,
+            status TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS invoice_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id INTEGER,
+            product_id INTEGER,
+            quantity INTEGER,
+            price REAL,
+            gst_rate REAL,
+            gst_amount REAL,
+            total_amount REAL,
+            FOREIGN KEY (invoice_id) REFERENCES invoices (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+        ''',
+    ]),
+    (2, "Hot path indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name)",
+        "CREATE INDEX IF NOT EXISTS idx_products_name ON products (name)",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_date)",
+        "CREATE INDEX IF NOT EXISTS idx_invoices_customer ON invoices (customer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice ON invoice_items (invoice_id)",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_items_product ON invoice_items (product_id)",
+    ]),
+    (3, "Columns and tables already used by inventory and reports", [
+        lambda cursor: add_column(cursor, "products", "min_stock_level", "INTEGER DEFAULT 0"),
+        '''
+        CREATE TABLE IF NOT EXISTS vendors (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            gstin TEXT,
+            address TEXT,
+            phone TEXT,
+            email TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_number TEXT,
+            invoice_date DATE,
+            vendor_id INTEGER,
+            product_id INTEGER,
+            product_name TEXT,
+            hsn_code TEXT,
+            quantity INTEGER,
+            price REAL,
+            gst_rate REAL,
+            gst_amount REAL,
+            total_amount REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (vendor_id) REFERENCES vendors (id),
+            FOREIGN KEY (product_id) REFERENCES products (id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_vendors_name ON vendors (name)",
+        "CREATE INDEX IF NOT EXISTS idx_purchases_date ON purchases (invoice_date)",
+    ]),
+    (4, "Place of supply and business settings", [
+        # Existing invoices keep NULL and fall back to the customer's state
+        lambda cursor: add_column(cursor, "invoices", "place_of_supply", "TEXT"),
+        lambda cursor: add_column(cursor, "customers", "state_code", "TEXT"),
+        '''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        ''',
+        # Lets GSTR-1 sum lines per invoice and rate in index order, no sort
+        "CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice_rate ON invoice_items (invoice_id, gst_rate)",
+    ]),
+    (5, "Daily tax rollup", [
+        lambda cursor: add_column(cursor, "invoices", "supply_type", "TEXT"),
+        '''
+        CREATE TABLE IF NOT EXISTS tax_rollup_daily (
+            invoice_date DATE NOT NULL,
+            gst_rate REAL NOT NULL,
+            place_of_supply TEXT NOT NULL,
+            supply_type TEXT NOT NULL,
+            invoice_count INTEGER NOT NULL DEFAULT 0,
+            taxable_paise INTEGER NOT NULL DEFAULT 0,
+            cgst_paise INTEGER NOT NULL DEFAULT 0,
+            sgst_paise INTEGER NOT NULL DEFAULT 0,
+            igst_paise INTEGER NOT NULL DEFAULT 0,
+            total_paise INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (invoice_date, gst_rate, place_of_supply, supply_type)
+        ) WITHOUT ROWID
+        ''',
+        backfill_tax_rollup,
+    ]),
+    (6, "Sort indexes for the paged customer and product lists", [
+        "CREATE INDEX IF NOT EXISTS idx_customers_gstin ON customers (gstin)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_phone ON customers (phone)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_email ON customers (email)",
+        "CREATE INDEX IF NOT EXISTS idx_products_hsn_code ON products (hsn_code)",
+        "CREATE INDEX IF NOT EXISTS idx_products_gst_rate ON products (gst_rate)",
+        "CREATE INDEX IF NOT EXISTS idx_products_price ON products (price)",
+        "CREATE INDEX IF NOT EXISTS idx_products_stock_quantity ON products (stock_quantity)",
+    ]),
+    (7, "Typeahead search indexes", [
+        # Case-insensitive name ranges for "starts with" matches
+        "CREATE INDEX IF NOT EXISTS idx_customers_name_nocase ON customers (name COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_products_name_nocase ON products (name COLLATE NOCASE)",
+        # External-content FTS5 tables: the text lives in customers/products
+        # and triggers keep the index in step inside the writing transaction
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(
+            name, gstin, phone, content='customers', content_rowid='id', prefix='1 2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS customers_fts_insert AFTER INSERT ON customers BEGIN
+            INSERT INTO customers_fts (rowid, name, gstin, phone) VALUES (new.id, new.name, new.gstin, new.phone);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS customers_fts_delete AFTER DELETE ON customers BEGIN
+            INSERT INTO customers_fts (customers_fts, rowid, name, gstin, phone)
+            VALUES ('delete', old.id, old.name, old.gstin, old.phone);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS customers_fts_update AFTER UPDATE OF name, gstin, phone ON customers BEGIN
+            INSERT INTO customers_fts (customers_fts, rowid, name, gstin, phone)
+            VALUES ('delete', old.id, old.name, old.gstin, old.phone);
+            INSERT INTO customers_fts (rowid, name, gstin, phone) VALUES (new.id, new.name, new.gstin, new.phone);
+        END
+        """,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, hsn_code, content='products', content_rowid='id', prefix='1 2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, hsn_code) VALUES (new.id, new.name, new.hsn_code);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, hsn_code)
+            VALUES ('delete', old.id, old.name, old.hsn_code);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF name, hsn_code ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, hsn_code)
+            VALUES ('delete', old.id, old.name, old.hsn_code);
+            INSERT INTO products_fts (rowid, name, hsn_code) VALUES (new.id, new.name, new.hsn_code);
+        END
+        """,
+        "INSERT INTO customers_fts (customers_fts) VALUES ('rebuild')",
+        "INSERT INTO products_fts (products_fts) VALUES ('rebuild')",
+    ]),
+    (8, "Invoice number series", [
+        '''
+        CREATE TABLE IF NOT EXISTS invoice_series (
+            series TEXT NOT NULL,
+            financial_year TEXT NOT NULL,
+            next_number INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (series, financial_year)
+        ) WITHOUT ROWID
+        ''',
+        # Reserved numbers that could not be given back, reported as cancelled
+        '''
+        CREATE TABLE IF NOT EXISTS invoice_number_voids (
+            series TEXT NOT NULL,
+            financial_year TEXT NOT NULL,
+            first_number INTEGER NOT NULL,
+            last_number INTEGER NOT NULL,
+            voided_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (9, "Stock ledger and balance checkpoints", [
+        # Signed quantities: stock in is positive, out is negative
+        '''
+        CREATE TABLE IF NOT EXISTS stock_movements (
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            movement_date DATE NOT NULL,
+            quantity INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            reference TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_stock_movements_product_date ON stock_movements (product_id, movement_date)",
+        "CREATE INDEX IF NOT EXISTS idx_stock_movements_date ON stock_movements (movement_date)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS stock_movements_no_update BEFORE UPDATE ON stock_movements BEGIN
+            SELECT RAISE(ABORT, 'stock_movements is append-only');
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS stock_movements_no_delete BEFORE DELETE ON stock_movements BEGIN
+            SELECT RAISE(ABORT, 'stock_movements is append-only');
+        END
+        ''',
+        # Stock of a product at the end of a day
+        '''
+        CREATE TABLE IF NOT EXISTS stock_checkpoints (
+            product_id INTEGER NOT NULL,
+            checkpoint_date DATE NOT NULL,
+            balance INTEGER NOT NULL,
+            PRIMARY KEY (product_id, checkpoint_date)
+        ) WITHOUT ROWID
+        ''',
+        backfill_stock_ledger,
+    ]),
+    (10, "Low stock index and alerts", [
+        # Holds only the products at or below their reorder level, so the
+        # alerts list reads just those
+        '''
+        CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products (name)
+        WHERE stock_quantity <= min_stock_level
+        ''',
+        # Crossings of the reorder level (low = 1) and back (low = 0) as committed
+        '''
+        CREATE TABLE IF NOT EXISTS stock_alerts (
+            id INTEGER PRIMARY KEY,
+            product_id INTEGER NOT NULL,
+            stock_quantity INTEGER,
+            min_stock_level INTEGER,
+            low INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (11, "Change log for branch sync", [
+        # AUTOINCREMENT so a sequence number is never reused, even after the
+        # newest entries are deleted; op is 'I', 'U' or 'D'
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            origin TEXT,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log (table_name, row_id)",
+        # Holds the importing branch for the length of a sync import only
+        "CREATE TABLE IF NOT EXISTS sync_applying (origin TEXT NOT NULL)",
+        *change_log_triggers("customers"),
+        # Stock levels belong to each branch and are not synced
+        *change_log_triggers("products", ["name", "hsn_code", "gst_rate", "price", "min_stock_level"]),
+        *change_log_triggers("invoices"),
+        *change_log_triggers("invoice_items"),
+        # Which local row stands for each row of another branch, and the
+        # change_log position it was last brought up to date at
+        '''
+        CREATE TABLE IF NOT EXISTS sync_rows (
+            origin TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            remote_id INTEGER NOT NULL,
+            local_id INTEGER NOT NULL,
+            synced_seq INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (origin, table_name, remote_id)
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            origin TEXT PRIMARY KEY,
+            last_seq INTEGER NOT NULL,
+            imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Master data edited at both ends, and which side was kept
+        '''
+        CREATE TABLE IF NOT EXISTS sync_conflicts (
+            id INTEGER PRIMARY KEY,
+            origin TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            local_id INTEGER,
+            kept TEXT NOT NULL,
+            local_values TEXT,
+            remote_values TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        backfill_change_log,
+    ]),
+    # Version 5 rolled up line items only, and invoices saved before line
+    # items were stored were left out
+    (12, "Tax rollup for invoices without line items", [
+        backfill_tax_rollup,
+    ]),
+    (13, "Sync links by local row", [
+        # A branch export looks up which branch a referenced row came from
+        "CREATE INDEX IF NOT EXISTS idx_sync_rows_local ON sync_rows (table_name, local_id)",
+    ]),
+]
+
+
+def current_version(conn):
+    """Highest applied schema version (0 for an unversioned database)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(conn, target=None):
+    """Bring the database up to date in place and return the versions applied
+
+    Each migration runs in its own transaction, so an interrupted upgrade
+    leaves the database at the last completed version and can simply be
+    re-run. Databases created before versioning existed start at 0 and pick
+    up the base tables as no-ops.
+    """
+    applied = []
+    version = current_version(conn)
+    cursor = conn.cursor()
+    for number, description, steps in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (number, description),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(number)
+
+    if applied:
+        # Refresh planner statistics on a bounded sample so new indexes are
+        # used straight away without a full ANALYZE of a large database
+        cursor.execute("PRAGMA analysis_limit = 1000")
+        cursor.execute("ANALYZE")
+        conn.commit()
+    return applied
+
+
+def report_queries():
+    """(name, sql, params) for every date-range report the application runs"""
+    from core.reports import GSTR1_QUERY, GSTR2_QUERY, GSTR3B_QUERY
+    from core.stock import MOVEMENT_QUERY
+    import gstr1
+
+    period = ('2024-04-01', '2024-04-30')
+    queries = [
+        ("GSTR-1", GSTR1_QUERY, period),
+        ("GSTR-2", GSTR2_QUERY, period),
+        ("GSTR-3B", GSTR3B_QUERY, period),
+        ("Stock movement", MOVEMENT_QUERY, period),
+    ]
+    builder = gstr1.GSTR1Builder(None, seller_gstin="29AAAAA0000A1Z5")
+    for section, sql in gstr1.SECTION_QUERIES.items():
+        extra = (builder.b2cl_threshold,) if section in ('b2cl', 'b2cs') else ()
+        queries.append((f"GSTR-1 {section}", sql, builder.params(*period, *extra)))
+    return queries
+
+
+def list_queries():
+    """(name, sql, params) for every page the customer and product lists fetch"""
+    from data_management import CUSTOMER_COLUMNS, PRODUCT_COLUMNS
+    from paged_list import KeysetPager
+
+    queries = []
+    for table, columns in (("customers", CUSTOMER_COLUMNS), ("products", PRODUCT_COLUMNS)):
+        columns = [column for _, column in columns]
+        for column in columns:
+            for descending in (False, True):
+                pager = KeysetPager(table, columns, column, descending, not_null=("name",))
+                for block, after in [(block, after) for block in pager.blocks for after in (None, ("", 1))]:
+                    sql, params = pager.query(block, after, pager.page_size)
+                    queries.append((f"{table} by {column}{' desc' if descending else ''} ({block})", sql, params))
+    return queries
+
+
+def full_scans(conn, sql, params):
+    """Query plan lines that scan a whole table or index
+
+    A walk in index order under a LIMIT, as the first page of a list sorted
+    by a NOT NULL column does, stops after the page and is not counted.
+    """
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    paged = " LIMIT " in sql.upper()
+    return [row[3] for row in plan if row[3].startswith("SCAN ") and "CONSTANT ROW" not in row[3]
+            and not (paged and " USING " in row[3] and "INDEX" in row[3])]
+
+
+def check_query_plans(conn, queries=None):
+    """Assert that no report or list query does a full table scan"""
+    problems = []
+    for name, sql, params in queries or report_queries() + list_queries():
+        problems.extend(f"{name}: {detail}" for detail in full_scans(conn, sql, params))
+    assert not problems, "Full table scans in report or list queries:\n" + "\n".join(problems)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upgrade the database schema in place")
+    parser.add_argument("--db", default=os.path.join('data', 'gst_billing.db'), help="SQLite database path")
+    parser.add_argument("--check", action="store_true", help="Verify report query plans after migrating")
+    parser.add_argument("--set", metavar="KEY=VALUE", action="append", default=[],
+                        help="Store a business setting, e.g. seller_gstin=29ABCDE1234F1Z5")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        applied = migrate(conn)
+        print(f"Schema version {current_version(conn)}"
+              + (f" (applied {', '.join(map(str, applied))})" if applied else " (up to date)"))
+        for setting in args.set:
+            key, _, value = setting.partition("=")
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+            conn.commit()
+            print(f"Set {key} = {value}")
+        if args.check:
+            check_query_plans(conn)
+            print("Query plans OK: no report or list page does a full table scan")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import tkinter as tk
+from tkinter import ttk
+
+# Rows fetched per round trip; a screenful is a few dozen
+PAGE_SIZE = 200
+
+# Load the next page once the visible window reaches this far down
+LOAD_AHEAD = 0.9
+
+
+class KeysetPager:
+    """Pages through a table in any column order without OFFSET
+
+    Each page continues from the (sort value, id) of the last row already
+    fetched, so with an index on the sort column every page is an index seek
+    however deep the user has scrolled. NULLs sort first ascending and last
+    descending, as SQLite orders them; they are paged as a separate block by
+    id because (NULL, id) > (?, ?) is never true.
+    """
+
+    def __init__(self, table, columns, sort_column=None, descending=False, page_size=PAGE_SIZE, not_null=()):
+        self.table = table
+        self.columns = columns
+        self.page_size = page_size
+        self.not_null = not_null
+        self.sort(sort_column or columns[0], descending)
+
+    def sort(self, column, descending=False):
+        """Change the ordering and start again from the first row"""
+        if column not in self.columns:
+            raise ValueError(f"Cannot sort {self.table} by {column}")
+        self.sort_column = column
+        self.descending = descending
+        self.reset()
+
+    def reset(self):
+        # Blocks in display order; the current one is blocks[0]
+        self.blocks = ["values", "nulls"] if self.descending else ["nulls", "values"]
+        if self.sort_column in self.not_null:
+            self.blocks.remove("nulls")
+        self.last_key = None
+        self.exhausted = False
+
+    def query(self, block, after, limit):
+        """SQL and parameters for up to ``limit`` rows of a block after ``after``"""
+        col = self.sort_column
+        direction = "DESC" if self.descending else "ASC"
+        cmp = "<" if self.descending else ">"
+        select = f"SELECT id, {', '.join(self.columns)} FROM {self.table}"
+        if block == "nulls":
+            where = f"{col} IS NULL" + (f" AND id {cmp} ?" if after else "")
+            params = (after[1],) if after else ()
+            order = f"id {direction}"
+        else:
+            # IS NOT NULL is every non-NULL value of any type as an index
+            # range; a bound such as -inf would be compared as text
+            # ('-Inf') on TEXT columns and skip '' and anything before it
+            where = f"({col}, id) {cmp} (?, ?)" if after else f"{col} IS NOT NULL"
+            params = after or ()
+            order = f"{col} {direction}, id {direction}"
+        return f"{select} WHERE {where} ORDER BY {order} LIMIT ?", params + (limit,)
+
+    def fetch(self, conn):
+        """Return the next page of (id, *columns) rows, or [] at the end"""
+        rows = []
+        while self.blocks and len(rows) < self.page_size:
+            sql, params = self.query(self.blocks[0], self.last_key, self.page_size - len(rows))
+            page = conn.execute(sql, params).fetchall()
+            rows.extend(page)
+            if page:
+                last = page[-1]
+                self.last_key = (last[1 + self.columns.index(self.sort_column)], last[0])
+            if len(rows) < self.page_size:
+                # This block is finished; the next starts from its beginning
+                self.blocks.pop(0)
+                self.last_key = None
+        self.exhausted = not self.blocks
+        return rows
+
+
+class PagedTreeview:
+    """A Treeview that holds only the rows scrolled into view so far
+
+    Rows are fetched a page at a time as the user scrolls towards the end,
+    and clicking a heading re-sorts in the database rather than in memory.
+    Item ids are the database ids.
+    """
+
+    def __init__(self, parent, conn, table, headings, columns, page_size=PAGE_SIZE, not_null=()):
+        self.conn = conn
+        self.headings = headings
+        self.pager = KeysetPager(table, columns, page_size=page_size, not_null=not_null)
+        self.loading = False
+
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=headings, show="headings")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+
+        for heading, column in zip(headings, columns):
+            self.tree.heading(heading, text=heading, command=lambda column=column: self.sort_by(column))
+            self.tree.column(heading, width=100)
+
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def reload(self):
+        """Drop the loaded rows and fetch the first page again"""
+        self.tree.delete(*self.tree.get_children())
+        self.pager.reset()
+        self.load_more()
+
+    def load_more(self):
+        """Append the next page"""
+        self.loading = False
+        for row in self.pager.fetch(self.conn):
+            self.tree.insert("", tk.END, iid=row[0], values=["" if value is None else value for value in row[1:]])
+
+    def refresh_rows(self, ids):
+        """Re-read rows already on screen after they changed
+
+        Updated rows keep their place until the next reload, deleted rows are
+        removed, and rows not yet scrolled into view are left alone.
+        """
+        shown = [row_id for row_id in ids if self.tree.exists(row_id)]
+        if not shown:
+            return
+        sql = (f"SELECT id, {', '.join(self.pager.columns)} FROM {self.pager.table} "
+               f"WHERE id IN ({', '.join('?' * len(shown))})")
+        rows = {row[0]: row for row in self.conn.execute(sql, shown)}
+        for row_id in shown:
+            if row_id in rows:
+                self.tree.item(row_id, values=["" if value is None else value for value in rows[row_id][1:]])
+            else:
+                self.tree.delete(row_id)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= LOAD_AHEAD and not self.pager.exhausted and not self.loading:
+            # Deferred so the Treeview finishes its own scroll update first
+            self.loading = True
+            self.tree.after_idle(self.load_more)
+
+    def sort_by(self, column):
+        """Sort on a column; clicking the same heading again reverses it"""
+        descending = column == self.pager.sort_column and not self.pager.descending
+        self.pager.sort(column, descending)
+        for heading, col in zip(self.headings, self.pager.columns):
+            arrow = (" ▼" if descending else " ▲") if col == column else ""
+            self.tree.heading(heading, text=heading + arrow)
+        self.reload()
+
+    def selected_id(self):
+        """Database id of the first selected row, or None"""
+        selected = self.tree.selection()
+        return int(selected[0]) if selected else None
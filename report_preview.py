@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+import tkinter as tk
+from array import array
+from tkinter import ttk
+
+from paged_list import LOAD_AHEAD
+
+# Rows rendered per page in each preview tab
+PREVIEW_PAGE = 200
+
+
+def csv_offsets(f):
+    """Byte offset of every record after the header of a CSV file opened in binary
+
+    A quoted field may span lines, so records are found by the csv module,
+    which reads exactly the lines of one record at a time.
+    """
+    offsets = array('q')
+    position = 0
+
+    def lines():
+        nonlocal position
+        for line in f:
+            position += len(line)
+            yield line.decode('utf-8')
+
+    reader = csv.reader(lines())
+    next(reader, None)
+    start = position
+    for _ in reader:
+        offsets.append(start)
+        start = position
+    return offsets
+
+
+class ResultFile:
+    """Random access to the rows of a JSONL (or CSV) report on disk
+
+    Only the byte offset of each row is held in memory (8 bytes a row), so
+    a preview of any size costs a seek and a few hundred json.loads per page.
+    Values read back from CSV are all text.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.is_csv = path.endswith('.csv')
+        with open(path, 'rb') as f:
+            if self.is_csv:
+                self.offsets = csv_offsets(f)
+            else:
+                self.offsets = array('q')
+                position = 0
+                for line in f:
+                    self.offsets.append(position)
+                    position += len(line)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def rows(self, start, count):
+        """Up to ``count`` rows from row ``start`` on, as tuples in column order"""
+        if start >= len(self.offsets):
+            return []
+        count = min(count, len(self.offsets) - start)
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[start])
+            if self.is_csv:
+                reader = csv.reader(line.decode('utf-8') for line in f)
+                return [tuple(next(reader)) for _ in range(count)]
+            rows = []
+            for _ in range(count):
+                record = json.loads(f.readline())
+                rows.append(tuple(record.get(column) for column in self.columns))
+        return rows
+
+
+class RowList:
+    """An in-memory result, for small summaries with no file of their own"""
+
+    def __init__(self, columns, rows):
+        self.columns = list(columns)
+        self._rows = list(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def rows(self, start, count):
+        return self._rows[start:start + count]
+
+
+def json_text(columns, rows, start):
+    """A page of rows as part of one pretty-printed JSON array"""
+    records = ",\n".join(json.dumps(dict(zip(columns, row)), indent=2, default=str) for row in rows)
+    return ("[\n" if start == 0 else ",\n") + records
+
+
+def csv_text(columns, rows, start):
+    """A page of rows as CSV, with the header before the first page"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if start == 0:
+        writer.writerow(columns)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+class PagedView:
+    """Shows a result a page at a time, fetching more as the user scrolls down"""
+
+    def __init__(self, page_size=PREVIEW_PAGE):
+        self.page_size = page_size
+        self.source = None
+        self.loaded = 0
+        self.loading = False
+        self.on_loaded = None
+
+    @property
+    def exhausted(self):
+        return self.source is None or self.loaded >= len(self.source)
+
+    def show(self, source):
+        """Forget what is shown and start over with another result"""
+        self.clear()
+        self.source = source
+        self.loaded = 0
+
+    def load_more(self):
+        """Render the next page"""
+        self.loading = False
+        if self.exhausted:
+            return
+        rows = self.source.rows(self.loaded, self.page_size)
+        self.append(rows, self.loaded)
+        self.loaded += len(rows)
+        if self.on_loaded:
+            self.on_loaded(self)
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= LOAD_AHEAD and not self.exhausted and not self.loading:
+            # Deferred so the widget finishes its own scroll update first
+            self.loading = True
+            self.widget.after_idle(self.load_more)
+
+
+class TextView(PagedView):
+    """Rows formatted as text by ``render(columns, rows, start)``"""
+
+    def __init__(self, parent, render, closing="", page_size=PREVIEW_PAGE):
+        super().__init__(page_size)
+        self.render = render
+        self.closing = closing
+        self.widget = tk.Text(parent, wrap=tk.NONE)
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.widget.yview)
+        self.widget.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.widget.pack(fill=tk.BOTH, expand=True)
+
+    def clear(self):
+        self.widget.delete(1.0, tk.END)
+
+    def append(self, rows, start):
+        text = self.render(self.source.columns, rows, start)
+        if start + len(rows) >= len(self.source):
+            text += self.closing
+        self.widget.insert(tk.END, text)
+
+
+class TableView(PagedView):
+    """Rows in a Treeview, the spreadsheet-like tab"""
+
+    def __init__(self, parent, page_size=PREVIEW_PAGE):
+        super().__init__(page_size)
+        self.widget = ttk.Treeview(parent, show="headings")
+        self.scrollbar = ttk.Scrollbar(parent, orient=tk.VERTICAL, command=self.widget.yview)
+        self.widget.configure(yscrollcommand=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.widget.pack(fill=tk.BOTH, expand=True)
+
+    def clear(self):
+        self.widget.delete(*self.widget.get_children())
+
+    def show(self, source):
+        super().show(source)
+        self.widget.configure(columns=source.columns)
+        for column in source.columns:
+            self.widget.heading(column, text=column)
+            self.widget.column(column, width=100)
+
+    def append(self, rows, start):
+        for row in rows:
+            self.widget.insert("", tk.END, values=["" if value is None else value for value in row])
+
+
+class ReportPreview:
+    """JSON, Excel and CSV tabs over one result, each rendered only when shown
+
+    A tab holds just the pages scrolled into view so far; nothing is
+    serialised for rows the user never looks at.
+    """
+
+    def __init__(self, parent, page_size=PREVIEW_PAGE):
+        self.frame = ttk.Frame(parent)
+        self.status_var = tk.StringVar()
+        ttk.Label(self.frame, textvariable=self.status_var).pack(anchor=tk.W)
+
+        self.notebook = ttk.Notebook(self.frame)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        self.views = {}
+        for name, make_view in (
+                ("JSON", lambda tab: TextView(tab, json_text, closing="\n]", page_size=page_size)),
+                ("Excel", lambda tab: TableView(tab, page_size=page_size)),
+                ("CSV", lambda tab: TextView(tab, csv_text, page_size=page_size))):
+            tab = ttk.Frame(self.notebook)
+            self.notebook.add(tab, text=name)
+            view = make_view(tab)
+            view.on_loaded = self.update_status
+            self.views[str(tab)] = view
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def show(self, source):
+        """Preview a result (a ResultFile or RowList), starting with the visible tab"""
+        for view in self.views.values():
+            view.show(source)
+        self.on_tab_changed()
+
+    def current_view(self):
+        return self.views.get(self.notebook.select())
+
+    def on_tab_changed(self, event=None):
+        """Render the first page of a tab the first time it is shown"""
+        view = self.current_view()
+        if view is not None and view.source is not None and view.loaded == 0:
+            view.load_more()
+        self.update_status()
+
+    def update_status(self, view=None):
+        view = self.current_view()
+        if view is None or view.source is None:
+            self.status_var.set("")
+        else:
+            self.status_var.set(f"Showing {view.loaded} of {len(view.source)} rows")
@@ -1,15 +1,25 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import pandas as pd
+from tkinter import ttk, messagebox
 from datetime import datetime, timedelta
-import json
-import os
+import tax_engine
+import report_export
+import report_preview
+import core.reports
+from jobs import JobRunner
+
+# (label, report_export format) pairs offered as checkboxes
+REPORT_FORMATS = [("JSON", "jsonl"), ("Excel", "xlsx"), ("CSV", "csv")]
 
 class GSTReports:
-    def __init__(self, parent, db_connection):
+    def __init__(self, parent, db, seller_state_code=None, job_runner=None, seller_gstin=None):
         self.parent = parent
-        self.conn = db_connection
-        self.cursor = self.conn.cursor()
+        self.db = db
+        self.seller_gstin = seller_gstin
+        self.seller_state_code = seller_state_code or tax_engine.state_code_from_gstin(seller_gstin)
+        
+        # Reports run off the Tk thread; progress comes back through root.after
+        self.job_runner = job_runner or JobRunner(parent)
+        self.job_runner.add_listener(self.on_job_changed)
         
     def create_reports_frame(self, parent):
         """Create the reports interface"""
@@ -29,6 +39,13 @@ class GSTReports:
         self.to_date.pack(side=tk.LEFT, padx=5)
         self.to_date.insert(0, datetime.now().strftime('%Y-%m-%d'))
         
+        # Formats to write; each is written concurrently with the others
+        self.format_vars = {}
+        for label, name in reversed(REPORT_FORMATS):
+            self.format_vars[name] = tk.BooleanVar(value=True)
+            ttk.Checkbutton(date_frame, text=label, variable=self.format_vars[name]).pack(side=tk.RIGHT, padx=5)
+        ttk.Label(date_frame, text="Formats:").pack(side=tk.RIGHT, padx=5)
+        
         # Report buttons
         button_frame = ttk.Frame(frame)
         button_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -36,220 +53,136 @@ class GSTReports:
         ttk.Button(button_frame, text="Generate GSTR-1", command=self.generate_gstr1).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Generate GSTR-2", command=self.generate_gstr2).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Generate GSTR-3B", command=self.generate_gstr3b).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="GSTR-1 Portal JSON", command=self.generate_gstr1_portal).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=self.cancel_jobs).pack(side=tk.RIGHT, padx=5)
         
-        # Report preview
-        preview_frame = ttk.Frame(frame)
-        preview_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        
-        # Create notebook for different report views
-        self.notebook = ttk.Notebook(preview_frame)
-        self.notebook.pack(fill=tk.BOTH, expand=True)
-        
-        # Create tabs for different report formats
-        self.json_frame = ttk.Frame(self.notebook)
-        self.excel_frame = ttk.Frame(self.notebook)
-        self.csv_frame = ttk.Frame(self.notebook)
-        
-        self.notebook.add(self.json_frame, text="JSON")
-        self.notebook.add(self.excel_frame, text="Excel")
-        self.notebook.add(self.csv_frame, text="CSV")
-        
-        # Add text widgets for preview
-        self.json_text = tk.Text(self.json_frame, wrap=tk.WORD)
-        self.json_text.pack(fill=tk.BOTH, expand=True)
+        self.progress = ttk.Progressbar(button_frame, mode='determinate', length=200)
+        self.progress.pack(side=tk.RIGHT, padx=5)
         
-        self.excel_text = tk.Text(self.excel_frame, wrap=tk.WORD)
-        self.excel_text.pack(fill=tk.BOTH, expand=True)
+        # Running and finished report jobs
+        columns = ("Report", "Status", "Progress")
+        self.jobs_tree = ttk.Treeview(frame, columns=columns, show="headings", height=4)
+        for col in columns:
+            self.jobs_tree.heading(col, text=col)
+            self.jobs_tree.column(col, width=200)
+        self.jobs_tree.pack(fill=tk.X, padx=5, pady=5)
         
-        self.csv_text = tk.Text(self.csv_frame, wrap=tk.WORD)
-        self.csv_text.pack(fill=tk.BOTH, expand=True)
+        # Report preview: JSON, Excel and CSV tabs paged from the report on disk
+        self.preview = report_preview.ReportPreview(frame)
+        self.preview.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
         
         return frame
     
+    def read_period(self):
+        """Parse the From/To date entries"""
+        from_date = datetime.strptime(self.from_date.get(), '%Y-%m-%d')
+        to_date = datetime.strptime(self.to_date.get(), '%Y-%m-%d')
+        return from_date.date(), to_date.date()
+    
     def generate_gstr1(self):
         """Generate GSTR-1 report"""
-        try:
-            from_date = datetime.strptime(self.from_date.get(), '%Y-%m-%d')
-            to_date = datetime.strptime(self.to_date.get(), '%Y-%m-%d')
-            
-            # Query outward supplies
-            self.cursor.execute("""
-                SELECT 
-                    i.invoice_number,
-                    i.invoice_date,
-                    c.gstin,
-                    c.name as customer_name,
-                    p.hsn_code,
-                    ii.quantity,
-                    ii.price,
-                    ii.gst_rate,
-                    ii.gst_amount,
-                    ii.total_amount
-                FROM invoices i
-                JOIN customers c ON i.customer_id = c.id
-                JOIN invoice_items ii ON i.id = ii.invoice_id
-                JOIN products p ON ii.product_id = p.id
-                WHERE i.invoice_date BETWEEN ? AND ?
-                ORDER BY i.invoice_date
-            """, (from_date.date(), to_date.date()))
-            
-            data = self.cursor.fetchall()
-            
-            # Convert to DataFrame
-            df = pd.DataFrame(data, columns=[
-                'Invoice Number', 'Date', 'GSTIN', 'Customer Name',
-                'HSN Code', 'Quantity', 'Price', 'GST Rate',
-                'GST Amount', 'Total Amount'
-            ])
-            
-            # Generate JSON format
-            json_data = df.to_dict(orient='records')
-            self.json_text.delete(1.0, tk.END)
-            self.json_text.insert(tk.END, json.dumps(json_data, indent=2))
-            
-            # Generate Excel format
-            excel_data = df.to_string()
-            self.excel_text.delete(1.0, tk.END)
-            self.excel_text.insert(tk.END, excel_data)
-            
-            # Generate CSV format
-            csv_data = df.to_csv(index=False)
-            self.csv_text.delete(1.0, tk.END)
-            self.csv_text.insert(tk.END, csv_data)
-            
-            # Save reports
-            self.save_reports(df, "GSTR1")
-            
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.start_report("GSTR1")
     
     def generate_gstr2(self):
         """Generate GSTR-2 report"""
-        try:
-            from_date = datetime.strptime(self.from_date.get(), '%Y-%m-%d')
-            to_date = datetime.strptime(self.to_date.get(), '%Y-%m-%d')
-            
-            # Query inward supplies (purchases)
-            self.cursor.execute("""
-                SELECT 
-                    p.invoice_number,
-                    p.invoice_date,
-                    v.gstin,
-                    v.name as vendor_name,
-                    p.hsn_code,
-                    p.quantity,
-                    p.price,
-                    p.gst_rate,
-                    p.gst_amount,
-                    p.total_amount
-                FROM purchases p
-                JOIN vendors v ON p.vendor_id = v.id
-                WHERE p.invoice_date BETWEEN ? AND ?
-                ORDER BY p.invoice_date
-            """, (from_date.date(), to_date.date()))
-            
-            data = self.cursor.fetchall()
-            
-            # Convert to DataFrame
-            df = pd.DataFrame(data, columns=[
-                'Invoice Number', 'Date', 'GSTIN', 'Vendor Name',
-                'HSN Code', 'Quantity', 'Price', 'GST Rate',
-                'GST Amount', 'Total Amount'
-            ])
-            
-            # Generate JSON format
-            json_data = df.to_dict(orient='records')
-            self.json_text.delete(1.0, tk.END)
-            self.json_text.insert(tk.END, json.dumps(json_data, indent=2))
-            
-            # Generate Excel format
-            excel_data = df.to_string()
-            self.excel_text.delete(1.0, tk.END)
-            self.excel_text.insert(tk.END, excel_data)
-            
-            # Generate CSV format
-            csv_data = df.to_csv(index=False)
-            self.csv_text.delete(1.0, tk.END)
-            self.csv_text.insert(tk.END, csv_data)
-            
-            # Save reports
-            self.save_reports(df, "GSTR2")
-            
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
+        self.start_report("GSTR2")
     
     def generate_gstr3b(self):
         """Generate GSTR-3B report"""
+        self.start_report("GSTR3B")
+    
+    def generate_gstr1_portal(self):
+        """Generate GSTR-1 in the GST portal's upload schema"""
         try:
-            from_date = datetime.strptime(self.from_date.get(), '%Y-%m-%d')
-            to_date = datetime.strptime(self.to_date.get(), '%Y-%m-%d')
-            
-            # Query summary data
-            self.cursor.execute("""
-                SELECT 
-                    SUM(total_amount) as total_taxable_value,
-                    SUM(cgst_amount) as total_cgst,
-                    SUM(sgst_amount) as total_sgst,
-                    SUM(igst_amount) as total_igst
-                FROM invoices
-                WHERE invoice_date BETWEEN ? AND ?
-            """, (from_date.date(), to_date.date()))
-            
-            summary_data = self.cursor.fetchone()
-            
-            # Create summary DataFrame
-            df = pd.DataFrame([{
-                'Total Taxable Value': summary_data[0],
-                'Total CGST': summary_data[1],
-                'Total SGST': summary_data[2],
-                'Total IGST': summary_data[3],
-                'Total Tax': summary_data[1] + summary_data[2] + summary_data[3]
-            }])
-            
-            # Generate JSON format
-            json_data = df.to_dict(orient='records')
-            self.json_text.delete(1.0, tk.END)
-            self.json_text.insert(tk.END, json.dumps(json_data, indent=2))
-            
-            # Generate Excel format
-            excel_data = df.to_string()
-            self.excel_text.delete(1.0, tk.END)
-            self.excel_text.insert(tk.END, excel_data)
-            
-            # Generate CSV format
-            csv_data = df.to_csv(index=False)
-            self.csv_text.delete(1.0, tk.END)
-            self.csv_text.insert(tk.END, csv_data)
-            
-            # Save reports
-            self.save_reports(df, "GSTR3B")
-            
+            from_date, to_date = self.read_period()
+            self.job_runner.submit(
+                f"GSTR1 portal {from_date} to {to_date}",
+                self.run_gstr1_portal, from_date, to_date,
+                on_done=self.show_report,
+                on_error=self.report_failed,
+            )
         except Exception as e:
             messagebox.showerror("Error", str(e))
     
-    def save_reports(self, df, report_type):
-        """Save reports in different formats"""
+    def start_report(self, report_type):
+        """Queue a report job; several reports may run at the same time"""
         try:
-            # Create reports directory if it doesn't exist
-            os.makedirs("reports", exist_ok=True)
-            
-            # Generate filename with timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            base_filename = f"{report_type}_{timestamp}"
-            
-            # Save JSON
-            json_path = os.path.join("reports", f"{base_filename}.json")
-            df.to_json(json_path, orient='records', indent=2)
-            
-            # Save Excel
-            excel_path = os.path.join("reports", f"{base_filename}.xlsx")
-            df.to_excel(excel_path, index=False)
-            
-            # Save CSV
-            csv_path = os.path.join("reports", f"{base_filename}.csv")
-            df.to_csv(csv_path, index=False)
-            
-            messagebox.showinfo("Success", f"Reports saved successfully in the 'reports' directory")
-            
+            from_date, to_date = self.read_period()
+            formats = tuple(name for _, name in REPORT_FORMATS if self.format_vars[name].get())
+            if not formats:
+                messagebox.showwarning("Warning", "Please select at least one format")
+                return
+            self.job_runner.submit(
+                f"{report_type} {from_date} to {to_date}",
+                self.run_report, report_type, from_date, to_date, formats,
+                on_done=self.show_report,
+                on_error=self.report_failed,
+            )
         except Exception as e:
-            messagebox.showerror("Error", f"Error saving reports: {str(e)}") 
\ No newline at end of file
+            messagebox.showerror("Error", str(e))
+    
+    def run_report(self, job, report_type, from_date, to_date, formats=tuple(report_export.WRITERS)):
+        """Stream a report to its files; runs on a worker thread
+
+        The preview reads the JSONL (or else the CSV) file back a page at a
+        time, so memory stays bounded however long the period is.
+        """
+        def on_page(rows):
+            job.report_progress(None, f"{rows} rows exported")
+        
+        paths, rows, timings = core.reports.export_report(
+            self.db, report_type, from_date, to_date, self.seller_state_code, formats, job=job, on_page=on_page)
+        
+        job.report_progress(None, f"{rows} rows: " + ", ".join(
+            f"{name} {seconds:.1f} s" for name, seconds in timings.items()))
+        written = dict(zip(formats, paths))
+        columns = core.reports.REPORTS[report_type][0]
+        if 'jsonl' in written or 'csv' in written:
+            preview = report_preview.ResultFile(written.get('jsonl') or written['csv'], columns)
+        else:
+            preview = report_preview.RowList(['Format', 'Rows', 'Seconds'], [
+                (name, rows, round(seconds, 2)) for name, seconds in timings.items()])
+        return {
+            'preview': preview,
+            'paths': paths,
+        }
+    
+    def run_gstr1_portal(self, job, from_date, to_date):
+        """Aggregate B2B/B2CL/B2CS/HSN in SQL and write the portal JSON"""
+        path, counts = core.reports.export_gstr1_portal(self.db, self.seller_gstin, from_date, to_date, job=job)
+        return {
+            # The full return is on disk; preview the size of each section
+            'preview': report_preview.RowList(['Section', 'Entries'], counts.items()),
+            'paths': [path],
+        }
+    
+    def show_report(self, job, result):
+        """Point the preview tabs at a finished report"""
+        self.preview.show(result['preview'])
+        messagebox.showinfo("Success", f"{job.name}: reports saved successfully in the 'reports' directory")
+    
+    def report_failed(self, job, error):
+        """Show why a report job failed"""
+        messagebox.showerror("Error", f"{job.name}: {error}")
+    
+    def on_job_changed(self, job):
+        """Mirror job state into the jobs list and progress bar"""
+        if not hasattr(self, 'jobs_tree'):
+            return
+        values = (job.name, job.status, job.message)
+        if self.jobs_tree.exists(job.id):
+            self.jobs_tree.item(job.id, values=values)
+        else:
+            self.jobs_tree.insert("", 0, iid=job.id, values=values)
+        self.progress['value'] = job.progress * 100
+    
+    def cancel_jobs(self):
+        """Cancel the selected report jobs, or all of them if none is selected"""
+        selected = self.jobs_tree.selection()
+        if not selected:
+            self.job_runner.cancel_all()
+            return
+        for iid in selected:
+            job = self.job_runner.jobs.get(int(iid))
+            if job is not None:
+                self.job_runner.cancel(job)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import re
+
+# Matches shown in a picker while typing
+TOP_K = 10
+
+# What each picker searches: the display column and the other FTS5 columns
+# a match may come from
+SOURCES = {
+    'customers': {'column': 'name', 'fts': 'customers_fts', 'codes': ['gstin', 'phone']},
+    'products': {'column': 'name', 'fts': 'products_fts', 'codes': ['hsn_code']},
+}
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_terms(text):
+    """Typed text as FTS5 prefix terms; every word must match"""
+    return " ".join(f'"{term}"*' for term in _TERM.findall(text))
+
+
+def search(conn, source, text, limit=TOP_K):
+    """Top ``limit`` (id, name) matches for what has been typed so far
+
+    Matches are ranked in tiers:
+
+    1. the name starts with the text (NOCASE index range, in name order)
+    2. a later word of the name starts with it (FTS5 on the name column)
+    3. a GSTIN, phone number or HSN code starts with it (FTS5)
+
+    Each tier is a LIMIT query that stops after ``limit`` rows, so a short
+    prefix matching most of the table costs no more than a rare one. There is
+    deliberately no bm25 ordering: it scores every match before the LIMIT.
+    """
+    spec = SOURCES[source]
+    column = spec['column']
+    text = text.strip()
+    if not text:
+        return conn.execute(f"SELECT id, {column} FROM {source} ORDER BY {column} LIMIT ?", (limit,)).fetchall()
+
+    results = conn.execute(f"""
+        SELECT id, {column} FROM {source}
+        WHERE {column} >= ? COLLATE NOCASE AND {column} < ? COLLATE NOCASE
+        ORDER BY {column} COLLATE NOCASE
+        LIMIT ?
+    """, (text, text + "\U0010ffff", limit)).fetchall()
+
+    terms = fts_terms(text)
+    if not terms:
+        return results
+    seen = {row[0] for row in results}
+    for columns in ([column], spec['codes']):
+        if len(results) >= limit:
+            break
+        # Over-fetch by what is already shown so duplicates can be dropped
+        for row in conn.execute(f"""
+            SELECT t.id, t.{column}
+            FROM {spec['fts']} f
+            JOIN {source} t ON t.id = f.rowid
+            WHERE {spec['fts']} MATCH ?
+            LIMIT ?
+        """, (f"{{{' '.join(columns)}}} : ({terms})", limit + len(results))):
+            if row[0] not in seen:
+                seen.add(row[0])
+                results.append(row)
+                if len(results) == limit:
+                    break
+    return results
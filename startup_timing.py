@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from main import STARTUP_REPORT_ENV
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Startup budgets in milliseconds; a run over either fails the check
+IMPORT_BUDGET_MS = 500
+FIRST_WINDOW_BUDGET_MS = 2000
+
+
+def import_times(module="main"):
+    """Cumulative import time in ms of ``module`` and of each module it imports directly
+
+    Read from ``python -X importtime`` in a fresh interpreter. A module
+    shared by several imports is charged to whichever imports it first.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=APP_DIR,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((len(name) - len(name.lstrip()) - 1, name.strip(), int(cumulative) / 1000))
+    # A module's imports are listed, each nesting level indented by two more
+    # spaces, between the previous top level line and the module's own line
+    end = next(i for i, (depth, name, _) in enumerate(rows) if name == module and depth == 0)
+    start = max((i for i in range(end) if rows[i][0] == 0), default=-1) + 1
+    direct = [(name, ms) for depth, name, ms in rows[start:end] if depth == 2]
+    return rows[end][2], sorted(direct, key=lambda row: -row[1])
+
+
+def first_window(runs=3):
+    """Startup reports of ``runs`` launches of the app, or None without a display"""
+    if sys.platform.startswith('linux') and not os.environ.get('DISPLAY'):
+        return None
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(runs):
+            path = os.path.join(tmp, f"startup{run}.json")
+            subprocess.run([sys.executable, "main.py"], cwd=APP_DIR, env=dict(os.environ, **{STARTUP_REPORT_ENV: path}),
+                           check=True, timeout=300)
+            with open(path, encoding='utf-8') as f:
+                reports.append(json.load(f))
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report the app's startup time and check it against a budget")
+    parser.add_argument("--runs", type=int, default=3, help="App launches to time (the median is checked)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest direct imports to list")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--window-budget-ms", type=float, default=FIRST_WINDOW_BUDGET_MS)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    total, direct = import_times()
+    print(f"Importing main: {total:.0f} ms (budget {args.import_budget_ms:.0f} ms)")
+    for name, ms in direct[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+    over = []
+    if total > args.import_budget_ms:
+        over.append(f"imports took {total:.0f} ms")
+
+    reports = first_window(args.runs)
+    report = {'import_ms': round(total, 1), 'imports': dict(direct), 'runs': reports}
+    if reports is None:
+        print("First window: skipped, no display")
+    else:
+        window = statistics.median(run['first_window_ms'] for run in reports)
+        report['first_window_ms'] = window
+        print(f"First window: {window:.0f} ms median of {len(reports)} "
+              f"(budget {args.window_budget_ms:.0f} ms; {reports[-1]['import_ms']:.0f} ms of it imports)")
+        print("Tabs built on first selection:")
+        for text in reports[-1]['tab_build_ms']:
+            print(f"  {statistics.median(run['tab_build_ms'][text] for run in reports):8.1f} ms  {text}")
+        if window > args.window_budget_ms:
+            over.append(f"first window took {window:.0f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if over:
+        print("OVER BUDGET: " + "; ".join(over))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
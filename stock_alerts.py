@@ -0,0 +1,102 @@
+# Products at or below their reorder level, read through the partial index
+# idx_products_low_stock, which holds only those products. There is no ORDER
+# BY: the planner would rather walk the full name index to avoid a sort, so
+# callers sort the (short) result themselves.
+LOW_STOCK_QUERY = """
+    SELECT id, name, stock_quantity, min_stock_level
+    FROM products
+    WHERE stock_quantity <= min_stock_level
+"""
+
+# Largest IN (...) list per statement, well under SQLite's variable limit
+CHUNK = 500
+
+
+def low_stock(conn):
+    """(id, name, stock, minimum) of every product at or below its reorder level, by name"""
+    return sorted(conn.execute(LOW_STOCK_QUERY).fetchall(), key=lambda row: (row[1] or "", row[0]))
+
+
+def is_low(stock, minimum):
+    # As in SQL, a missing level compares as not low
+    return stock is not None and minimum is not None and stock <= minimum
+
+
+def check(cursor, changes):
+    """Record products that crossed their reorder level in stock_alerts
+
+    ``changes`` maps product id to the stock change just applied in this
+    transaction, so only those products are read and the state before the
+    change is worked out rather than stored. Returns the number of alerts.
+    """
+    alerts = []
+    ids = list(changes)
+    for start in range(0, len(ids), CHUNK):
+        chunk = ids[start:start + CHUNK]
+        cursor.execute(f"""
+            SELECT id, stock_quantity, min_stock_level FROM products
+            WHERE id IN ({', '.join('?' * len(chunk))})
+        """, chunk)
+        for product_id, stock, minimum in cursor.fetchall():
+            low = is_low(stock, minimum)
+            was_low = is_low(None if stock is None else stock - changes[product_id], minimum)
+            if low != was_low:
+                alerts.append((product_id, stock, minimum, int(low)))
+    cursor.executemany("""
+        INSERT INTO stock_alerts (product_id, stock_quantity, min_stock_level, low) VALUES (?, ?, ?, ?)
+    """, alerts)
+    return len(alerts)
+
+
+class LowStockMonitor:
+    """Delivers stock_alerts as they are committed, by whichever process
+
+    New alerts are read by id from the UI thread every ``interval_ms``; each
+    poll costs one primary key range read however large the catalogue is.
+    Subscribers get ``callback(alerts)`` with a list of dicts. If a master
+    data cache is given, the products concerned are refreshed in every tab.
+    """
+
+    def __init__(self, db, master_data=None, interval_ms=2000):
+        self.db = db
+        self.master_data = master_data
+        self.interval_ms = interval_ms
+        self._subscribers = []
+        self._widget = None
+        with db.reader() as conn:
+            self.last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM stock_alerts").fetchone()[0]
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def start(self, widget):
+        """Start polling on the Tk main loop of ``widget``"""
+        self._widget = widget
+        widget.after(self.interval_ms, self._tick)
+
+    def _tick(self):
+        try:
+            self.poll()
+        finally:
+            self._widget.after(self.interval_ms, self._tick)
+
+    def poll(self):
+        """Deliver alerts committed since the last poll and return them"""
+        with self.db.reader() as conn:
+            rows = conn.execute("""
+                SELECT a.id, a.product_id, p.name, a.stock_quantity, a.min_stock_level, a.low
+                FROM stock_alerts a
+                LEFT JOIN products p ON p.id = a.product_id
+                WHERE a.id > ?
+                ORDER BY a.id
+            """, (self.last_id,)).fetchall()
+        if not rows:
+            return []
+        self.last_id = rows[-1][0]
+        alerts = [dict(zip(('id', 'product_id', 'name', 'stock_quantity', 'min_stock_level', 'low'), row))
+                  for row in rows]
+        if self.master_data is not None:
+            self.master_data.changed('products', {alert['product_id'] for alert in alerts})
+        for callback in list(self._subscribers):
+            callback(alerts)
+        return alerts
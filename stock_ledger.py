@@ -0,0 +1,235 @@
+import argparse
+import calendar
+import os
+import sqlite3
+from collections import defaultdict
+from datetime import date, timedelta
+
+import migrations
+import stock_alerts
+
+# Movement kinds. Quantities are signed: stock in is positive, out negative.
+OPENING = 'OPENING'
+SALE = 'SALE'
+CANCEL = 'CANCEL'
+PURCHASE = 'PURCHASE'
+ADJUSTMENT = 'ADJUSTMENT'
+
+INSERT_SQL = """
+    INSERT INTO stock_movements (product_id, movement_date, quantity, kind, reference)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+# Stock of one product at the end of a day: the nearest checkpoint on or
+# before it plus the movements since, read from the (product_id, date) index
+BALANCE_QUERY = """
+    WITH nearest AS (
+        SELECT checkpoint_date, balance
+        FROM stock_checkpoints
+        WHERE product_id = :product AND checkpoint_date <= :date
+        ORDER BY checkpoint_date DESC
+        LIMIT 1
+    )
+    SELECT
+        COALESCE((SELECT balance FROM nearest), 0) + COALESCE((
+            SELECT SUM(quantity)
+            FROM stock_movements
+            WHERE product_id = :product
+              AND movement_date > COALESCE((SELECT checkpoint_date FROM nearest), '')
+              AND movement_date <= :date
+        ), 0)
+"""
+
+# Balances at :date for every product that moved in (:since, :date]. Products
+# that did not move keep their earlier checkpoint, which is still nearest.
+CHECKPOINT_SQL = """
+    INSERT OR REPLACE INTO stock_checkpoints (product_id, checkpoint_date, balance)
+    SELECT
+        moved.product_id,
+        :date,
+        COALESCE(c.balance, 0) + (
+            SELECT COALESCE(SUM(m.quantity), 0)
+            FROM stock_movements m
+            WHERE m.product_id = moved.product_id
+              AND m.movement_date > COALESCE(c.checkpoint_date, '')
+              AND m.movement_date <= :date
+        )
+    FROM (
+        SELECT DISTINCT product_id
+        FROM stock_movements
+        WHERE movement_date > :since AND movement_date <= :date
+    ) moved
+    LEFT JOIN stock_checkpoints c
+        ON c.product_id = moved.product_id
+       AND c.checkpoint_date = (
+            SELECT MAX(checkpoint_date) FROM stock_checkpoints
+            WHERE product_id = moved.product_id AND checkpoint_date <= :date
+       )
+"""
+
+
+def record(cursor, movements):
+    """Append (product_id, date, quantity, kind, reference) movements
+
+    ``products.stock_quantity`` is kept as the running balance with one
+    UPDATE per product, products crossing their reorder level raise a
+    stock alert, and checkpoints already taken after a backdated
+    movement are corrected so they stay exact. The caller owns the
+    transaction.
+    """
+    movements = [movement for movement in movements if movement[2]]
+    if not movements:
+        return
+    cursor.executemany(INSERT_SQL, movements)
+
+    by_product = defaultdict(int)
+    by_day = defaultdict(int)
+    for product_id, movement_date, quantity, _, _ in movements:
+        by_product[product_id] += quantity
+        by_day[product_id, str(movement_date)] += quantity
+    cursor.executemany("""
+        UPDATE products SET stock_quantity = COALESCE(stock_quantity, 0) + ? WHERE id = ?
+    """, [(quantity, product_id) for product_id, quantity in by_product.items()])
+    stock_alerts.check(cursor, by_product)
+    cursor.executemany("""
+        UPDATE stock_checkpoints SET balance = balance + ?
+        WHERE product_id = ? AND checkpoint_date >= ?
+    """, [(quantity, product_id, movement_date) for (product_id, movement_date), quantity in by_day.items()])
+
+
+def set_stock(cursor, product_id, quantity, movement_date=None, kind=ADJUSTMENT, reference=None):
+    """Bring a product's stock to ``quantity`` with one movement; returns the change"""
+    cursor.execute("SELECT COALESCE(stock_quantity, 0) FROM products WHERE id = ?", (product_id,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"No product with id {product_id}")
+    change = quantity - row[0]
+    record(cursor, [(product_id, str(movement_date or date.today()), change, kind, reference)])
+    return change
+
+
+def record_purchases(cursor, purchases):
+    """Insert purchase lines and take their quantities into stock
+
+    Each purchase is a dict with the columns of the ``purchases`` table
+    (``invoice_number``, ``invoice_date``, ``vendor_id``, ``product_id``,
+    ``product_name``, ``hsn_code``, ``quantity``, ``price``, ``gst_rate``,
+    ``gst_amount``, ``total_amount``). The caller owns the transaction.
+    """
+    columns = ('invoice_number', 'invoice_date', 'vendor_id', 'product_id', 'product_name', 'hsn_code',
+               'quantity', 'price', 'gst_rate', 'gst_amount', 'total_amount')
+    cursor.executemany(f"""
+        INSERT INTO purchases ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})
+    """, [tuple(purchase.get(column) for column in columns) for purchase in purchases])
+    record(cursor, [
+        (purchase['product_id'], purchase['invoice_date'], purchase['quantity'], PURCHASE, purchase.get('invoice_number'))
+        for purchase in purchases if purchase.get('product_id') is not None
+    ])
+
+
+def balance(conn, product_id, on_date):
+    """Stock of a product at the end of ``on_date``"""
+    return conn.execute(BALANCE_QUERY, {'product': product_id, 'date': str(on_date)}).fetchone()[0]
+
+
+def checkpoint(cursor, on_date, since=''):
+    """Checkpoint the products that moved after ``since``; returns the rows written"""
+    cursor.execute(CHECKPOINT_SQL, {'date': str(on_date), 'since': str(since)})
+    return cursor.rowcount
+
+
+def month_ends(after, before):
+    """Last day of every month that ends after ``after`` and before ``before``"""
+    year, month = after.year, after.month
+    while True:
+        end = date(year, month, calendar.monthrange(year, month)[1])
+        if end >= before:
+            return
+        if end > after:
+            yield end
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def checkpoint_months(cursor, today=None):
+    """Checkpoint every month end since the last one; returns the rows written
+
+    Each month only touches the products that moved in it, so running this
+    regularly (the app does on start-up) costs little, and a point-in-time
+    lookup never sums more than about a month of movements.
+    """
+    today = today or date.today()
+    cursor.execute("SELECT MAX(checkpoint_date) FROM stock_checkpoints")
+    since = cursor.fetchone()[0]
+    if since is None:
+        cursor.execute("SELECT MIN(movement_date) FROM stock_movements")
+        first = cursor.fetchone()[0]
+        if first is None:
+            return 0
+        since = str(date.fromisoformat(first[:10]) - timedelta(days=1))
+    written = 0
+    for end in month_ends(date.fromisoformat(since[:10]), today):
+        written += checkpoint(cursor, end, since)
+        since = str(end)
+    return written
+
+
+def backfill(cursor):
+    """Build the ledger from invoices and purchases already in the database
+
+    An OPENING movement per product, dated before its first movement, makes
+    the ledger add up to the current ``stock_quantity``.
+    """
+    cursor.execute("""
+        INSERT INTO stock_movements (product_id, movement_date, quantity, kind, reference)
+        SELECT ii.product_id, i.invoice_date, -ii.quantity, 'SALE', i.invoice_number
+        FROM invoice_items ii
+        JOIN invoices i ON i.id = ii.invoice_id
+        WHERE ii.product_id IS NOT NULL AND i.invoice_date IS NOT NULL AND ii.quantity
+          AND COALESCE(i.status, '') != 'CANCELLED'
+        UNION ALL
+        SELECT product_id, invoice_date, quantity, 'PURCHASE', invoice_number
+        FROM purchases
+        WHERE product_id IS NOT NULL AND invoice_date IS NOT NULL AND quantity
+        ORDER BY 2
+    """)
+    cursor.execute("""
+        INSERT INTO stock_movements (product_id, movement_date, quantity, kind)
+        SELECT
+            p.id,
+            COALESCE(MIN(m.first_date, date(p.created_at)), m.first_date, date(p.created_at), date('now')),
+            COALESCE(p.stock_quantity, 0) - COALESCE(m.net, 0),
+            'OPENING'
+        FROM products p
+        LEFT JOIN (
+            SELECT product_id, MIN(movement_date) AS first_date, SUM(quantity) AS net
+            FROM stock_movements
+            GROUP BY product_id
+        ) m ON m.product_id = p.id
+        WHERE COALESCE(p.stock_quantity, 0) != COALESCE(m.net, 0)
+    """)
+    checkpoint_months(cursor)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stock ledger checkpoints and point-in-time stock")
+    parser.add_argument("--db", default=os.path.join('data', 'gst_billing.db'), help="SQLite database path")
+    parser.add_argument("--product", type=int, help="Product id to show the stock of")
+    parser.add_argument("--on", default=str(date.today()), help="Date of the stock shown (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrations.migrate(conn)
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        written = checkpoint_months(cursor)
+        conn.commit()
+        print(f"Wrote {written} checkpoint rows")
+        if args.product is not None:
+            print(f"Stock of product {args.product} on {args.on}: {balance(conn, args.product, args.on)}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
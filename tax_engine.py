@@ -0,0 +1,114 @@
+import numpy as np
+
+# Rates are carried as integer basis points and amounts as integer paise so
+# that every rounding step is exact and reproducible across batches.
+PAISE = 100
+BASIS_POINTS = 100
+
+
+def to_paise(amounts):
+    """Convert rupee amounts to integer paise"""
+    return np.rint(np.asarray(amounts, dtype=np.float64) * PAISE).astype(np.int64)
+
+
+def to_rupees(paise):
+    """Convert integer paise back to rupee amounts"""
+    return np.asarray(paise, dtype=np.int64) / PAISE
+
+
+def round_half_up(numerator, denominator):
+    """Integer division rounded half away from zero (GST rounding to the paisa)"""
+    numerator = np.asarray(numerator, dtype=np.int64)
+    quotient = (np.abs(numerator) * 2 + denominator) // (denominator * 2)
+    return np.sign(numerator) * quotient
+
+
+def state_code_from_gstin(gstin):
+    """Return the two digit state code embedded in a GSTIN, or None"""
+    if gstin and len(gstin) >= 2 and gstin[:2].isdigit():
+        return gstin[:2]
+    return None
+
+
+def is_inter_state(seller_state_code, place_of_supply):
+    """A supply is inter-state when both states are known and differ"""
+    return bool(seller_state_code and place_of_supply and seller_state_code != place_of_supply)
+
+
+def compute_line_taxes(price, quantity, gst_rate, inter_state=False):
+    """Compute taxable value and CGST/SGST/IGST for a batch of invoice lines
+
+    All arguments are array-likes of equal length (``inter_state`` may also be
+    a scalar). Tax is computed per line on the taxable value and rounded half
+    up to the paisa; intra-state tax is split into CGST and SGST at half the
+    rate each, so the two halves are always equal. Returns a dict of numpy
+    arrays in rupees.
+    """
+    price_paise = to_paise(price)
+    quantity = np.asarray(quantity, dtype=np.int64)
+    rate_bp = np.rint(np.asarray(gst_rate, dtype=np.float64) * BASIS_POINTS).astype(np.int64)
+    inter_state = np.broadcast_to(np.asarray(inter_state, dtype=bool), price_paise.shape)
+
+    taxable = price_paise * quantity
+    # rate_bp / (100 * 100) converts basis points to a fraction
+    full = round_half_up(taxable * rate_bp, 100 * BASIS_POINTS)
+    half = round_half_up(taxable * rate_bp, 2 * 100 * BASIS_POINTS)
+
+    igst = np.where(inter_state, full, 0)
+    cgst = np.where(inter_state, 0, half)
+    sgst = cgst
+    gst = igst + cgst + sgst
+
+    return {
+        'taxable': to_rupees(taxable),
+        'cgst': to_rupees(cgst),
+        'sgst': to_rupees(sgst),
+        'igst': to_rupees(igst),
+        'gst': to_rupees(gst),
+        'total': to_rupees(taxable + gst),
+    }
+
+
+def summarize(taxes):
+    """Total the per-line amounts returned by compute_line_taxes"""
+    return {key: float(to_rupees(to_paise(values).sum())) for key, values in taxes.items()}
+
+
+def summarize_by_invoice(taxes, invoice_index, invoice_count=None):
+    """Total per-line amounts for many invoices at once
+
+    ``invoice_index`` maps each line to a 0-based invoice position. Returns a
+    dict of arrays with one entry per invoice.
+    """
+    invoice_index = np.asarray(invoice_index, dtype=np.int64)
+    if invoice_count is None:
+        invoice_count = int(invoice_index.max()) + 1 if invoice_index.size else 0
+    totals = {}
+    for key, values in taxes.items():
+        # Summing integer paise keeps the totals exact
+        paise = np.bincount(invoice_index, weights=to_paise(values), minlength=invoice_count)
+        totals[key] = to_rupees(np.rint(paise).astype(np.int64))
+    return totals
+
+
+def price_lines(lines, inter_state=False):
+    """Price a pandas DataFrame (or mapping of columns) of invoice lines
+
+    ``lines`` must provide ``price``, ``quantity`` and ``gst_rate`` columns; an
+    ``inter_state`` column, when present, overrides the argument. Returns a
+    DataFrame with the tax columns appended.
+    """
+    import pandas as pd
+
+    frame = pd.DataFrame(lines)
+    if 'inter_state' in frame:
+        inter_state = frame['inter_state'].to_numpy(dtype=bool)
+    taxes = compute_line_taxes(
+        frame['price'].to_numpy(),
+        frame['quantity'].to_numpy(),
+        frame['gst_rate'].to_numpy(),
+        inter_state,
+    )
+    for key, values in taxes.items():
+        frame[key] = values
+    return frame
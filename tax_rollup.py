@@ -0,0 +1,180 @@
+import argparse
+import os
+import sqlite3
+from collections import defaultdict
+
+import migrations
+
+# Amounts in the rollup are integer paise: rows are adjusted by += and -= as
+# invoices come and go, and float sums would drift away from a rebuild.
+UPSERT_SQL = """
+    INSERT INTO tax_rollup_daily (
+        invoice_date, gst_rate, place_of_supply, supply_type,
+        invoice_count, taxable_paise, cgst_paise, sgst_paise, igst_paise, total_paise
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (invoice_date, gst_rate, place_of_supply, supply_type) DO UPDATE SET
+        invoice_count = invoice_count + excluded.invoice_count,
+        taxable_paise = taxable_paise + excluded.taxable_paise,
+        cgst_paise = cgst_paise + excluded.cgst_paise,
+        sgst_paise = sgst_paise + excluded.sgst_paise,
+        igst_paise = igst_paise + excluded.igst_paise,
+        total_paise = total_paise + excluded.total_paise
+"""
+
+# Invoices saved before supply_type was recorded are classified by their
+# IGST, which is only ever charged on inter-state supplies
+SUPPLY_TYPE_SQL = "COALESCE(i.supply_type, CASE WHEN i.igst_amount > 0 THEN 'INTER' ELSE 'INTRA' END)"
+
+# Invoices saved before line items were stored have only their header
+# totals; they are rolled up under this rate, which no line ever has
+NO_ITEMS_RATE = -1
+
+REBUILD_SQL = f"""
+    INSERT INTO tax_rollup_daily (
+        invoice_date, gst_rate, place_of_supply, supply_type,
+        invoice_count, taxable_paise, cgst_paise, sgst_paise, igst_paise, total_paise
+    )
+    SELECT
+        i.invoice_date,
+        ii.gst_rate,
+        COALESCE(i.place_of_supply, ''),
+        {SUPPLY_TYPE_SQL} AS supply_type,
+        COUNT(DISTINCT i.id),
+        SUM(CAST(ROUND(ii.quantity * ii.price * 100) AS INTEGER)),
+        SUM(CASE WHEN {SUPPLY_TYPE_SQL} = 'INTER' THEN 0 ELSE CAST(ROUND(ii.gst_amount * 100) AS INTEGER) / 2 END),
+        SUM(CASE WHEN {SUPPLY_TYPE_SQL} = 'INTER' THEN 0 ELSE CAST(ROUND(ii.gst_amount * 100) AS INTEGER) / 2 END),
+        SUM(CASE WHEN {SUPPLY_TYPE_SQL} = 'INTER' THEN CAST(ROUND(ii.gst_amount * 100) AS INTEGER) ELSE 0 END),
+        SUM(CAST(ROUND(ii.total_amount * 100) AS INTEGER))
+    FROM invoices i
+    JOIN invoice_items ii ON i.id = ii.invoice_id
+    WHERE i.invoice_date BETWEEN ? AND ?
+      AND COALESCE(i.status, '') != 'CANCELLED'
+    GROUP BY 1, 2, 3, 4
+"""
+
+REBUILD_NO_ITEMS_SQL = f"""
+    INSERT INTO tax_rollup_daily (
+        invoice_date, gst_rate, place_of_supply, supply_type,
+        invoice_count, taxable_paise, cgst_paise, sgst_paise, igst_paise, total_paise
+    )
+    SELECT
+        i.invoice_date,
+        {NO_ITEMS_RATE},
+        COALESCE(i.place_of_supply, ''),
+        {SUPPLY_TYPE_SQL} AS supply_type,
+        COUNT(*),
+        SUM(CAST(ROUND((i.total_amount - i.cgst_amount - i.sgst_amount - i.igst_amount) * 100) AS INTEGER)),
+        SUM(CAST(ROUND(i.cgst_amount * 100) AS INTEGER)),
+        SUM(CAST(ROUND(i.sgst_amount * 100) AS INTEGER)),
+        SUM(CAST(ROUND(i.igst_amount * 100) AS INTEGER)),
+        SUM(CAST(ROUND(i.total_amount * 100) AS INTEGER))
+    FROM invoices i
+    WHERE i.invoice_date BETWEEN ? AND ?
+      AND COALESCE(i.status, '') != 'CANCELLED'
+      AND NOT EXISTS (SELECT 1 FROM invoice_items ii WHERE ii.invoice_id = i.id)
+    GROUP BY 1, 2, 3, 4
+"""
+
+# GSTR-3B and period summaries read the rollup: one row per day, rate and
+# place of supply instead of one per invoice
+SUMMARY_QUERY = """
+    SELECT
+        SUM(total_paise),
+        SUM(cgst_paise),
+        SUM(sgst_paise),
+        SUM(igst_paise)
+    FROM tax_rollup_daily
+    WHERE invoice_date BETWEEN ? AND ?
+"""
+
+
+def contributions(invoices, sign=1):
+    """Rollup rows for a batch of invoice dicts (see invoice_store), merged by key"""
+    # Imported here so the dashboard's summary does not load numpy at startup
+    import tax_engine
+
+    rows = defaultdict(lambda: [0, 0, 0, 0, 0, 0])
+    for invoice in invoices:
+        supply_type = invoice['supply_type']
+        place_of_supply = invoice.get('place_of_supply') or ''
+        if not invoice['items'] and 'totals' in invoice:
+            totals = invoice['totals']
+            row = rows[invoice['invoice_date'], NO_ITEMS_RATE, place_of_supply, supply_type]
+            amounts = [round(totals[name] * tax_engine.PAISE) for name in ('cgst', 'sgst', 'igst', 'total')]
+            row[0] += sign
+            row[1] += sign * (amounts[3] - sum(amounts[:3]))
+            for index, amount in enumerate(amounts, 2):
+                row[index] += sign * amount
+            continue
+        seen = set()
+        for _, quantity, price, gst_rate, gst_amount, total in invoice['items']:
+            key = (invoice['invoice_date'], gst_rate, place_of_supply, supply_type)
+            tax = round(gst_amount * tax_engine.PAISE)
+            taxable = round(quantity * price * tax_engine.PAISE)
+            line_total = round(total * tax_engine.PAISE)
+            row = rows[key]
+            if key not in seen:
+                seen.add(key)
+                row[0] += sign
+            row[1] += sign * taxable
+            if supply_type == 'INTER':
+                row[4] += sign * tax
+            else:
+                # Intra-state tax is always an even number of paise
+                row[2] += sign * (tax // 2)
+                row[3] += sign * (tax // 2)
+            row[5] += sign * line_total
+    return [key + tuple(values) for key, values in rows.items()]
+
+
+def apply(cursor, invoices, sign=1):
+    """Add (or with sign=-1, remove) invoices in the caller's transaction"""
+    rows = contributions(invoices, sign)
+    cursor.executemany(UPSERT_SQL, rows)
+    if sign < 0:
+        cursor.executemany("""
+            DELETE FROM tax_rollup_daily
+            WHERE invoice_date = ? AND gst_rate = ? AND place_of_supply = ? AND supply_type = ?
+              AND invoice_count <= 0
+        """, [row[:4] for row in rows])
+
+
+def rebuild(cursor, from_date='0000-01-01', to_date='9999-12-31'):
+    """Recompute the rollup for a date range from the invoices themselves
+
+    Invoices without line items are counted from their header totals.
+    """
+    cursor.execute("DELETE FROM tax_rollup_daily WHERE invoice_date BETWEEN ? AND ?", (from_date, to_date))
+    cursor.execute(REBUILD_SQL, (from_date, to_date))
+    rows = cursor.rowcount
+    cursor.execute(REBUILD_NO_ITEMS_SQL, (from_date, to_date))
+    return rows + cursor.rowcount
+
+
+def summary(conn, from_date, to_date):
+    """Total value and CGST/SGST/IGST for a period, in paise"""
+    row = conn.execute(SUMMARY_QUERY, (str(from_date), str(to_date))).fetchone()
+    return [value or 0 for value in row]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the daily tax rollup from invoices")
+    parser.add_argument("--db", default=os.path.join('data', 'gst_billing.db'), help="SQLite database path")
+    parser.add_argument("--from", dest="from_date", default='0000-01-01', help="First date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="to_date", default='9999-12-31', help="Last date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrations.migrate(conn)
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        rows = rebuild(cursor, args.from_date, args.to_date)
+        conn.commit()
+        print(f"Rebuilt {rows} rollup rows for {args.from_date} to {args.to_date}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
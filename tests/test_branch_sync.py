@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import branch_sync
+from core import CustomerService, InvoiceService, ProductService
+from db import Database
+
+
+class BranchSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.branches = {}
+        for name in ("HO", "A", "B"):
+            db = Database(os.path.join(self.tmp.name, f"{name}.db"), readers=1)
+            db.set_setting('branch_id', name).result()
+            db.set_setting('invoice_series', name).result()
+            self.branches[name] = db
+
+    def tearDown(self):
+        for db in self.branches.values():
+            db.close()
+        self.tmp.cleanup()
+
+    def sync(self, source, target):
+        path = os.path.join(self.tmp.name, f"{source}-{target}.jsonl.gz")
+        branch_sync.export_changes(self.branches[source], path, since=0)
+        return branch_sync.import_changes(self.branches[target], path)
+
+    def bill(self, branch, customer_name, product_name):
+        db = self.branches[branch]
+        customer = CustomerService(db).find(customer_name)
+        product = ProductService(db).find(product_name)
+        invoices = InvoiceService(db, "29")
+        return invoices.create(customer, [invoices.line(product, 2)], "2024-04-01", render_pdf=False)
+
+    def invoice_customers(self, branch):
+        with self.branches[branch].reader() as conn:
+            return conn.execute("""
+                SELECT i.invoice_number, c.name, p.name
+                FROM invoices i
+                JOIN customers c ON c.id = i.customer_id
+                JOIN invoice_items ii ON ii.invoice_id = i.id
+                JOIN products p ON p.id = ii.product_id
+                ORDER BY i.invoice_number
+            """).fetchall()
+
+    def test_invoice_for_head_office_master_data_comes_back_to_head_office(self):
+        ho = self.branches["HO"]
+        CustomerService(ho).add("Acme", "29AABCA1234K1Z5")
+        ProductService(ho).import_rows([{'name': "Laptop", 'gst_rate': 18, 'price': 50000, 'stock_quantity': 5}])
+        self.sync("HO", "A")
+        invoice = self.bill("A", "Acme", "Laptop")
+
+        self.sync("A", "HO")
+        self.assertEqual(self.invoice_customers("HO"), [(invoice['invoice_number'], "Acme", "Laptop")])
+        with ho.reader() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0], 1)
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM products").fetchone()[0], 1)
+
+    def test_invoice_for_master_data_of_a_third_branch(self):
+        CustomerService(self.branches["HO"]).add("Acme", "29AABCA1234K1Z5")
+        ProductService(self.branches["HO"]).import_rows([{'name': "Laptop", 'gst_rate': 18, 'price': 50000}])
+        self.sync("HO", "A")
+        invoice = self.bill("A", "Acme", "Laptop")
+
+        with self.assertRaisesRegex(ValueError, "of branch HO, which has not been imported"):
+            self.sync("A", "B")
+        self.sync("HO", "B")
+        self.sync("A", "B")
+        self.assertEqual(self.invoice_customers("B"), [(invoice['invoice_number'], "Acme", "Laptop")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+from paged_list import KeysetPager
+
+CUSTOMERS = [
+    ("Acme", "", "+91 98450 00001", ""),
+    ("Bharat Stores", "#29AABCB1234K1Z7", "", "#accounts@bharat.example"),
+    ("Chennai Traders", "33AABCC1234K1Z5", "044 2345 6789", "+orders@chennai.example"),
+    ("Delhi Mart", None, None, None),
+]
+
+
+class KeysetPagerTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        migrations.migrate(self.conn)
+        self.conn.executemany("INSERT INTO customers (name, gstin, phone, email) VALUES (?, ?, ?, ?)", CUSTOMERS)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def page_through(self, column, descending, page_size):
+        pager = KeysetPager("customers", ["name", "gstin", "phone", "email"], column, descending,
+                            page_size=page_size, not_null=("name",))
+        rows = []
+        while not pager.exhausted:
+            rows.extend(pager.fetch(self.conn))
+        return rows
+
+    def test_text_columns_keep_empty_and_symbol_values(self):
+        for column in ("email", "gstin", "phone", "name"):
+            for descending in (False, True):
+                for page_size in (1, 2, 200):
+                    with self.subTest(column=column, descending=descending, page_size=page_size):
+                        rows = self.page_through(column, descending, page_size)
+                        index = ["name", "gstin", "phone", "email"].index(column) + 1
+                        expected = self.conn.execute(
+                            f"SELECT id, name, gstin, phone, email FROM customers "
+                            f"ORDER BY {column} {'DESC' if descending else 'ASC'}, id "
+                            f"{'DESC' if descending else 'ASC'}").fetchall()
+                        self.assertEqual(len(rows), len(CUSTOMERS))
+                        self.assertEqual([row[index] for row in rows], [row[index] for row in expected])
+                        self.assertEqual(sorted(row[0] for row in rows), [1, 2, 3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()